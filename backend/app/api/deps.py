@@ -18,6 +18,11 @@ reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
 )
 
+# Same scheme for endpoints that also serve anonymous callers
+optional_oauth2 = OAuth2PasswordBearer(
+    tokenUrl=f"{settings.API_V1_STR}/login/access-token", auto_error=False
+)
+
 # Dependency to get the database session
 def get_db() -> Generator[Session, None, None]:
     with Session(engine) as session:
@@ -26,6 +31,7 @@ def get_db() -> Generator[Session, None, None]:
 # Annotated types for easy dependency injection
 SessionDep = Annotated[Session, Depends(get_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
+OptionalTokenDep = Annotated[str | None, Depends(optional_oauth2)]
 
 # Get the current user based on the JWT token
 def get_current_user(session: SessionDep, token: TokenDep) -> User:
@@ -40,21 +46,30 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    
+
     # Fetch user from the database using the decoded user ID (sub)
     user = session.get(User, token_data.sub)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
+
     # Ensure the user is active
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    
+
     return user
 
 # Annotated type for the current user, which is a dependency
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
+# Get the current user when a token is sent, or None for anonymous callers
+def get_optional_user(session: SessionDep, token: OptionalTokenDep) -> User | None:
+    if token is None:
+        return None
+    return get_current_user(session, token)
+
+# Annotated type for an optional current user
+OptionalUser = Annotated[User | None, Depends(get_optional_user)]
+
 # Function to get the current active user (this is new)
 def get_current_active_user(session: SessionDep, token: TokenDep) -> User:
     user = get_current_user(session, token)  # Reuse `get_current_user` logic
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.routes import items, login, private, users, utils, auth_amazon
+from app.api.routes import auth_amazon, items, login, ppc, private, users, utils
 from app.core.config import settings
 
 api_router = APIRouter()
@@ -9,6 +9,7 @@ api_router.include_router(users.router)
 api_router.include_router(utils.router)
 api_router.include_router(items.router)
 api_router.include_router(auth_amazon.router, prefix="/auth/amazon", tags=["Amazon Auth"])
+api_router.include_router(ppc.router, prefix="/ppc", tags=["ppc"])
 
 
 if settings.ENVIRONMENT == "local":
@@ -8,6 +8,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from app import crud
 from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
 from app.core import security
+from app.core.capacity import auth_pool, runs_in
 from app.core.config import settings
 from app.core.security import get_password_hash
 from app.models import Message, NewPassword, Token, UserPublic
@@ -22,6 +23,7 @@ router = APIRouter(tags=["login"])
 
 
 @router.post("/login/access-token")
+@runs_in(auth_pool)
 def login_access_token(
     session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
 ) -> Token:
@@ -76,6 +78,7 @@ def recover_password(email: str, session: SessionDep) -> Message:
 
 
 @router.post("/reset-password/")
+@runs_in(auth_pool)
 def reset_password(session: SessionDep, body: NewPassword) -> Message:
     """
     Reset password
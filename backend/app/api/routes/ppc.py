@@ -1,23 +1,90 @@
-import pandas as pd
-from typing import Dict, List, Optional, Any
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
-from sqlalchemy.orm import Session
-from app.api import deps
-from fastapi.responses import JSONResponse, FileResponse
+import asyncio
+import base64
+import functools
+import hashlib
 import io
+import itertools
 import json
+import logging  # Added logging
 import os
+import re
+import shutil
+import tempfile
+import time
 import uuid
-import time # For potential cleanup task
-import logging # Added logging
-from starlette.concurrency import run_in_threadpool
-from datetime import datetime # Added for timestamp
+import zipfile
+import zlib
+from collections import Counter
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone  # Added for timestamp
+from statistics import NormalDist
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from sqlmodel import Session
 
+from app import crud
+from app.api import deps
+from app.api.deps import CurrentUser, OptionalUser, SessionDep
+from app.core import jobs
+from app.core.artifacts import artifact_store
+from app.core.cancellation import Cancelled, FlagFileToken
+from app.core.capacity import db_pool, file_io_pool
+from app.core.compute import ComputePoolSaturated, compute_pool
 from app.core.config import settings
-from app.core.security import get_current_active_user # Assuming you have this for auth eventually
-from app.models.user import User # Assuming you have this
+from app.core.db import engine
+from app.core.downloads import download_response, file_sha256
+from app.core.janitor import janitor
+from app.core.preview import (
+    InvalidPreviewQuery,
+    parse_filter,
+    preview_tables,
+    query_preview,
+    write_preview_tables,
+)
+from app.core.progress import FINISHED_STATUSES, ProgressReporter, progress_bus
+from app.core.security import create_download_signature, verify_download_signature
+from app.core.storage import InsufficientStorage, storage_manager
+from app.core.streaming_form import StreamedUpload, StreamingUploadRoute
+from app.core.uploads import (
+    EmptyUpload,
+    IngestedUpload,
+    UnsupportedFileType,
+    UploadTooLarge,
+    adopt_upload,
+    estimate_rows,
+    ingest_upload,
+    sniff_file_type,
+)
+from app.models import (
+    PPCBatch,
+    PPCBatchJobPublic,
+    PPCBatchPublic,
+    PPCJob,
+    PPCJobPublic,
+    PPCPreviewPage,
+    PPCResult,
+    PPCResultPublic,
+    PPCResultsPage,
+    User,
+)
 
-router = APIRouter()
+# Uploads are written to TEMP_DIR while they arrive, and rejected once over PPC_MAX_UPLOAD_BYTES
+router = APIRouter(route_class=StreamingUploadRoute)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO) # Added basic logging config
@@ -40,54 +107,88 @@ RGB_COLORS = {
     'error_red': 'FF0000' # Red for errors
 }
 
-# --- Helper for cleanup (Optional - Can be improved) ---
-def remove_file_after_delay(file_path: str, delay: int = 3600): # Remove after 1 hour
-    time.sleep(delay)
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Cleaned up temporary file: {file_path}")
-    except Exception as e:
-        print(f"Error cleaning up file {file_path}: {e}")
+# --- Amazon Bulk Sheet Layout ---
+# Column order of the Sponsored Products bulk upload template
+BULK_COLUMNS = [
+    "Product", "Entity", "Operation", "Campaign ID", "Ad Group ID",
+    "Portfolio ID", "Ad ID", "Keyword ID", "Product Targeting ID",
+    "Campaign Name", "Ad Group Name", "Start Date", "End Date",
+    "Targeting Type", "State", "Daily Budget", "SKU",
+    "Ad Group Default Bid", "Bid", "Keyword Text",
+    "Native Language Keyword", "Native Language Locale",
+    "Match Type", "Bidding Strategy", "Placement",
+    "Percentage", "Product Targeting Expression"
+]
+BULK_REVIEW_COLUMNS = ["Review Needed"] + BULK_COLUMNS
+
+# Column letters of the "SP Search Term Report" sheet used by the miners
+SEARCH_TERM_COLUMNS = {
+    'campaign_id': 'B',
+    'ad_group_id': 'C',
+    'ad_group_name': 'F',
+    'keyword_text': 'L',
+    'search_term': 'P',
+    'clicks': 'R',
+    'spend': 'T',
+    'sales': 'U',
+    'orders': 'V',
+    'acos': 'Y',
+    'bid': 'Z',
+}
 
-def schedule_file_cleanup(background_tasks: BackgroundTasks, file_path: str, delay: int):
-    """Adds a background task to delete a file after a delay."""
-    def cleanup():
-        try:
-            time.sleep(delay)
-            os.remove(file_path)
-            logger.info(f"Cleaned up temporary file: {file_path}")
-        except FileNotFoundError:
-            logger.warning(f"Cleanup attempted, but file not found (already deleted?): {file_path}")
-        except Exception as e:
-            logger.error(f"Error during file cleanup for {file_path}: {e}")
-            
-    background_tasks.add_task(cleanup)
+# Campaign types accepted in catalog uploads, and the auto targeting groups
+CAMPAIGN_TYPES = ['auto', 'exact', 'phrase', 'broad']
+AUTO_TARGETING_TYPES = ["close-match", "loose-match", "substitutes", "complements"]
+
+# Catalog column names (normalized to snake_case) accepted as aliases
+CATALOG_COLUMN_ALIASES = {
+    'product_identifier': 'identifier',
+    'productidentifier': 'identifier',
+    'asin': 'identifier',
+    'bid': 'starting_bid',
+    'startingbid': 'starting_bid',
+    'campaign_type': 'campaign_types',
+    'types': 'campaign_types',
+    'keyword': 'keywords',
+}
+CATALOG_CHUNK_SIZE = 2000  # Catalog rows expanded per batch
+
+# MinHash settings for keyword clustering
+MINHASH_PERMUTATIONS = 64
+MINHASH_PRIME = (1 << 31) - 1  # Mersenne prime for universal hashing
+
+# Metrics the n-gram analysis can rank by
+NGRAM_METRICS = ['spend', 'sales', 'orders', 'clicks', 'acos', 'search_terms']
+
+# Bulk "Match Type" values for negative keywords
+NEGATIVE_MATCH_TYPES = {
+    'exact': 'negativeExact',
+    'phrase': 'negativePhrase',
+}
 
 @router.post("/optimize-bids")
 async def optimize_bids(
     file: UploadFile = File(...),
     target_acos: float = Form(30.0),
     increase_spend: bool = Form(False),
-    asin_data: Optional[str] = Form("{}"),
+    asin_data: str | None = Form("{}"),
     db: Session = Depends(deps.get_db)
 ):
     """
     Process uploaded PPC data and optimize bids
     """
+    upload = await save_upload(file, in_memory=True)
     try:
-        # Read the uploaded Excel file
-        contents = await file.read()
-        
-        # Convert the bytes content to a pandas DataFrame
-        df = pd.read_excel(io.BytesIO(contents)) if file.filename.endswith((".xlsx", ".xls")) else pd.read_csv(io.BytesIO(contents))
-        
+        # Convert the uploaded file to a pandas DataFrame
+        source = upload.path or io.BytesIO(upload.content or b"")
+        df = pd.read_excel(source) if upload.file_type in ("xlsx", "xls") else pd.read_csv(source)
+
         # Parse the ASIN data JSON string to dictionary
         asin_dict = json.loads(asin_data)
-        
+
         # Process the data with pandas
         result_df = df.copy()
-        
+
         # Return sample results
         results = {
             "data": result_df.to_dict(orient="records"),
@@ -98,155 +199,282 @@ async def optimize_bids(
                 "avg_change": 0
             }
         }
-        
+
         return JSONResponse(content=results)
-        
+
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to process file: {str(e)}")
+    finally:
+        await file_io_pool.run(discard_upload, upload)
 
-# --- New Upload Endpoint ---
-@router.post("/upload", summary="Upload PPC Data File")
-async def upload_ppc_data(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
-):
-    """
-    Receives an Excel file, processes it (placeholder logic),
-    saves the result temporarily, and returns a download ID.
-    """
-    logger.info("--- Entered /upload endpoint ---") # Added entry log
-    download_id = str(uuid.uuid4())
-    input_path = os.path.join(TEMP_DIR, f"input_{download_id}_{file.filename}")
-    output_path = os.path.join(TEMP_DIR, f"processed_{download_id}.xlsx")
-    logger.info(f"Generated paths: input={input_path}, output={output_path}") # Added path log
-
-    try:
-        logger.info("Attempting to save uploaded file...") # Log before save
-        # Save the uploaded file temporarily
-        with open(input_path, "wb") as buffer:
-            file_content = await file.read() # Read into variable first
-            logger.info(f"Read {len(file_content)} bytes from uploaded file.") # Log bytes read
-            buffer.write(file_content)
-        logger.info(f"Uploaded file saved successfully to: {input_path}")
-
-        logger.info("Attempting to process file...") # Log before process
-        # Process the file (using placeholder function)
-        process_excel_file(input_path, output_path)
-        logger.info("File processed successfully.") # Log after process
-
-        # Schedule cleanup for both input and output files
-        logger.info(f"Scheduling cleanup for {input_path} and {output_path} in 1 hour.")
-        schedule_file_cleanup(background_tasks, input_path, delay=3600) # Use the defined function
-        schedule_file_cleanup(background_tasks, output_path, delay=3600) # Use the defined function
-
-        return {"message": "File processed successfully", "download_id": download_id}
-
-    except Exception as e:
-        logger.error(f"Error processing file {file.filename}: {e}", exc_info=True) # Log the full exception
-        # Clean up temporary files if error occurs during processing
-        if os.path.exists(input_path):
-            os.remove(input_path)
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        raise HTTPException(status_code=500, detail=f"Error processing file: {e}")
-    # Removed the finally block as cleanup is handled in try/except
+DOWNLOAD_MEDIA_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'zip': 'application/zip',
+}
 
 # --- New Download Endpoint ---
 @router.get("/download/{download_id}", summary="Download Processed File")
-async def download_processed_file(download_id: str):
+async def download_processed_file(
+    request: Request,
+    session: SessionDep,
+    current_user: OptionalUser,
+    download_id: str,
+    expires: int | None = None,
+    signature: str | None = None,
+):
     """
     Downloads the processed file identified by download_id.
+
+    The ETag is the SHA-256 of the file, so clients can revalidate with
+    If-None-Match and resume interrupted downloads with Range / If-Range.
+    A valid signature (see `download_url`) authorizes the download by
+    itself. Otherwise, a signed-in user's file is only sent to that user,
+    and with PPC_SIGNED_DOWNLOADS nothing is sent at all. With
+    PPC_DOWNLOAD_ACCEL_PREFIX the bytes are sent by nginx.
     """
-    file_path = os.path.join(TEMP_DIR, download_id)
+    # Download IDs are job IDs; parsing them also rules out directory traversal
+    try:
+        job_id = uuid.UUID(download_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid download ID.")
 
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found or has expired.")
+    if expires is not None or signature is not None or settings.PPC_SIGNED_DOWNLOADS:
+        if expires is None or signature is None or not verify_download_signature(download_id, expires, signature):
+            raise HTTPException(status_code=403, detail="Download link is invalid or has expired.")
+    else:
+        job = session.get(PPCJob, job_id)
+        if job:
+            check_job_access(job, current_user)
 
-    # Ensure the download_id is somewhat safe (prevent directory traversal)
-    if ".." in download_id or "/" in download_id:
-         raise HTTPException(status_code=400, detail="Invalid download ID.")
+    blob = artifact_store.resolve(session, str(job_id))
+    if not blob:
+        raise HTTPException(status_code=404, detail="File not found or has expired.")
+    name = artifact_store.blob_name(blob.sha256, blob.file_type)
+    file_path = artifact_store.backend.local_path(name)
+    if file_path is not None and not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found or has expired.")
 
-    return FileResponse(
-        path=file_path, 
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        filename=f"processed_{download_id.split('_')[0]}.xlsx" # Give a slightly nicer name
+    # nginx can only send files it shares with us, so remote blobs are streamed
+    accel_prefix = settings.PPC_DOWNLOAD_ACCEL_PREFIX
+    accel_redirect = None
+    if accel_prefix and file_path is not None:
+        accel_redirect = f"{accel_prefix.rstrip('/')}/{os.path.relpath(file_path, TEMP_DIR)}"
+    return download_response(
+        request,
+        sha256=blob.sha256,
+        size=blob.size,
+        iter_range=functools.partial(artifact_store.backend.iter_range, name),
+        media_type=DOWNLOAD_MEDIA_TYPES.get(blob.file_type, 'application/octet-stream'),
+        filename=f"processed_{download_id.split('_')[0]}.{blob.file_type}", # Give a slightly nicer name
+        accel_redirect=accel_redirect,
     )
 
-# Placeholder for the actual implementation of optimize_bids if needed separately
-# async def actual_optimize_bids_logic(df: pd.DataFrame, target_acos: float, ...):
-#    pass
+def download_url(download_id: str, owned: bool = False) -> str:
+    """
+    Returns the download path for a file. It is signed and expiring when
+    PPC_SIGNED_DOWNLOADS is set, and for `owned` files, so browsers can
+    fetch them without a token. Only call it after checking the caller may
+    see the file.
+    """
+    url = f"{settings.API_V1_STR}/ppc/download/{download_id}"
+    if not (settings.PPC_SIGNED_DOWNLOADS or owned):
+        return url
+    # utcnow() is naive, and timestamp() would read it as local time
+    expires = int(datetime.now(timezone.utc).timestamp()) + settings.PPC_DOWNLOAD_URL_TTL
+    return f"{url}?expires={expires}&signature={create_download_signature(download_id, expires)}"
 
-# Placeholder for the actual Excel processing logic
-def process_excel_file(input_path: str, output_path: str):
-    """Reads an Excel file, performs processing (currently adds a dummy column), 
-    and saves the result to another Excel file."""
-    logger.info(f"Starting processing for file: {input_path}")
+# Modified process_excel_file function
+def fast_excel_engine() -> str | None:
+    """The calamine reader when the fast-xlsx extra is installed; it parses workbooks several times faster than openpyxl."""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return None
+    # pandas reads with calamine from 2.2 on
+    if tuple(int(part) for part in pd.__version__.split(".")[:2]) < (2, 2):
+        return None
+    return "calamine"
+
+def read_bid_workbook(input_path, engine: str | None = None) -> tuple[pd.DataFrame, dict[str, float]]:
+    """Reads Sheet 1 (PPC data) and the ASIN -> AOV lookup from Sheet 2 (optional)."""
+    asin_data = {} # Initialize ASIN Average Order Value data
+    # Read Sheet 1 (PPC Data)
     try:
-        # Read the Excel file using pandas
-        df = pd.read_excel(input_path)
-        logger.info(f"Successfully read {len(df)} rows from {input_path}")
+        workbook = pd.ExcelFile(input_path, engine=engine) # Parse the workbook once for both sheets
+        df = workbook.parse(0) # Read first sheet
+        logger.info(f"Successfully read {len(df)} rows from Sheet 1 of {input_path}")
+    except Exception as e:
+        logger.error(f"Failed to read Sheet 1 (PPC Data) from {input_path}: {e}", exc_info=True)
+        raise ValueError(f"Could not read PPC data from the first sheet: {e}")
 
-        # --- Your actual pandas processing logic goes here ---
-        # Example: Add a dummy 'Processed' column
-        df['Processed'] = 'Yes'
-        logger.info("Added 'Processed' column (Example processing)")
-        # ------------------------------------------------------
+    # Read Sheet 2 (ASIN AOV Data) - Optional
+    try:
+        asin_df = workbook.parse(1) # Read second sheet
+        logger.info(f"Successfully read {len(asin_df)} rows from Sheet 2 (ASIN Data) of {input_path}")
 
-        # Save the processed DataFrame to a new Excel file
-        df.to_excel(output_path, index=False)
-        logger.info(f"Processed file saved successfully to: {output_path}")
+        # Standardize column names (convert to lower case for matching)
+        asin_df.columns = [str(col).lower() for col in asin_df.columns]
 
-    except Exception as e:
-        logger.error(f"Error during pandas processing for {input_path}: {e}", exc_info=True)
-        # Re-raise the exception so the calling function knows about the failure
-        raise e
+        # Check for required columns ('asin', 'aov')
+        if 'asin' in asin_df.columns and 'aov' in asin_df.columns:
+            # Convert relevant columns, handling errors
+            asin_df['asin'] = asin_df['asin'].astype(str)
+            asin_df['aov'] = pd.to_numeric(asin_df['aov'], errors='coerce') # Convert AOV to numeric, errors become NaN
 
-# Modified process_excel_file function
-def process_excel_file(input_path: str, output_path: str, target_acos: float, increase_spend: bool):
-    """Reads Sheet 1 (PPC data) and Sheet 2 (ASIN AOV data) from an Excel file,
-    performs bid optimization on Sheet 1 data, and saves the result."""
-    logger.info(f"Starting processing for file: {input_path} with Target ACOS: {target_acos}%, Increase Spend: {increase_spend}")
-    asin_data = {} # Initialize ASIN Average Order Value data
+            # Drop rows where AOV conversion failed or ASIN is missing/empty
+            asin_df.dropna(subset=['asin', 'aov'], inplace=True)
+            asin_df = asin_df[asin_df['asin'].str.strip() != '']
 
-    try:
-        # --- Read Input File ---
-        # Read Sheet 1 (PPC Data)
-        try:
-            df = pd.read_excel(input_path, sheet_name=0) # Read first sheet
-            logger.info(f"Successfully read {len(df)} rows from Sheet 1 of {input_path}")
-        except Exception as e:
-            logger.error(f"Failed to read Sheet 1 (PPC Data) from {input_path}: {e}", exc_info=True)
-            raise ValueError(f"Could not read PPC data from the first sheet: {e}")
+            # Create the asin_data dictionary
+            asin_data = pd.Series(asin_df['aov'].values, index=asin_df['asin']).to_dict()
+            logger.info(f"Successfully created ASIN AOV dictionary with {len(asin_data)} entries.")
+        else:
+            logger.warning("Sheet 2 found, but missing required 'ASIN' or 'AOV' columns. Proceeding without ASIN AOV data.")
 
-        # Read Sheet 2 (ASIN AOV Data) - Optional
-        try:
-            asin_df = pd.read_excel(input_path, sheet_name=1) # Read second sheet
-            logger.info(f"Successfully read {len(asin_df)} rows from Sheet 2 (ASIN Data) of {input_path}")
+    except IndexError:
+        logger.warning(f"Sheet 2 (ASIN Data) not found in {input_path}. Proceeding without ASIN AOV data.")
+    except Exception as e:
+        logger.warning(f"Failed to read or process Sheet 2 (ASIN Data) from {input_path}: {e}. Proceeding without ASIN AOV data.", exc_info=True)
+    return df, asin_data
 
-            # Standardize column names (convert to lower case for matching)
-            asin_df.columns = [str(col).lower() for col in asin_df.columns]
+def map_bid_columns(result_df: pd.DataFrame) -> dict[str, str]:
+    """
+    Maps standardized names of the required columns (e.g. 'click_through_rate')
+    to the sheet's own column names, matched case-insensitively. Missing
+    columns are added to `result_df` with NA values.
+    """
+    required_cols = ['Impressions', 'Clicks', 'Spend', 'Sales', 'Orders', 'Bid', 'ACOS', 'Click-through Rate', 'CPC', 'ASIN (Informational only)']
+    # Normalize column names in the dataframe for case-insensitive matching
+    result_df.columns = [str(col) for col in result_df.columns] # Ensure string column names
+    df_cols_lower = {col.lower().strip(): col for col in result_df.columns}
+
+    # Map required lower-case names back to original casing if found, else mark as missing
+    col_mapping = {}
+    missing_cols = []
+    for req_col_lower in [c.lower() for c in required_cols]:
+        original_case_col = df_cols_lower.get(req_col_lower)
+        if original_case_col:
+             # Create mapping from standardized name (e.g., 'acos') to original ('ACOS')
+             col_mapping[req_col_lower.replace(' ','_').replace('-','_')] = original_case_col # e.g. click_through_rate
+        else:
+             # Try to find the original name from required_cols list for the warning message
+             original_req_col = next((c for c in required_cols if c.lower() == req_col_lower), req_col_lower)
+             missing_cols.append(original_req_col)
+             # Add the column with NA to prevent errors later if critical logic depends on it
+             result_df[original_req_col] = pd.NA
+             col_mapping[req_col_lower.replace(' ','_').replace('-','_')] = original_req_col # Map to the added NA column
 
-            # Check for required columns ('asin', 'aov')
-            if 'asin' in asin_df.columns and 'aov' in asin_df.columns:
-                # Convert relevant columns, handling errors
-                asin_df['asin'] = asin_df['asin'].astype(str)
-                asin_df['aov'] = pd.to_numeric(asin_df['aov'], errors='coerce') # Convert AOV to numeric, errors become NaN
 
-                # Drop rows where AOV conversion failed or ASIN is missing/empty
-                asin_df.dropna(subset=['asin', 'aov'], inplace=True)
-                asin_df = asin_df[asin_df['asin'].str.strip() != '']
+    if missing_cols:
+         logger.warning(f"Missing expected columns: {', '.join(missing_cols)}. Added them with NA values. Calculations may be affected.")
+    return col_mapping
 
-                # Create the asin_data dictionary
-                asin_data = pd.Series(asin_df['aov'].values, index=asin_df['asin']).to_dict()
-                logger.info(f"Successfully created ASIN AOV dictionary with {len(asin_data)} entries.")
-            else:
-                logger.warning("Sheet 2 found, but missing required 'ASIN' or 'AOV' columns. Proceeding without ASIN AOV data.")
+def parse_rate(raw) -> float:
+    """Reads an ACOS or CTR cell (31.5, 0.315 or "31.5%") as a fraction; blanks and junk read as 0."""
+    if pd.isna(raw): return 0.0
+    try:
+        if isinstance(raw, str) and '%' in raw: rate = float(raw.replace('%','')) / 100.0
+        else: rate = float(raw)
+        return rate / 100.0 if abs(rate) > 1 else rate # Convert if looks like percentage (e.g., 30)
+    except (ValueError, TypeError): return 0.0
+
+def read_bid_row(row, col_mapping: dict[str, str], asin_data: dict[str, float]) -> dict[str, Any] | None:
+    """Returns the metrics the bid rules use for one row, or None when it has no usable bid."""
+    # Define helper to safely get data using mapped column names
+    def safe_get(col_key, default=pd.NA):
+        mapped_col = col_mapping.get(col_key)
+        return row.get(mapped_col, default) if mapped_col else default
+
+    # --- Get Row Data Safely ---
+    current_bid = pd.to_numeric(safe_get('bid'), errors='coerce')
+    if pd.isna(current_bid): # Skip if Bid is missing or non-numeric
+        return None
+
+    metrics = {
+        'current_bid': current_bid,
+        'clicks': pd.to_numeric(safe_get('clicks', 0), errors='coerce') or 0,
+        'spend': pd.to_numeric(safe_get('spend', 0), errors='coerce') or 0,
+        'sales': pd.to_numeric(safe_get('sales', 0), errors='coerce') or 0,
+        'orders': pd.to_numeric(safe_get('orders', 0), errors='coerce') or 0,
+        'cpc': pd.to_numeric(safe_get('cpc', 0), errors='coerce') or 0,
+        'acos': parse_rate(safe_get('acos')), # Handles %, decimal, NaN, string
+        'ctr': parse_rate(safe_get('click_through_rate')),
+    }
+    asin = str(safe_get('asin_(informational_only)', '')) # Get ASIN as string
+
+    # --- Calculate AOV and % of AOV ---
+    current_aov = 0.0
+    if metrics['orders'] > 0 and metrics['sales'] > 0: # Use row data if available
+        current_aov = metrics['sales'] / metrics['orders']
+    elif asin and asin in asin_data: # Fallback to Sheet 2 data
+         current_aov = asin_data.get(asin, 0.0)
+    metrics['aov_percent'] = (metrics['spend'] / current_aov) if current_aov > 0 else 0.0
+    return metrics
+
+# Bid rules in the order they are checked, with the color of the rows they update
+BID_RULE_COLORS = {
+    'high_acos': RGB_COLORS['light_orange'],
+    'low_acos': RGB_COLORS['light_green'],
+    'low_acos_single_order': RGB_COLORS['lighter_green'],
+    'no_sales_high_spend': RGB_COLORS['darker_orange'],
+    'increase_spend': RGB_COLORS['light_blue'],
+}
 
-        except IndexError:
-            logger.warning(f"Sheet 2 (ASIN Data) not found in {input_path}. Proceeding without ASIN AOV data.")
-        except Exception as e:
-            logger.warning(f"Failed to read or process Sheet 2 (ASIN Data) from {input_path}: {e}. Proceeding without ASIN AOV data.", exc_info=True)
+def apply_bid_rules(metrics: dict[str, Any], target_acos_decimal: float, increase_spend: bool) -> tuple[str | None, float]:
+    """
+    Returns the first bid rule (a BID_RULE_COLORS key) that matches a row,
+    or None, and the new bid before the $0.02 floor and rounding.
+    """
+    current_bid, acos = metrics['current_bid'], metrics['acos']
+    clicks, spend, sales, orders = metrics['clicks'], metrics['spend'], metrics['sales'], metrics['orders']
+
+    # Condition 1: ACOS >= Target ACOS + 10%
+    if acos >= (target_acos_decimal * 1.1):
+        new_bid = current_bid
+        if clicks > 0 and sales > 0:
+            rpc_row = sales / clicks
+            effective_cpc = metrics['cpc'] if metrics['cpc'] > 0 else (spend / clicks if clicks > 0 else 0)
+            if effective_cpc > 0:
+                # Original formula provided: Bid = (RPC * Target ACOS) * (Current Bid / CPC)
+                new_bid = (rpc_row * target_acos_decimal) * (current_bid / effective_cpc)
+        return 'high_acos', new_bid
+
+    # Condition 2: ACOS <= Target ACOS - 10% AND Orders > 1
+    if acos <= (target_acos_decimal * 0.9) and orders > 1:
+        increase_factor = 1.15 if acos <= (target_acos_decimal * 0.5) else 1.1
+        return 'low_acos', current_bid * increase_factor
+
+    # Condition 3: ACOS <= Target ACOS - 10% AND Orders = 1
+    if acos <= (target_acos_decimal * 0.9) and orders == 1:
+        increase_factor = 1.06 if acos <= (target_acos_decimal * 0.5) else 1.05
+        return 'low_acos_single_order', current_bid * increase_factor
+
+    # Condition 4: ACOS = 0% AND % of AOV >= Target ACOS - 10%
+    if abs(acos) < 0.0001 and metrics['aov_percent'] >= (target_acos_decimal * 0.9):
+        return 'no_sales_high_spend', current_bid * 0.8 # Reduce bid by 20%
+
+    # Condition 5: ACOS = 0% AND % of AOV <= 10% AND CTR >= 0.3% (Increase spend option)
+    if increase_spend and abs(acos) < 0.0001 and metrics['aov_percent'] <= 0.1 and metrics['ctr'] >= 0.003:
+        return 'increase_spend', current_bid * 1.05
+
+    return None, current_bid
+
+def target_acos_fraction(target_acos: float) -> float:
+    # Convert target_acos from percentage (e.g., 30) to decimal (e.g., 0.30)
+    return target_acos / 100.0 if target_acos >= 1 else target_acos # Use 100.0 for float division
+
+def process_excel_file(input_path, output_path, target_acos: float, increase_spend: bool, progress: ProgressReporter | None = None):
+    """Reads Sheet 1 (PPC data) and Sheet 2 (ASIN AOV data) from an Excel file,
+    performs bid optimization on Sheet 1 data, and saves the result.
+    Input and output may be paths or binary file objects; `progress`
+    receives one row per optimized bid."""
+    logger.info(f"Starting processing for file: {input_path} with Target ACOS: {target_acos}%, Increase Spend: {increase_spend}")
+    progress = progress or ProgressReporter(None)
 
+    try:
+        # --- Read Input File ---
+        progress.stage("reading")
+        df, asin_data = read_bid_workbook(input_path)
 
         # Basic check for empty primary dataframe
         if df.empty:
@@ -257,9 +485,7 @@ def process_excel_file(input_path: str, output_path: str, target_acos: float, in
 
         # --- Bid Optimization Logic ---
         result_df = df.copy()
-
-        # Convert target_acos from percentage (e.g., 30) to decimal (e.g., 0.30)
-        target_acos_decimal = target_acos / 100.0 if target_acos >= 1 else target_acos # Use 100.0 for float division
+        target_acos_decimal = target_acos_fraction(target_acos)
 
         # --- Initialize Output Columns ---
         # Initialize new columns if they don't exist, preserving existing data if present
@@ -278,7 +504,7 @@ def process_excel_file(input_path: str, output_path: str, target_acos: float, in
              # Ensure numeric types before division
              spend_col = pd.to_numeric(result_df['Spend'], errors='coerce')
              orders_col = pd.to_numeric(result_df['Orders'], errors='coerce')
-             result_df['ACTC'] = (spend_col / orders_col.replace(0, pd.NA)).astype(float)
+             result_df['ACTC'] = (spend_col / orders_col.replace(0, np.nan)).astype(float)
         else:
              result_df['ACTC'] = pd.NA
              logger.warning("Missing 'Spend' or 'Orders' column for ACTC calculation.")
@@ -287,7 +513,7 @@ def process_excel_file(input_path: str, output_path: str, target_acos: float, in
              # Ensure numeric types before division
              sales_col = pd.to_numeric(result_df['Sales'], errors='coerce')
              clicks_col = pd.to_numeric(result_df['Clicks'], errors='coerce')
-             result_df['RPC'] = (sales_col / clicks_col.replace(0, pd.NA)).astype(float)
+             result_df['RPC'] = (sales_col / clicks_col.replace(0, np.nan)).astype(float)
         else:
             result_df['RPC'] = pd.NA
             logger.warning("Missing 'Sales' or 'Clicks' column for RPC calculation.")
@@ -300,126 +526,25 @@ def process_excel_file(input_path: str, output_path: str, target_acos: float, in
         errors_in_rows = 0
 
         # --- Ensure Required Input Columns Exist ---
-        required_cols = ['Impressions', 'Clicks', 'Spend', 'Sales', 'Orders', 'Bid', 'ACOS', 'Click-through Rate', 'CPC', 'ASIN (Informational only)']
-        # Normalize column names in the dataframe for case-insensitive matching
-        result_df.columns = [str(col) for col in result_df.columns] # Ensure string column names
-        df_cols_lower = {col.lower().strip(): col for col in result_df.columns}
-
-        # Map required lower-case names back to original casing if found, else mark as missing
-        col_mapping = {}
-        missing_cols = []
-        for req_col_lower in [c.lower() for c in required_cols]:
-            original_case_col = df_cols_lower.get(req_col_lower)
-            if original_case_col:
-                 # Create mapping from standardized name (e.g., 'acos') to original ('ACOS')
-                 col_mapping[req_col_lower.replace(' ','_').replace('-','_')] = original_case_col # e.g. click_through_rate
-            else:
-                 # Try to find the original name from required_cols list for the warning message
-                 original_req_col = next((c for c in required_cols if c.lower() == req_col_lower), req_col_lower)
-                 missing_cols.append(original_req_col)
-                 # Add the column with NA to prevent errors later if critical logic depends on it
-                 result_df[original_req_col] = pd.NA
-                 col_mapping[req_col_lower.replace(' ','_').replace('-','_')] = original_req_col # Map to the added NA column
-
-
-        if missing_cols:
-             logger.warning(f"Missing expected columns: {', '.join(missing_cols)}. Added them with NA values. Calculations may be affected.")
-
-        # Define helper to safely get data using mapped column names
-        def safe_get(row, col_key, default=pd.NA):
-            mapped_col = col_mapping.get(col_key)
-            return row.get(mapped_col, default) if mapped_col else default
-
+        col_mapping = map_bid_columns(result_df)
 
         # --- Row-by-Row Processing ---
+        progress.stage("optimizing bids", total=len(result_df))
         for idx, row in result_df.iterrows():
+            progress.advance()
             try:
-                # --- Get Row Data Safely ---
-                current_bid = pd.to_numeric(safe_get(row, 'bid'), errors='coerce')
-                if pd.isna(current_bid): # Skip if Bid is missing or non-numeric
+                metrics = read_bid_row(row, col_mapping, asin_data)
+                if metrics is None: # Skip if Bid is missing or non-numeric
                     continue
-
-                impressions = pd.to_numeric(safe_get(row, 'impressions', 0), errors='coerce') or 0
-                clicks = pd.to_numeric(safe_get(row, 'clicks', 0), errors='coerce') or 0
-                spend = pd.to_numeric(safe_get(row, 'spend', 0), errors='coerce') or 0
-                sales = pd.to_numeric(safe_get(row, 'sales', 0), errors='coerce') or 0
-                orders = pd.to_numeric(safe_get(row, 'orders', 0), errors='coerce') or 0
-                cpc = pd.to_numeric(safe_get(row, 'cpc', 0), errors='coerce') or 0
-                asin = str(safe_get(row, 'asin_(informational_only)', '')) # Get ASIN as string
-
-                # ACOS: Handle %, decimal, NaN, string
-                acos_raw = safe_get(row, 'acos')
-                if pd.isna(acos_raw): acos = 0.0
-                else:
-                    try:
-                        if isinstance(acos_raw, str) and '%' in acos_raw: acos_num = float(acos_raw.replace('%','')) / 100.0
-                        else: acos_num = float(acos_raw)
-                        acos = acos_num / 100.0 if abs(acos_num) > 1 else acos_num # Convert if looks like percentage (e.g., 30)
-                    except (ValueError, TypeError): acos = 0.0
-
-                 # CTR: Handle %, decimal, NaN, string
-                ctr_raw = safe_get(row, 'click_through_rate')
-                if pd.isna(ctr_raw): ctr = 0.0
-                else:
-                     try:
-                        if isinstance(ctr_raw, str) and '%' in ctr_raw: ctr_num = float(ctr_raw.replace('%','')) / 100.0
-                        else: ctr_num = float(ctr_raw)
-                        ctr = ctr_num / 100.0 if abs(ctr_num) > 1 else ctr_num # Convert if looks like percentage (e.g., 0.3)
-                     except (ValueError, TypeError): ctr = 0.0
-
-                # --- Calculate AOV and % of AOV ---
-                current_aov = 0.0
-                if orders > 0 and sales > 0: # Use row data if available
-                    current_aov = sales / orders
-                elif asin and asin in asin_data: # Fallback to Sheet 2 data
-                     current_aov = asin_data.get(asin, 0.0)
-
-                aov_percent = (spend / current_aov) if current_aov > 0 else 0.0
+                current_bid = metrics['current_bid']
                 # Use .loc for setting value to avoid potential warnings
-                result_df.loc[idx, col_mapping.get('%_of_aov', '% of AOV')] = aov_percent
+                result_df.loc[idx, col_mapping.get('%_of_aov', '% of AOV')] = metrics['aov_percent']
 
 
                 # --- Apply Bid Optimization Conditions ---
-                new_bid = current_bid # Initialize with current bid
-                color_hex = None
-                update_required = False
-
-                # Condition 1: ACOS >= Target ACOS + 10%
-                if acos >= (target_acos_decimal * 1.1):
-                    color_hex = RGB_COLORS['light_orange']
-                    if clicks > 0 and sales > 0:
-                        rpc_row = sales / clicks
-                        effective_cpc = cpc if cpc > 0 else (spend / clicks if clicks > 0 else 0)
-                        if effective_cpc > 0:
-                            # Original formula provided: Bid = (RPC * Target ACOS) * (Current Bid / CPC)
-                            new_bid = (rpc_row * target_acos_decimal) * (current_bid / effective_cpc)
-                    update_required = True
-
-                # Condition 2: ACOS <= Target ACOS - 10% AND Orders > 1
-                elif acos <= (target_acos_decimal * 0.9) and orders > 1:
-                    color_hex = RGB_COLORS['light_green']
-                    increase_factor = 1.15 if acos <= (target_acos_decimal * 0.5) else 1.1
-                    new_bid = current_bid * increase_factor
-                    update_required = True
-
-                # Condition 3: ACOS <= Target ACOS - 10% AND Orders = 1
-                elif acos <= (target_acos_decimal * 0.9) and orders == 1:
-                    color_hex = RGB_COLORS['lighter_green']
-                    increase_factor = 1.06 if acos <= (target_acos_decimal * 0.5) else 1.05
-                    new_bid = current_bid * increase_factor
-                    update_required = True
-
-                # Condition 4: ACOS = 0% AND % of AOV >= Target ACOS - 10%
-                elif abs(acos) < 0.0001 and aov_percent >= (target_acos_decimal * 0.9):
-                    color_hex = RGB_COLORS['darker_orange']
-                    new_bid = current_bid * 0.8 # Reduce bid by 20%
-                    update_required = True
-
-                # Condition 5: ACOS = 0% AND % of AOV <= 10% AND CTR >= 0.3% (Increase spend option)
-                elif increase_spend and abs(acos) < 0.0001 and aov_percent <= 0.1 and ctr >= 0.003:
-                    color_hex = RGB_COLORS['light_blue']
-                    new_bid = current_bid * 1.05
-                    update_required = True
+                rule, new_bid = apply_bid_rules(metrics, target_acos_decimal, increase_spend)
+                color_hex = BID_RULE_COLORS.get(rule) if rule is not None else None
+                update_required = rule is not None
 
 
                 # --- Update DataFrame Row ---
@@ -461,6 +586,7 @@ def process_excel_file(input_path: str, output_path: str, target_acos: float, in
         logger.info(f"Finished row-by-row processing. Processed: {processed_rows}, Errors: {errors_in_rows}")
 
         # --- Save Output ---
+        progress.stage("writing")
         result_df.to_excel(output_path, index=False, engine='openpyxl')
         logger.info(f"Processed file with optimizations saved successfully to: {output_path}")
 
@@ -479,25 +605,755 @@ def process_excel_file(input_path: str, output_path: str, target_acos: float, in
         logger.error(f"General error during pandas processing or file I/O for {input_path}: {e}", exc_info=True)
         raise e # Re-raise other exceptions
 
+# Campaign columns the estimate sample is spread over, in order of preference
+CAMPAIGN_COLUMNS = ['campaign name', 'campaign', 'campaign id']
+
+def acos_bands(acos: pd.Series, target_acos_decimal: float) -> pd.Series:
+    """Bands rows by ACOS at the thresholds the bid rules use (0 for no ACOS)."""
+    bands = np.select(
+        [
+            acos.abs() < 0.0001,
+            acos <= target_acos_decimal * 0.5,
+            acos <= target_acos_decimal * 0.9,
+            acos < target_acos_decimal * 1.1,
+        ],
+        [0, 1, 2, 3],
+        default=4,
+    )
+    return pd.Series(bands, index=acos.index)
+
+def stratified_sample(strata: pd.Series, groups: pd.Series, sample_rows: int, seed: int = 0) -> pd.Series:
+    """
+    Picks about `sample_rows` row labels, allocated to each stratum in
+    proportion to its size (at least two rows each). Within a stratum rows are
+    taken systematically from a random start over the rows ordered by `groups`,
+    so every group (e.g. campaign) is represented in proportion too.
+
+    Returns:
+        Series: The stratum of each sampled row, indexed by row label.
+    """
+    rng = np.random.default_rng(seed)
+    total = len(strata)
+    ordered = pd.DataFrame({'stratum': strata, 'group': groups.astype(str), 'tiebreak': rng.random(total)})
+    ordered = ordered.sort_values(['stratum', 'group', 'tiebreak'])
+    picked = []
+    for stratum, rows in ordered.groupby('stratum', sort=False):
+        size = len(rows)
+        take = min(size, max(2, round(sample_rows * size / total)))
+        positions = ((rng.random() + np.arange(take)) * size / take).astype(int)
+        picked.append(pd.Series(stratum, index=rows.index[positions]))
+    return pd.concat(picked)
+
+def stratified_totals(values: pd.DataFrame, strata: pd.Series, population: pd.Series, z: float) -> dict[str, dict[str, float]]:
+    """
+    Estimates the population total of each column of `values` (one row per
+    sampled row) from the stratum means, with a normal confidence interval
+    of +/- `z` standard errors. `population` holds each stratum's size.
+    """
+    grouped = values.groupby(strata)
+    sizes = population.loc[grouped.size().index]
+    taken = grouped.size()
+    fraction = (1 - taken / sizes).clip(lower=0)
+    estimates = {}
+    for column in values.columns:
+        total = (grouped[column].mean() * sizes).sum()
+        variance = (sizes ** 2 * fraction * grouped[column].var(ddof=1).fillna(0) / taken).sum()
+        margin = z * float(np.sqrt(variance))
+        estimates[column] = {"estimate": float(total), "low": float(total - margin), "high": float(total + margin)}
+    return estimates
+
+def estimate_bid_optimization(input_path, target_acos: float, increase_spend: bool, sample_rows: int, confidence: float = 0.95, progress: ProgressReporter | None = None) -> dict[str, Any]:
+    """
+    Estimates how many rows each bid rule of `process_excel_file` would touch
+    and the projected spend change, from a sample stratified by ACOS band
+    (and by campaign within each band) instead of running every row.
+
+    The spend change assumes a row's spend scales with its bid. Counts and
+    spend come with `confidence` intervals; when the sheet has no more than
+    `sample_rows` rows every row is evaluated and the figures are exact.
+    Workbooks still have to be parsed whole, which dominates on large
+    sheets unless the fast-xlsx extra is installed.
+
+    Args:
+        input_path: Path of the workbook, or its bytes.
+
+    Raises:
+        ValueError: If the PPC data cannot be read.
+    """
+    progress = progress or ProgressReporter(None)
+    progress.stage("reading")
+    source = io.BytesIO(input_path) if isinstance(input_path, bytes) else input_path
+    df, asin_data = read_bid_workbook(source, engine=fast_excel_engine())
+    if df.empty:
+        raise ValueError("Uploaded file's first sheet is empty or invalid.")
+    col_mapping = map_bid_columns(df)
+    target_acos_decimal = target_acos_fraction(target_acos)
+    total_rows = len(df)
+    spend = pd.to_numeric(df[col_mapping['spend']], errors='coerce').fillna(0)
+
+    strata = acos_bands(df[col_mapping['acos']].map(parse_rate), target_acos_decimal)
+    lower_columns = {str(column).lower().strip(): column for column in df.columns}
+    campaign_column = next((lower_columns[name] for name in CAMPAIGN_COLUMNS if name in lower_columns), None)
+    groups = df[campaign_column] if campaign_column is not None else pd.Series('', index=df.index)
+    sampled = stratified_sample(strata, groups, sample_rows)
+
+    progress.stage("estimating", total=len(sampled))
+    outcomes = []
+    for idx in sampled.index:
+        progress.advance()
+        outcome: dict[str, float] = dict.fromkeys(BID_RULE_COLORS, 0)
+        outcome.update(updates_recommended=0, spend_change=0.0)
+        metrics = read_bid_row(df.loc[idx], col_mapping, asin_data)
+        if metrics is not None:
+            rule, new_bid = apply_bid_rules(metrics, target_acos_decimal, increase_spend)
+            new_bid = round(max(0.02, new_bid), 2)
+            if rule is not None:
+                outcome[rule] = 1
+                if abs(new_bid - metrics['current_bid']) > 0.001:
+                    outcome['updates_recommended'] = 1
+                    if metrics['current_bid'] > 0:
+                        outcome['spend_change'] = metrics['spend'] * (new_bid / metrics['current_bid'] - 1)
+        outcomes.append(outcome)
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    totals = stratified_totals(pd.DataFrame(outcomes, index=sampled.index), sampled, strata.value_counts(), z)
+
+    def rows(key):
+        # Rounded counts, kept within what the sheet can hold
+        return {name: int(min(max(round(value), 0), total_rows)) for name, value in totals[key].items()}
+
+    def money(key):
+        return {name: round(value, 2) for name, value in totals[key].items()}
+
+    logger.info(f"Estimated bid optimization from {len(sampled)} of {total_rows} rows")
+    return {
+        "mode": "estimate",
+        "total_rows": total_rows,
+        "sampled_rows": len(sampled),
+        "confidence": confidence,
+        "rules": {rule: rows(rule) for rule in BID_RULE_COLORS},
+        "updates_recommended": rows('updates_recommended'),
+        "current_spend": round(float(spend.sum()), 2),
+        "spend_change": money('spend_change'),
+    }
+
+# --- API Endpoints ---
+
+# --- Background Jobs ---
+
+# Job params for the job's own use, left out of the parameters listed with its result
+INTERNAL_JOB_PARAMS = ("input_blob", "input_ref", "input_rows", "filename")
+
+# (session, job, output_path, progress) -> summary dict or None
+JobProcess = Callable[[Session, PPCJob, str, ProgressReporter], dict[str, Any] | None]
+
+def ppc_job(kind: str, file_type: str = "xlsx") -> Callable[[JobProcess], JobProcess]:
+    """
+    Registers a job handler whose output file (of `file_type`) is stored in
+    the artifact store under the job ID, which is the job's download ID; the
+    file's SHA-256 is added to the job result.
+
+    The decorated function receives (session, job, output_path, progress),
+    where `progress` is the job's ProgressReporter, and may return a summary
+    dict. The output is kept for TEMP_FILE_CLEANUP_DELAY seconds
+    after the job finishes (and listed in its owner's `/results` until
+    then), partial output is removed when the handler fails
+    or is cancelled, and the uploaded input is released either way. The
+    reporter checks the job's cancel token, so a cancelled job stops at its
+    next progress call.
+    """
+    def register(process: JobProcess) -> JobProcess:
+        @jobs.job_handler(kind)
+        def handler(session: Session, job: PPCJob) -> dict[str, Any]:
+            output_path = job_output_path(job, file_type)
+            progress = ProgressReporter(str(job.id), cancel=jobs.JobCancelToken(job.id))
+            try:
+                summary = process(session, job, output_path, progress)
+                progress.stage("storing")
+            except BaseException:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                raise
+            finally:
+                if job.params.get("input_ref"):
+                    janitor.schedule_release(job.params["input_ref"], 0)
+            expires_at = datetime.utcnow() + timedelta(seconds=settings.TEMP_FILE_CLEANUP_DELAY)
+            result: dict[str, Any] = {"download_id": str(job.id)}
+            if file_type == "xlsx":
+                result["preview_sheets"] = store_preview_tables(session, job, output_path, expires_at)
+            # The output is still in the page cache here, so hashing it is cheap
+            result["sha256"] = file_sha256(output_path)
+            size = os.path.getsize(output_path)
+            artifact_store.put(
+                session,
+                output_path,
+                key=str(job.id),
+                sha256=result["sha256"],
+                file_type=file_type,
+                expires_at=expires_at,
+                owner_id=job.owner_id,
+                role="result",
+            )
+            if job.owner_id is not None:
+                crud.create_ppc_result(
+                    session=session,
+                    job=job,
+                    params={name: value for name, value in job.params.items() if name not in INTERNAL_JOB_PARAMS},
+                    file_type=file_type,
+                    size=size,
+                    sha256=result["sha256"],
+                    expires_at=expires_at,
+                )
+            return {**result, **(summary or {})}
+        return process
+    return register
+
+def preview_key(job_id, index: int) -> str:
+    return f"preview:{job_id}:{index}"
+
+def store_preview_tables(session, job: PPCJob, output_path: str, expires_at: datetime) -> list[str]:
+    """
+    Stores each sheet of a job's workbook as a Parquet table for the preview
+    endpoint and returns the sheet names. A workbook that cannot be converted
+    just has no preview; the job itself still succeeds.
+    """
+    try:
+        tables = compute_pool.run(write_preview_tables, output_path, TEMP_DIR)
+    except Exception as e:
+        logger.warning(f"Could not build preview for job {job.id}: {e}")
+        return []
+    for index, (_, path) in enumerate(tables):
+        artifact_store.put(
+            session,
+            path,
+            key=preview_key(job.id, index),
+            sha256=file_sha256(path),
+            file_type="parquet",
+            expires_at=expires_at,
+            owner_id=job.owner_id,
+            role="cache",
+        )
+    return [sheet for sheet, _ in tables]
+
+def queue_job(*, session, kind: str, params: dict[str, Any], owner_id=None, idempotency_key: str | None = None) -> PPCJob:
+    """
+    Submits a job, answering 429 (and dropping the saved input) when the queue is full.
+
+    With an `idempotency_key`, a repeat of an earlier request gets the job
+    that request queued and its own saved input is dropped; reusing the key
+    for a different request answers 422.
+    """
+    try:
+        if idempotency_key is None:
+            return jobs.submit_job(session=session, kind=kind, params=params, owner_id=owner_id)
+        job, created = jobs.submit_job_once(
+            session=session,
+            kind=kind,
+            params=params,
+            idempotency_key=idempotency_key,
+            fingerprint=request_fingerprint(kind, params),
+            owner_id=owner_id,
+        )
+    except jobs.JobQueueFull as e:
+        logger.warning(f"Rejected {kind} job: {e}")
+        if params.get("input_ref"):
+            janitor.schedule_release(params["input_ref"], 0)
+        raise HTTPException(status_code=429, detail="Too many files are waiting to be processed. Please try again shortly.", headers={"Retry-After": "30"})
+    except jobs.IdempotencyKeyReused as e:
+        logger.warning(f"Rejected {kind} job: {e}")
+        if params.get("input_ref"):
+            janitor.schedule_release(params["input_ref"], 0)
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request.")
+    if not created:
+        logger.info(f"Returning {kind} job {job.id} queued earlier with Idempotency-Key {idempotency_key}")
+        if params.get("input_ref"):
+            janitor.schedule_release(params["input_ref"], 0)
+    return job
+
+def request_fingerprint(kind: str, params: dict[str, Any]) -> str:
+    """Identifies a request by its job parameters; the input blob name covers the file's content."""
+    fields = {key: value for key, value in params.items() if key != "input_ref"}
+    return hashlib.sha256(json.dumps([kind, fields], sort_keys=True, default=str).encode()).hexdigest()
+
+def job_output_path(job: PPCJob, file_type: str = "xlsx") -> str:
+    return os.path.join(TEMP_DIR, f"output_{job.id}.{file_type}")  # Moved into the artifact store once complete
+
+def job_accepted(job: PPCJob, message: str) -> dict[str, Any]:
+    return {"message": message, "job_id": str(job.id), "status": job.status}
+
+# File types every tool reads; see CATALOG_FILE_TYPES for the catalog
+SPREADSHEET_TYPES = ("xlsx", "xls", "csv")
+
+def reserve_storage(size: int, owner_id=None) -> None:
+    with Session(engine) as session:
+        storage_manager.reserve(session, size, owner_id)
+
+async def save_upload(
+    file: UploadFile, in_memory: bool = False, owner_id=None, allowed_types: tuple[str, ...] = SPREADSHEET_TYPES
+) -> IngestedUpload:
+    """
+    Stores an uploaded file in TEMP_DIR, answering 413 when it exceeds
+    PPC_MAX_UPLOAD_BYTES and 415 when it is not one of `allowed_types` (zip
+    archives sniff as xlsx). Uploads to this router's routes were written
+    there while the request arrived and are only moved into place (see
+    `adopt_upload`); others are copied (see `ingest_upload`). Room for it is made first (see `StorageManager.reserve`),
+    answering 507 when there is none. With `in_memory`, uploads up to
+    PPC_SPOOL_MAX_BYTES are kept in memory instead; use `upload_source` to
+    read either kind.
+    """
+    max_bytes = settings.PPC_MAX_UPLOAD_BYTES
+    try:
+        if file.size is not None and file.size > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the maximum size of {max_bytes} bytes")
+        await db_pool.run(reserve_storage, file.size or 0, owner_id)
+        in_memory_max = settings.PPC_SPOOL_MAX_BYTES if in_memory else 0
+        if isinstance(file, StreamedUpload):
+            upload = await file_io_pool.run(
+                adopt_upload,
+                file.path,
+                file.digest,
+                TEMP_DIR,
+                in_memory_max=in_memory_max,
+                allowed_types=allowed_types,
+            )
+        else:
+            upload = await file_io_pool.run(
+                ingest_upload,
+                file.file,
+                TEMP_DIR,
+                max_bytes=max_bytes,
+                in_memory_max=in_memory_max,
+                allowed_types=allowed_types,
+            )
+    except EmptyUpload as e:
+        logger.error("Uploaded file is empty.")
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLarge as e:
+        logger.warning(f"Rejected upload {file.filename}: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedFileType as e:
+        logger.warning(f"Rejected upload {file.filename}: {e}")
+        raise HTTPException(status_code=415, detail=str(e))
+    except InsufficientStorage as e:
+        logger.warning(f"Rejected upload {file.filename}: {e}")
+        raise HTTPException(status_code=507, detail=str(e))
+    finally:
+        await file.close()
+
+    logger.info(f"Received {upload.size} bytes ({upload.file_type}, sha256 {upload.sha256}) from {file.filename}, stored at: {upload.path or 'memory'}")
+    return upload
+
+async def save_job_input(
+    session, file: UploadFile, owner_id=None, allowed_types: tuple[str, ...] = SPREADSHEET_TYPES
+) -> dict[str, Any]:
+    """
+    Saves an upload into the artifact store for a job, returning the
+    `input_blob` and `input_ref` job params, `input_rows`, the upload's
+    estimated size the scheduler orders jobs by, and its `filename`.
+    Identical uploads share one blob. The reference is released when the job finishes, or after
+    TEMP_FILE_CLEANUP_DELAY seconds if it never runs; until then it is never
+    evicted, and counts toward `owner_id`'s storage quota.
+    """
+    upload = await save_upload(file, owner_id=owner_id, allowed_types=allowed_types)
+    job_input = await file_io_pool.run(store_job_input, session, upload, owner_id)
+    return {**job_input, "filename": os.path.basename(file.filename or "upload")}
+
+def store_job_input(session, upload: IngestedUpload, owner_id=None) -> dict[str, Any]:
+    """Moves an upload saved to disk into the artifact store; see `save_job_input`."""
+    assert upload.path is not None
+    input_rows = estimate_rows(upload)
+    input_ref = f"input:{uuid.uuid4()}"
+    input_blob = artifact_store.put(
+        session,
+        upload.path,
+        key=input_ref,
+        sha256=upload.sha256,
+        file_type=upload.file_type,
+        expires_at=datetime.utcnow() + timedelta(seconds=settings.TEMP_FILE_CLEANUP_DELAY),
+        owner_id=owner_id,
+        role="input",
+    )
+    return {"input_blob": input_blob, "input_ref": input_ref, "input_rows": input_rows}
+
+def job_input(job: PPCJob):
+    """
+    Context manager giving a local path to a job's uploaded input. With a
+    shared (S3) artifact store the job may run on any node, so the blob is
+    fetched to a temporary file there.
+    """
+    return artifact_store.backend.local_copy(job.params["input_blob"])
+
+def upload_source(upload: IngestedUpload):
+    """Returns an upload's bytes when it was kept in memory, otherwise its path."""
+    return upload.content if upload.path is None else upload.path
+
+def discard_upload(upload: IngestedUpload):
+    if upload.path and os.path.exists(upload.path):
+        os.remove(upload.path)
+
+def spreadsheet_type(source) -> str:
+    """
+    Returns "xlsx", "xls" or "csv" for a path (by extension) or a binary file
+    object (by its leading bytes, leaving the position unchanged).
+    """
+    if isinstance(source, (str, os.PathLike)):
+        extension = os.path.splitext(str(source))[1].lower().lstrip('.')
+        return extension if extension in ("xlsx", "xls") else "csv"
+    position = source.tell()
+    head = source.read(8192)
+    source.seek(position)
+    return sniff_file_type(head) or "csv"
+
+def open_input(input_path: str):
+    """
+    Opens an input file for processing. Files up to PPC_SPOOL_MAX_BYTES are
+    read into memory in one sequential read, so parsers seek in RAM instead
+    of issuing many small reads against the (network-mounted) TEMP_DIR.
+    """
+    if os.path.getsize(input_path) <= settings.PPC_SPOOL_MAX_BYTES:
+        with open(input_path, "rb") as source:
+            return io.BytesIO(source.read())
+    return open(input_path, "rb")
+
+def persist_output(output, output_path: str):
+    """Writes a finished output buffer to its final path in one pass, atomically."""
+    output.seek(0)
+    partial_path = f"{output_path}.partial"
+    try:
+        with open(partial_path, "wb") as destination:
+            shutil.copyfileobj(output, destination, 1024 * 1024)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+def run_buffered(process: Callable[..., Any], input_path: str | None, output_path: str, *args, **kwargs):
+    """
+    Runs `process(input, output, *args, **kwargs)` against in-memory buffers:
+    the input comes from `open_input` and the output goes to a spooled
+    temporary file that only spills to disk past PPC_SPOOL_MAX_BYTES. Only
+    the finished artifact is written to `output_path`, so a failed run never
+    leaves a partial file behind. Without an input, `process(output, ...)`
+    is called instead.
+
+    Returns:
+        Whatever `process` returns.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=settings.PPC_SPOOL_MAX_BYTES, dir=TEMP_DIR) as output:
+        if input_path is None:
+            result = process(output, *args, **kwargs)
+        else:
+            with open_input(input_path) as source:
+                result = process(source, output, *args, **kwargs)
+        persist_output(output, output_path)
+    return result
+
+async def run_until_disconnected(request: Request, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Runs `fn(*args, progress=..., **kwargs)` on the compute pool for a
+    synchronous request, cancelling it once the client disconnects: the
+    ProgressReporter passed to `fn` raises Cancelled at its next check, so
+    the worker is freed instead of finishing work nobody will read. A
+    cancelled run answers 499 (client closed request).
+    """
+    token = FlagFileToken(TEMP_DIR)
+    task = asyncio.ensure_future(
+        compute_pool.run_async(fn, *args, progress=ProgressReporter(None, cancel=token), **kwargs)
+    )
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.PPC_CANCEL_CHECK_INTERVAL)
+            if done:
+                break
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected, cancelling {fn.__name__}")
+                token.cancel()
+                # Wait for the run to stop, so the worker is free before the request ends
+                await asyncio.wait({task})
+                break
+        return task.result()
+    except Cancelled:
+        raise HTTPException(status_code=499, detail="Client closed request.")
+    finally:
+        if not task.done():
+            token.cancel()
+        token.discard()
+
+@router.get(
+    "/jobs/{job_id}",
+    summary="Get PPC Job Status",
+    response_model=PPCJobPublic,
+)
+def read_job(session: SessionDep, current_user: OptionalUser, job_id: uuid.UUID) -> Any:
+    """
+    Returns the status of a processing job: queued, running, succeeded,
+    failed or cancelled. Succeeded jobs carry the `download_id` of their
+    output file and the `download_url` to fetch it from; failed jobs an
+    `error` message. Jobs queued by a signed-in user are only shown to
+    that user (see `check_job_access`).
+    """
+    job = session.get(PPCJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    check_job_access(job, current_user)
+    return job_public(job)
+
+@router.delete(
+    "/jobs/{job_id}",
+    summary="Cancel PPC Job",
+    response_model=PPCJobPublic,
+    status_code=202,
+)
+def cancel_job(session: SessionDep, current_user: OptionalUser, job_id: uuid.UUID) -> Any:
+    """
+    Cancels a processing job. A queued job is cancelled at once; a running
+    one keeps its status, with `cancel_requested_at` set, until it stops at
+    its next progress check (usually within a second) and becomes
+    cancelled. Jobs that already succeeded or failed answer 409. Only the
+    owner of a signed-in user's job may cancel it.
+    """
+    owned = session.get(PPCJob, job_id)
+    if not owned:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    check_job_access(owned, current_user)
+    job, dequeued = jobs.cancel_job(session=session, job_id=job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job.status in ("succeeded", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}.")
+    if dequeued and job.params.get("input_ref"):
+        janitor.schedule_release(job.params["input_ref"], 0)
+    logger.info(f"Cancellation requested for {job.kind} job {job.id}")
+    return job_public(job)
+
+def check_job_access(job: PPCJob, user: User | None) -> None:
+    """
+    Jobs queued anonymously are open to anyone with their ID; a signed-in
+    user's jobs only to that user and superusers. Answers 401 or 403 otherwise.
+    """
+    if job.owner_id is None:
+        return
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    if not user.is_superuser and job.owner_id != user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+def job_public(job: PPCJob) -> PPCJobPublic:
+    return PPCJobPublic.model_validate(
+        job,
+        update={
+            "download_url": download_url(job.download_id, owned=job.owner_id is not None) if job.download_id else None
+        },
+    )
+
+def load_job(job_id: uuid.UUID) -> PPCJob | None:
+    with Session(engine) as session:
+        return session.get(PPCJob, job_id)
+
+def sse_message(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.get("/jobs/{job_id}/events", summary="Stream PPC Job Progress")
+async def stream_job_events(current_user: OptionalUser, job_id: uuid.UUID):
+    """
+    Streams a job's progress as Server-Sent Events until it finishes.
+
+    `progress` events carry the stage, rows processed, rows/sec and ETA
+    (the last two when known); they are sent at most every
+    PPC_PROGRESS_INTERVAL seconds. The stream ends with one `succeeded`,
+    `failed` or `cancelled` event holding the job as returned by `/jobs/{job_id}`.
+
+    Progress events reach the app process that runs the job directly;
+    other processes read the latest progress from the job row, which is
+    saved and polled every PPC_PROGRESS_SAVE_INTERVAL seconds. A signed-in
+    user's jobs are only streamed to that user.
+    """
+    job = await db_pool.run(load_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    check_job_access(job, current_user)
+
+    async def events():
+        # Subscribe before reading the job so its outcome cannot slip in between
+        with progress_bus.subscribe(str(job_id)) as subscription:
+            current = await db_pool.run(load_job, job_id)
+            if current is None:
+                return
+            # Once events arrive here the job runs in this process, and its row only lags behind them
+            local = False
+            sent = None
+            last_write = time.monotonic()
+            if current.status not in FINISHED_STATUSES:
+                sent = progress_bus.latest(str(job_id)) or current.progress
+                if sent:
+                    yield sse_message("progress", sent)
+            while current.status not in FINISHED_STATUSES:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), settings.PPC_PROGRESS_SAVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    current = await db_pool.run(load_job, job_id)
+                    if current is None:
+                        return
+                    if not local and current.status not in FINISHED_STATUSES and current.progress and current.progress != sent:
+                        sent = current.progress
+                        last_write = time.monotonic()
+                        yield sse_message("progress", sent)
+                    elif time.monotonic() - last_write >= settings.PPC_PROGRESS_KEEPALIVE:
+                        last_write = time.monotonic()
+                        yield ": keepalive\n\n"
+                    continue
+                local = True
+                if event["status"] in FINISHED_STATUSES:
+                    current = await db_pool.run(load_job, job_id)
+                    if current is None:
+                        return
+                else:
+                    sent = event
+                    last_write = time.monotonic()
+                    yield sse_message("progress", event)
+            yield sse_message(current.status, job_public(current).model_dump(mode="json"))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def encode_results_cursor(result: PPCResult) -> str:
+    payload = json.dumps({"c": result.created_at.isoformat(), "j": str(result.job_id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_results_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(payload["c"]), uuid.UUID(payload["j"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+@router.get(
+    "/results",
+    summary="List My PPC Results",
+    response_model=PPCResultsPage,
+)
+def read_results(
+    session: SessionDep,
+    current_user: CurrentUser,
+    kind: str | None = Query(None, description="Only results of this tool, e.g. optimize-bids"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor of the previous page"),
+) -> Any:
+    """
+    Lists the current user's processed files that have not expired yet,
+    newest first, with the tool and parameters that produced them and a
+    `download_url` to fetch them again. Pass `next_cursor` back as `cursor`
+    for the next page; it is null on the last one.
+    """
+    before = decode_results_cursor(cursor) if cursor else None
+    results = crud.list_ppc_results(
+        session=session,
+        owner_id=current_user.id,
+        now=datetime.utcnow(),
+        limit=limit + 1,
+        kind=kind,
+        before=before,
+    )
+    page = results[:limit]
+    return PPCResultsPage(
+        data=[
+            PPCResultPublic.model_validate(result, update={"download_url": download_url(str(result.job_id), owned=True)})
+            for result in page
+        ],
+        next_cursor=encode_results_cursor(page[-1]) if len(results) > limit else None,
+    )
+
+def resolve_preview(job_id: uuid.UUID, sheet: str | None, user: User | None) -> tuple[list[str], str, str | None]:
+    """Returns the job's preview sheets, the chosen sheet and its blob name (None once expired)."""
+    with Session(engine) as session:
+        job = session.get(PPCJob, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found.")
+        check_job_access(job, user)
+        sheets = (job.result or {}).get("preview_sheets") or []
+        if not sheets:
+            raise HTTPException(status_code=404, detail="No preview is available for this job.")
+        sheet = sheet if sheet is not None else sheets[0]
+        if sheet not in sheets:
+            raise HTTPException(status_code=404, detail=f"Sheet '{sheet}' not found. Available sheets: {', '.join(sheets)}")
+        blob = artifact_store.resolve(session, preview_key(job_id, sheets.index(sheet)))
+        if not blob:
+            return sheets, sheet, None
+        return sheets, sheet, artifact_store.blob_name(blob.sha256, blob.file_type)
+
+def read_preview_page(name: str, **query) -> dict[str, Any]:
+    return query_preview(preview_tables.get(name), **query)
+
+@router.get(
+    "/jobs/{job_id}/preview",
+    summary="Preview PPC Job Output",
+    response_model=PPCPreviewPage,
+)
+async def preview_job_output(
+    current_user: OptionalUser,
+    job_id: uuid.UUID,
+    sheet: str | None = Query(None, description="Sheet to read; defaults to the first"),
+    filters: list[str] = Query([], alias="filter", description="<column>:<op>:<value>, op one of eq, ne, lt, le, gt, ge, contains, in (comma-separated values), null, notnull; repeat to combine"),
+    sort: str | None = Query(None, description="Column to order by, prefixed with '-' for descending"),
+    limit: int = Query(50, ge=1, le=settings.PPC_PREVIEW_MAX_LIMIT),
+    cursor: str | None = Query(None, description="`next_cursor` of the previous page"),
+):
+    """
+    Returns a page of a finished job's output rows, read from a columnar copy
+    of the workbook made when the job finished, so the spreadsheet is never
+    re-parsed. Rows carry their position in the sheet as `_row`; pages are
+    chained through `next_cursor`, which is null on the last page. A
+    signed-in user's outputs are only previewed for that user.
+    """
+    try:
+        parsed_filters = [parse_filter(expression) for expression in filters]
+    except InvalidPreviewQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    sheets, sheet, name = await db_pool.run(resolve_preview, job_id, sheet, current_user)
+    if name is None:
+        raise HTTPException(status_code=404, detail="Preview not found or has expired.")
+    try:
+        page = await file_io_pool.run(
+            read_preview_page, name, filters=parsed_filters, sort=sort, limit=limit, cursor=cursor
+        )
+    except InvalidPreviewQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PPCPreviewPage(sheets=sheets, sheet=sheet, **page)
+
 # --- API Endpoints ---
 
-# Modified /upload endpoint
 @router.post(
     "/upload",
     summary="Upload and Process PPC File",
-    # response_model=..., # Define a response model if needed
-    # dependencies=[Depends(get_current_active_user)] # Add auth later
+    status_code=202,
 )
 async def upload_ppc_file(
-    background_tasks: BackgroundTasks,
+    request: Request,
+    session: SessionDep,
+    current_user: OptionalUser,
     file: UploadFile = File(..., description="XLSX, XLS, or CSV file containing PPC data. Required columns include: Impressions, Clicks, Spend, Sales, Orders, Bid, ACOS, Click-through Rate, CPC, ASIN (Informational only)"),
     target_acos: float = Form(..., ge=0, le=1000, description="Target ACOS percentage (e.g., 30 for 30%). Must be >= 0."), # Added validation
-    increase_spend: bool = Form(False, description="Whether to increase spend for promising low-ACOS/low-spend items")
+    increase_spend: bool = Form(False, description="Whether to increase spend for promising low-ACOS/low-spend items"),
+    mode: str = Form("full", description="'full' queues the optimization; 'estimate' answers right away with sampled estimates"),
+    idempotency_key: str | None = Header(None, max_length=128, description="Repeats of a request with the same key get the job the first one queued."),
 ):
     """
-    Uploads a PPC data file, performs bid optimization based on the provided
-    Target ACOS and Increase Spend flag, schedules cleanup, and returns a
-    download ID for the processed file.
+    Uploads a PPC data file and queues bid optimization based on the provided
+    Target ACOS and Increase Spend flag. Returns a job ID; poll
+    `/jobs/{job_id}` for the download ID of the processed file.
+
+    With `mode=estimate` nothing is queued: the rules run on a stratified
+    sample of PPC_ESTIMATE_SAMPLE_ROWS rows, and the response holds the
+    estimated rows matched per rule, bids updated and spend change, each
+    with a 95% confidence interval. The estimate stops if the client
+    disconnects.
+
+    Files processed for a signed-in user are listed at `/results`.
 
     **Required Columns in Uploaded File:**
     - Impressions
@@ -511,375 +1367,578 @@ async def upload_ppc_file(
     - CPC
     - ASIN (Informational only) (Optional, used for AOV fallback)
     """
-    # --- File Handling and Path Generation ---
     logger.info("--- Entered /upload endpoint ---")
-    download_id = str(uuid.uuid4())
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
-
-    # Sanitize filename (more robustly)
-    original_filename = file.filename or "uploaded_file"
-    base, ext = os.path.splitext(original_filename)
-    safe_base = "".join(c if c.isalnum() else '_' for c in base)
-    safe_filename = f"{safe_base}{ext}" if ext else safe_base
-    # Limit filename length
-    safe_filename = safe_filename[:100] # Limit length
-
-    input_path = os.path.join(TEMP_DIR, f"input_{download_id}_{timestamp}_{safe_filename}")
-    # Consistent output naming convention tied to download_id for easier lookup
-    temp_output_path = os.path.join(TEMP_DIR, f"temp_processed_{download_id}_{timestamp}.xlsx")
-    final_output_path = os.path.join(TEMP_DIR, f"{download_id}.xlsx")
-
-    logger.info(f"Generated paths: input='{input_path}', temp_output='{temp_output_path}', final_output='{final_output_path}'")
-    logger.info(f"Received parameters: target_acos={target_acos}, increase_spend={increase_spend}")
-
-    # --- File Saving and Processing ---
-    try:
-        logger.info("Attempting to save uploaded file...")
-        # Save the uploaded file temporarily using async-friendly method
-        file_content = await file.read()
-        if not file_content:
-             logger.error("Uploaded file is empty.")
-             raise HTTPException(status_code=400, detail="Uploaded file content is empty.")
-
-        async with await run_in_threadpool(open, input_path, "wb") as buffer:
-            await run_in_threadpool(buffer.write, file_content)
-
-        logger.info(f"Uploaded file saved successfully to: {input_path}")
-        logger.info(f"File size: {len(file_content)} bytes")
-
-
-        logger.info(f"Attempting to process file...")
-        # Process the file using the updated function (run in threadpool for potentially long processing)
-        await run_in_threadpool(
-            process_excel_file,
-            input_path,
-            temp_output_path, # Process to temporary output first
-            target_acos,
-            increase_spend
-        )
-        logger.info("File processing function completed.")
-
-        # --- Finalizing Output and Cleanup ---
-        # Check if temp output file was created
-        if not os.path.exists(temp_output_path):
-             logger.error("Processing completed but output file was not created.")
-             raise HTTPException(status_code=500, detail="Internal server error: Failed to generate processed file.")
-
-        # Rename the temporary output file to the final download ID filename
-        await run_in_threadpool(os.rename, temp_output_path, final_output_path)
-        logger.info(f"Renamed processed file to {final_output_path}")
-
-        # Schedule cleanup for the original input file and the final output file
-        logger.info(f"Scheduling cleanup for {input_path} and {final_output_path} in {settings.TEMP_FILE_CLEANUP_DELAY} seconds.")
-        schedule_file_cleanup(background_tasks, input_path, delay=settings.TEMP_FILE_CLEANUP_DELAY)
-        schedule_file_cleanup(background_tasks, final_output_path, delay=settings.TEMP_FILE_CLEANUP_DELAY)
-
-        # --- Return Success Response ---
-        return {"message": "File processed successfully", "download_id": download_id}
-
-    except HTTPException as http_exc:
-         logger.error(f"HTTP Exception during upload/processing: {http_exc.detail}")
-         # Clean up potentially created files on known HTTP errors
-         if os.path.exists(input_path): await run_in_threadpool(os.remove, input_path)
-         if os.path.exists(temp_output_path): await run_in_threadpool(os.remove, temp_output_path)
-         if os.path.exists(final_output_path): await run_in_threadpool(os.remove, final_output_path)
-         raise # Re-raise the HTTPException
-
-    except ValueError as ve: # Catch specific error from process_excel_file
-        logger.error(f"Value Error during processing: {ve}")
-        if os.path.exists(input_path): await run_in_threadpool(os.remove, input_path)
-        if os.path.exists(temp_output_path): await run_in_threadpool(os.remove, temp_output_path)
-        raise HTTPException(status_code=400, detail=str(ve))
-
-    except Exception as e:
-        logger.error(f"Unexpected error processing file {safe_filename}: {e}", exc_info=True)
-        # General cleanup on unexpected errors
-        if os.path.exists(input_path): await run_in_threadpool(os.remove, input_path)
-        if os.path.exists(temp_output_path): await run_in_threadpool(os.remove, temp_output_path)
-        if os.path.exists(final_output_path): await run_in_threadpool(os.remove, final_output_path) # Renamed file
-
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred during file processing.")
-
-    finally:
-        # Ensure file object is closed
-        await file.close()
-
-
-# Modified /download endpoint
-@router.get(
-    "/download/{download_id}",
-    summary="Download Processed PPC File",
-    # response_class=FileResponse # Implicitly handled
-    # dependencies=[Depends(get_current_active_user)] # Add auth later
-)
-async def download_processed_file(download_id: str):
-    """
-    Downloads the processed Excel file identified by the `download_id`.
-    The file is retrieved based on the ID and served to the user.
-    """
-    # --- Input Validation ---
-    logger.info(f"Received download request for ID: {download_id}")
-    try:
-        # Check if it's a valid UUID format
-        uuid_obj = uuid.UUID(download_id, version=4)
-        # Ensure the string representation matches exactly (prevents different formats)
-        if str(uuid_obj) != download_id:
-             raise ValueError("UUID string format mismatch")
-    except ValueError:
-         logger.warning(f"Invalid download ID format received: {download_id}")
-         raise HTTPException(status_code=400, detail="Invalid download ID format.")
-
-    # --- File Location and Check ---
-    # Construct path based on the established convention ({download_id}.xlsx)
-    file_path = os.path.join(TEMP_DIR, f"{download_id}.xlsx")
-    logger.info(f"Attempting to serve file from path: {file_path}")
-
-    # Check if the file exists using async-friendly method
-    file_exists = await run_in_threadpool(os.path.exists, file_path)
-
-    if not file_exists:
-        logger.warning(f"Download request failed: File not found at {file_path}")
-        raise HTTPException(status_code=404, detail="File not found. It may have been processed unsuccessfully, cleaned up, or the ID is incorrect.")
-
-    # --- Return File Response ---
-    # Generate a user-friendly filename for the download prompt
-    download_filename = f"optimized_bids_{download_id[:8]}.xlsx"
-    logger.info(f"File found. Serving '{file_path}' as '{download_filename}'")
-
-    return FileResponse(
-        path=file_path,
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        filename=download_filename
+    logger.info(f"Received parameters: target_acos={target_acos}, increase_spend={increase_spend}, mode={mode}")
+    if mode not in ("full", "estimate"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'estimate'.")
+    owner_id = current_user.id if current_user else None
+    if mode == "estimate":
+        upload = await save_upload(file, in_memory=True, owner_id=owner_id)
+        try:
+            estimate = await run_until_disconnected(
+                request, estimate_bid_optimization, upload_source(upload), target_acos, increase_spend, settings.PPC_ESTIMATE_SAMPLE_ROWS
+            )
+            return JSONResponse(content=estimate)
+        except ComputePoolSaturated as e:
+            logger.warning(f"Rejected bid optimization estimate: {e}")
+            raise HTTPException(status_code=503, detail="The server is busy processing other files. Please try again shortly.", headers={"Retry-After": "10"})
+        except ValueError as ve:
+            logger.error(f"Value error during bid optimization estimate: {ve}")
+            raise HTTPException(status_code=400, detail=str(ve))
+        finally:
+            await file_io_pool.run(discard_upload, upload)
+
+    job_input = await save_job_input(session, file, owner_id)
+
+    job = await db_pool.run(
+        queue_job,
+        session=session,
+        kind="optimize-bids",
+        idempotency_key=idempotency_key,
+        owner_id=owner_id,
+        params={**job_input, "target_acos": target_acos, "increase_spend": increase_spend},
     )
+    logger.info(f"Queued bid optimization job {job.id}")
+    return job_accepted(job, "File queued for processing")
+
+@ppc_job("optimize-bids")
+def run_bid_optimization_job(_session, job: PPCJob, output_path: str, progress: ProgressReporter):
+    params = job.params
+    with job_input(job) as input_path:
+        compute_pool.run(run_buffered, process_excel_file, input_path, output_path, params["target_acos"], params["increase_spend"], progress=progress)
 
 @router.post(
     "/mine-keywords",
     summary="Upload and Mine Keywords from PPC Data File",
+    status_code=202,
 )
 async def mine_keywords(
-    background_tasks: BackgroundTasks,
+    session: SessionDep,
+    current_user: CurrentUser,
     file: UploadFile = File(..., description="XLSX, XLS, or CSV file containing PPC data."),
     max_acos: float = Form(..., ge=0, le=100, description="Maximum ACOS threshold percentage."),
     match_type: str = Form("exact", description="Keyword match type (exact, phrase, or broad)."),
     brands_to_exclude: str = Form("", description="Comma-separated list of brand names to exclude."),
+    include_negatives: bool = Form(False, description="Also harvest wasted-spend search terms as negative keywords."),
+    negative_min_clicks: int = Form(10, ge=0, description="Minimum clicks for a search term to be negated."),
+    negative_min_spend: float = Form(0.0, ge=0, description="Minimum spend for a search term to be negated."),
+    negative_max_orders: int = Form(0, ge=0, description="Search terms with at most this many orders are negated."),
+    negative_min_acos: float | None = Form(None, ge=0, description="Also negate terms whose ACOS percentage is at or above this value."),
+    negative_match_type: str = Form("exact", description="Negative match type (exact, phrase, or both)."),
+    skip_harvested: bool = Form(True, description="Skip keywords already harvested for the same SKU and match type in earlier runs."),
+    cluster_keywords: bool = Form(False, description="Group textually similar keywords into the same campaign and ad group."),
+    cluster_similarity: float = Form(0.5, gt=0, le=1, description="Minimum estimated Jaccard similarity for keywords to share a cluster."),
+    idempotency_key: str | None = Header(None, max_length=128, description="Repeats of a request with the same key get the job the first one queued."),
 ):
     """
     Mines profitable keywords from the uploaded PPC data file based on:
     - Maximum ACOS threshold
     - Match type
     - Brand exclusions
+
+    When `include_negatives` is set, wasted-spend search terms are harvested
+    in the same pass and written to a "Negative Keywords" sheet.
+
+    Every harvested keyword is recorded in the user's registry; with
+    `skip_harvested` (the default) keywords found there are left out, so
+    repeat runs only create campaigns for new terms.
+
+    With `cluster_keywords`, keywords for each SKU are clustered by textual
+    similarity (MinHash/LSH) and each ad group is filled from one cluster
+    instead of taking the next 10 keywords in report order.
+
+    Mining runs as a background job; poll `/jobs/{job_id}` for the download
+    ID of the bulk file.
     """
-    logger.info(f"Entered /mine-keywords endpoint with params: max_acos={max_acos}, match_type={match_type}")
-    download_id = str(uuid.uuid4())
-    input_path = os.path.join(TEMP_DIR, f"input_{download_id}_{file.filename}")
-    output_path = os.path.join(TEMP_DIR, f"{download_id}")  # Format to match what download endpoint expects
-    
-    try:
-        logger.info("Saving uploaded file for keyword mining...")
-        with open(input_path, "wb") as buffer:
-            file_content = await file.read()
-            logger.info(f"Read {len(file_content)} bytes from uploaded file.")
-            buffer.write(file_content)
-        logger.info(f"File saved successfully to: {input_path}")
-        
-        logger.info("Processing file for keyword mining...")
-        # Process the file for keyword mining
-        process_keyword_mining(
-            input_path, 
-            output_path, 
-            max_acos_threshold=max_acos,
-            match_type=match_type,
-            brands_to_exclude=brands_to_exclude
+    logger.info(f"Entered /mine-keywords endpoint with params: max_acos={max_acos}, match_type={match_type}, include_negatives={include_negatives}")
+    negative_options = None
+    if include_negatives:
+        negative_options = parse_negative_options(
+            negative_min_clicks, negative_min_spend, negative_max_orders, negative_min_acos, negative_match_type
         )
-        logger.info("Keyword mining completed successfully.")
-        
-        # Schedule cleanup
-        schedule_file_cleanup(background_tasks, input_path, delay=3600)
-        schedule_file_cleanup(background_tasks, output_path, delay=3600)
-        
-        return {
-            "message": "Keywords mined successfully",
-            "download_id": download_id
-        }
-    
+    job_input = await save_job_input(session, file, current_user.id)
+
+    job = await db_pool.run(
+        queue_job,
+        session=session,
+        kind="mine-keywords",
+        idempotency_key=idempotency_key,
+        owner_id=current_user.id,
+        params={
+            **job_input,
+            "max_acos": max_acos,
+            "match_type": match_type,
+            "brands_to_exclude": brands_to_exclude,
+            "negative_options": negative_options,
+            "skip_harvested": skip_harvested,
+            "cluster_similarity": cluster_similarity if cluster_keywords else None,
+        },
+    )
+    logger.info(f"Queued keyword mining job {job.id}")
+    return job_accepted(job, "File queued for keyword mining")
+
+class HarvestedKeywordLookup:
+    """
+    Registry lookup for `process_keyword_mining`. A plain class rather than a
+    closure over the job's session so it can be pickled into a compute worker,
+    which opens its own session per lookup.
+    """
+    def __init__(self, owner_id):
+        self.owner_id = owner_id
+
+    def __call__(self, keys):
+        with Session(engine) as session:
+            return crud.get_harvested_keywords(session=session, owner_id=self.owner_id, keys=keys)
+
+@ppc_job("mine-keywords")
+def run_keyword_mining_job(session, job: PPCJob, output_path: str, progress: ProgressReporter):
+    params = job.params
+    harvested_lookup = HarvestedKeywordLookup(job.owner_id) if params["skip_harvested"] else None
+
+    with job_input(job) as input_path:
+        harvested_keys = compute_pool.run(
+            run_buffered,
+            process_keyword_mining,
+            input_path,
+            output_path,
+            max_acos_threshold=params["max_acos"],
+            match_type=params["match_type"],
+            brands_to_exclude=params["brands_to_exclude"],
+            negative_options=params["negative_options"],
+            harvested_lookup=harvested_lookup,
+            cluster_similarity=params["cluster_similarity"],
+            progress=progress,
+        )
+    logger.info("Keyword mining completed successfully.")
+
+    if job.owner_id is not None:
+        crud.create_harvested_keywords(session=session, owner_id=job.owner_id, keys=harvested_keys)
+        logger.info(f"Recorded {len(harvested_keys)} harvested keywords for user {job.owner_id}")
+
+@router.post(
+    "/harvest-negatives",
+    summary="Harvest Negative Keywords from PPC Data File",
+    status_code=202,
+)
+async def harvest_negatives(
+    session: SessionDep,
+    current_user: OptionalUser,
+    file: UploadFile = File(..., description="XLSX, XLS, or CSV file containing PPC data."),
+    min_clicks: int = Form(10, ge=0, description="Minimum clicks for a search term to be negated."),
+    min_spend: float = Form(0.0, ge=0, description="Minimum spend for a search term to be negated."),
+    max_orders: int = Form(0, ge=0, description="Search terms with at most this many orders are negated."),
+    min_acos: float | None = Form(None, ge=0, description="Also negate terms whose ACOS percentage is at or above this value."),
+    match_type: str = Form("exact", description="Negative match type (exact, phrase, or both)."),
+    idempotency_key: str | None = Header(None, max_length=128, description="Repeats of a request with the same key get the job the first one queued."),
+):
+    """
+    Harvests search terms that spent money without converting and queues an
+    Amazon bulk file of negative keywords for the campaigns and ad groups
+    where the spend was wasted.
+    """
+    logger.info(f"Entered /harvest-negatives endpoint with params: min_clicks={min_clicks}, min_spend={min_spend}, max_orders={max_orders}, match_type={match_type}")
+    negative_options = parse_negative_options(min_clicks, min_spend, max_orders, min_acos, match_type)
+    owner_id = current_user.id if current_user else None
+    job_input = await save_job_input(session, file, owner_id)
+
+    job = await db_pool.run(
+        queue_job,
+        session=session,
+        kind="harvest-negatives",
+        idempotency_key=idempotency_key,
+        owner_id=owner_id,
+        params={**job_input, "negative_options": negative_options},
+    )
+    logger.info(f"Queued negative harvesting job {job.id}")
+    return job_accepted(job, "File queued for negative keyword harvesting")
+
+@ppc_job("harvest-negatives")
+def run_negative_harvesting_job(_session, job: PPCJob, output_path: str, progress: ProgressReporter):
+    with job_input(job) as input_path:
+        compute_pool.run(run_buffered, process_negative_harvesting, input_path, output_path, job.params["negative_options"], progress=progress)
+    logger.info("Negative keyword harvesting completed successfully.")
+
+def parse_negative_options(
+    min_clicks: int,
+    min_spend: float,
+    max_orders: int,
+    min_acos: float | None,
+    match_type: str
+) -> dict[str, Any]:
+    """
+    Validates the negative harvesting form fields and bundles them into the
+    options dict consumed by `build_negative_keyword_rows`.
+    """
+    match_type = (match_type or "exact").strip().lower()
+    if match_type == "both":
+        match_types = list(NEGATIVE_MATCH_TYPES)
+    elif match_type in NEGATIVE_MATCH_TYPES:
+        match_types = [match_type]
+    else:
+        raise HTTPException(status_code=400, detail="Negative match type must be 'exact', 'phrase', or 'both'.")
+
+    return {
+        "min_clicks": min_clicks,
+        "min_spend": min_spend,
+        "max_orders": max_orders,
+        "min_acos": min_acos,
+        "match_types": match_types,
+    }
+
+def read_search_term_inputs(input_path):
+    """
+    Reads the search term report, the Sponsored Products campaigns sheet and
+    the optional ASIN list from the uploaded file (a path or binary file
+    object); the workbook is parsed once for all three sheets.
+
+    Returns:
+        tuple: (search_report, sponsored_products, asin_list) DataFrames
+
+    Raises:
+        ValueError: If the file or one of the required sheets cannot be read.
+    """
+    try:
+        # Read the Search Term Report
+        if spreadsheet_type(input_path) != "csv":
+            with pd.ExcelFile(input_path) as workbook:
+                search_report = workbook.parse("SP Search Term Report")
+                sponsored_products = workbook.parse("Sponsored Products Campaigns")
+                if "ASIN list" in workbook.sheet_names:
+                    asin_list = workbook.parse("ASIN list")
+                else:
+                    logger.warning("ASIN list sheet not found, creating empty DataFrame")
+                    asin_list = pd.DataFrame(columns=["A"])
+        else:
+            # If CSV, we can only read one sheet
+            search_report = pd.read_csv(input_path)
+            sponsored_products = pd.DataFrame()
+            asin_list = pd.DataFrame()
+            logger.warning("Using CSV file format. Only SP Search Term Report data will be processed.")
+
+        logger.info(f"Successfully read {len(search_report)} rows from search report")
     except Exception as e:
-        logger.error(f"Error mining keywords from file {file.filename}: {e}", exc_info=True)
-        # Clean up temporary files if error occurs
-        if os.path.exists(input_path):
-            os.remove(input_path)
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        raise HTTPException(status_code=500, detail=f"Error mining keywords: {e}")
+        raise ValueError(f"Could not read the search term report: {e}") from e
+
+    return search_report, sponsored_products, asin_list
+
+def prepare_search_terms(search_report: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parses the raw search term report once into typed columns shared by the
+    positive miner and the negative harvester.
+
+    Numeric columns that cannot be parsed become NaN, so every comparison
+    against them is False and the row is dropped by the masks downstream.
+    """
+    def column(key, default):
+        letter = SEARCH_TERM_COLUMNS[key]
+        if letter in search_report.columns:
+            return search_report[letter]
+        return pd.Series(default, index=search_report.index)
+
+    terms = pd.DataFrame(index=search_report.index)
+    terms['search_term'] = column('search_term', '').fillna('').astype(str).str.strip()
+    terms['term_lower'] = terms['search_term'].str.lower()
+    terms['keyword_text'] = " " + column('keyword_text', '').fillna('').astype(str).str.lower() + " "
+    terms['campaign_id'] = column('campaign_id', '').fillna('').astype(str)
+    terms['ad_group_id'] = column('ad_group_id', '').fillna('').astype(str)
+    terms['ad_group_name'] = column('ad_group_name', '').fillna('').astype(str)
+    terms['orders'] = pd.to_numeric(column('orders', 0), errors='coerce')
+    terms['acos'] = pd.to_numeric(column('acos', 100), errors='coerce')
+    terms['bid'] = pd.to_numeric(column('bid', 0), errors='coerce')
+    terms['clicks'] = pd.to_numeric(column('clicks', 0), errors='coerce').fillna(0)
+    terms['spend'] = pd.to_numeric(column('spend', 0), errors='coerce').fillna(0.0)
+    terms['sales'] = pd.to_numeric(column('sales', 0), errors='coerce').fillna(0.0)
+    terms['is_asin'] = terms['term_lower'].str.startswith("b0")
+    return terms
+
+def brand_exclusion_mask(terms: pd.DataFrame, excluded_brands: list[str]) -> pd.Series:
+    """Returns True for search terms containing any excluded brand as a whole word."""
+    if not excluded_brands:
+        return pd.Series(False, index=terms.index)
+    pattern = "|".join(re.escape(brand) for brand in excluded_brands)
+    return (" " + terms['term_lower'] + " ").str.contains(pattern, regex=True)
+
+def build_sku_lookup(sponsored_products: pd.DataFrame) -> dict[Any, str]:
+    """
+    Builds a campaign ID -> SKU mapping in one pass over the campaigns sheet
+    ("Multi ASIN" when a campaign advertises several SKUs). Campaigns without
+    a product ad are left out.
+    """
+    if sponsored_products.empty or "D" not in sponsored_products.columns or "V" not in sponsored_products.columns:
+        return {}
+
+    product_ads = sponsored_products[sponsored_products.get("B") == "Product Ad"]
+    skus = product_ads[["D", "V"]].dropna(subset=["V"]).drop_duplicates()
+    lookup = {}
+    for campaign_id, campaign_skus in skus.groupby("D", sort=False)["V"]:
+        lookup[campaign_id] = campaign_skus.iloc[0] if len(campaign_skus) == 1 else "Multi ASIN"
+    return lookup
+
+def normalize_keyword_terms(terms: pd.Series) -> pd.Series:
+    """Lower-cases terms and collapses whitespace so registry keys compare reliably."""
+    return terms.str.lower().str.replace(r"\s+", " ", regex=True).str.strip()
+
+def build_negative_keyword_rows(terms: pd.DataFrame, options: dict[str, Any]) -> pd.DataFrame:
+    """
+    Selects search terms that spent without converting and returns them as
+    Amazon bulk "Negative Keyword" / "Negative Product Targeting" rows.
+
+    Terms are aggregated per campaign and ad group first, so a term that
+    matched several keywords is judged on its combined clicks and spend.
+
+    Args:
+        terms (DataFrame): Output of `prepare_search_terms`.
+        options (dict): Thresholds from `parse_negative_options`.
+
+    Returns:
+        DataFrame: Rows in BULK_COLUMNS order plus the aggregated metrics.
+    """
+    valid = terms[terms['term_lower'] != '']
+    grouped = valid.groupby(['campaign_id', 'ad_group_id', 'term_lower'], sort=False).agg(
+        search_term=('search_term', 'first'),
+        is_asin=('is_asin', 'first'),
+        clicks=('clicks', 'sum'),
+        spend=('spend', 'sum'),
+        sales=('sales', 'sum'),
+        orders=('orders', 'sum'),
+    ).reset_index()
+
+    acos = (grouped['spend'] / grouped['sales'].where(grouped['sales'] > 0)) * 100
+    poor_orders = grouped['orders'] <= options['max_orders']
+    if options.get('min_acos') is not None:
+        poor_orders |= acos.fillna(float('inf')) >= options['min_acos']
+
+    wasted = grouped[
+        (grouped['clicks'] >= options['min_clicks'])
+        & (grouped['spend'] >= options['min_spend'])
+        & poor_orders
+    ]
+    logger.info(f"Found {len(wasted)} wasted-spend search terms out of {len(grouped)} candidates")
+
+    base = pd.DataFrame({
+        "Product": "Sponsored Products",
+        "Operation": "Create",
+        "Campaign ID": wasted['campaign_id'],
+        "Ad Group ID": wasted['ad_group_id'],
+        "State": "enabled",
+        "Clicks": wasted['clicks'],
+        "Spend": wasted['spend'],
+        "Orders": wasted['orders'],
+    })
+
+    frames = []
+    keywords = base[~wasted['is_asin']]
+    for match_type in options['match_types']:
+        frame = keywords.assign(**{
+            "Entity": "Negative Keyword",
+            "Keyword Text": wasted.loc[keywords.index, 'search_term'],
+            "Match Type": NEGATIVE_MATCH_TYPES[match_type],
+        })
+        frames.append(frame)
+
+    asins = base[wasted['is_asin']]
+    frames.append(asins.assign(**{
+        "Entity": "Negative Product Targeting",
+        "Product Targeting Expression": 'asin="' + wasted.loc[asins.index, 'search_term'].str.upper() + '"',
+    }))
+
+    negatives = pd.concat(frames, ignore_index=True)
+    return negatives.reindex(columns=BULK_COLUMNS + ["Clicks", "Spend", "Orders"])
+
+def write_negative_keyword_sheet(writer, negatives: pd.DataFrame):
+    """Writes the bulk negatives sheet and returns the wasted spend they cover."""
+    negatives[BULK_COLUMNS].to_excel(writer, sheet_name="Negative Keywords", index=False)
+    return float(negatives.drop_duplicates(subset=["Campaign ID", "Ad Group ID", "Keyword Text", "Product Targeting Expression"])["Spend"].sum())
+
+def process_negative_harvesting(input_path, output_path, negative_options: dict[str, Any], progress: ProgressReporter | None = None):
+    """
+    Process the uploaded file to harvest negative keywords only.
+
+    Args:
+        input_path (str or file): Path or binary file object of the input file.
+        output_path (str or file): Path or binary file object the processed file is written to.
+        negative_options (dict): Thresholds from `parse_negative_options`.
+        progress (ProgressReporter, optional): Receives the stages of the run.
+    """
+    logger.info(f"Starting negative keyword harvesting with options: {negative_options}")
+    progress = progress or ProgressReporter(None)
+
+    try:
+        progress.stage("reading")
+        search_report, _, _ = read_search_term_inputs(input_path)
+        terms = prepare_search_terms(search_report)
+        progress.stage("harvesting", total=len(terms))
+        negatives = build_negative_keyword_rows(terms, negative_options)
+        progress.advance(len(terms))
+
+        progress.stage("writing")
+        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+            wasted_spend = write_negative_keyword_sheet(writer, negatives)
+            pd.DataFrame({
+                "Type": ["Negative Keywords", "Negative Product Targets", "Wasted Spend Covered"],
+                "Count": [
+                    int((negatives["Entity"] == "Negative Keyword").sum()),
+                    int((negatives["Entity"] == "Negative Product Targeting").sum()),
+                    round(wasted_spend, 2)
+                ]
+            }).to_excel(writer, sheet_name="Summary", index=False)
+
+        logger.info(f"Negative keyword harvesting completed successfully. Results saved to {output_path}")
+
+    except Exception as e:
+        logger.error(f"Error processing negative keyword harvesting: {e}", exc_info=True)
+        raise e
 
 # Function to process the keyword mining
 def process_keyword_mining(
-    input_path: str,
-    output_path: str,
+    input_path,
+    output_path,
     max_acos_threshold: float,
     match_type: str,
-    brands_to_exclude: str
+    brands_to_exclude: str,
+    negative_options: dict[str, Any] | None = None,
+    harvested_lookup: Callable[[list[tuple[str, str, str]]], set[tuple[str, str, str]]] | None = None,
+    cluster_similarity: float | None = None,
+    progress: ProgressReporter | None = None
 ):
     """
     Process the uploaded file to mine keywords based on the specified parameters.
-    
+
     Args:
-        input_path (str): Path to the input file.
-        output_path (str): Path where the processed file will be saved.
+        input_path (str or file): Path or binary file object of the input file.
+        output_path (str or file): Path or binary file object the processed file is written to.
         max_acos_threshold (float): Maximum ACOS threshold for keyword selection.
         match_type (str): Match type for keywords (exact, phrase, or broad).
         brands_to_exclude (str): Comma-separated list of brand names to exclude.
+        negative_options (dict, optional): Thresholds from `parse_negative_options`.
+            When given, negative keywords are harvested from the same report.
+        harvested_lookup (callable, optional): Receives the candidate
+            (sku, term, match_type) keys and returns those already harvested,
+            which are then skipped. Duplicates within the report are also
+            dropped when given.
+        cluster_similarity (float, optional): When given, regular keywords of
+            each SKU are clustered by MinHash similarity at this threshold and
+            campaigns are filled cluster by cluster.
+        progress (ProgressReporter, optional): Receives the stages of the run
+            and one row per mined keyword while campaigns are built.
+
+    Returns:
+        list: (sku, normalized term, match type) keys of the mined keywords.
     """
     logger.info(f"Starting keyword mining with max ACOS: {max_acos_threshold}%, match type: {match_type}")
-    
+    progress = progress or ProgressReporter(None)
+
     try:
         # Get the current date in YYYYMMDD format
         current_date = datetime.now().strftime("%Y%m%d")
-        
+
         # Process brands to exclude
         excluded_brands = []
         if brands_to_exclude:
             excluded_brands = [f" {brand.strip().lower()} " for brand in brands_to_exclude.split(',') if brand.strip()]
             logger.info(f"Excluding brands: {excluded_brands}")
-        
+
         # Read input files
-        try:
-            # Read the Search Term Report
-            if input_path.endswith(('.xlsx', '.xls')):
-                search_report = pd.read_excel(input_path, sheet_name="SP Search Term Report")
-                sponsored_products = pd.read_excel(input_path, sheet_name="Sponsored Products Campaigns")
-                try:
-                    asin_list = pd.read_excel(input_path, sheet_name="ASIN list")
-                except:
-                    logger.warning("ASIN list sheet not found, creating empty DataFrame")
-                    asin_list = pd.DataFrame(columns=["A"])
-            else:
-                # If CSV, we can only read one sheet
-                search_report = pd.read_csv(input_path)
-                sponsored_products = pd.DataFrame()
-                asin_list = pd.DataFrame()
-                logger.warning("Using CSV file format. Only SP Search Term Report data will be processed.")
-            
-            logger.info(f"Successfully read {len(search_report)} rows from search report")
-        except Exception as e:
-            logger.error(f"Error reading input file: {e}")
-            # Create sample data for demonstration
-            search_report = pd.DataFrame({
-                "P": ["sample search term 1", "sample search term 2"],
-                "V": [2, 1],  # Orders
-                "Y": [10, 20],  # ACOS
-                "L": ["keyword 1", "keyword 2"],
-                "B": ["campaign1", "campaign2"],
-                "F": ["Ad Group 1", "Ad Group 2"],
-                "Z": [0.25, 0.30]  # Bid
-            })
-            sponsored_products = pd.DataFrame({
-                "D": ["campaign1", "campaign1", "campaign2"],
-                "B": ["Campaign", "Product Ad", "Product Ad"],
-                "V": ["SKU1", "", "SKU2"]
-            })
-            asin_list = pd.DataFrame({"A": ["B000000001", "B000000002"]})
-            logger.warning("Using sample data due to file read error.")
-        
+        progress.stage("reading")
+        search_report, sponsored_products, asin_list = read_search_term_inputs(input_path)
+        terms = prepare_search_terms(search_report)
+        progress.stage("selecting keywords", total=len(terms))
+
         # Collections to store keywords by SKU
         sku_keywords = {}  # Regular keywords
         targeting_keywords = {}  # B0 terms (ASINs)
-        
+
         # Step 1: Collect keywords by SKU
-        for _, row in search_report.iterrows():
-            try:
-                # Get values from row
-                search_term = str(row.get("P", "")).strip()
-                orders = int(row.get("V", 0))
-                acos = float(row.get("Y", 100))
-                keyword_text = f" {str(row.get('L', '')).lower()} "
-                
-                # Filter by ACOS threshold and orders
-                if orders >= 1 and acos < max_acos_threshold:
-                    # Check if search term is in keyword text
-                    if search_term.lower() not in keyword_text:
-                        # Check if we should exclude this term based on brand names
-                        exclude = False
-                        for brand in excluded_brands:
-                            if brand in f" {search_term.lower()} ":
-                                exclude = True
-                                break
-                        
-                        if not exclude:
-                            campaign_id = str(row.get("B", ""))
-                            ad_group_name = str(row.get("F", ""))
-                            bid = float(row.get("Z", 0))
-                            
-                            # Get SKU using helper function
-                            sku = get_sku(sponsored_products, campaign_id)
-                            
-                            # Create keyword info array
-                            keyword_info = [search_term, orders, bid, ad_group_name]
-                            
-                            # Check if it's a B0 term (ASIN)
-                            if search_term.lower().startswith("b0"):
-                                # Check if this is one of our own products
-                                is_own_product = False
-                                for _, asin_row in asin_list.iterrows():
-                                    if str(asin_row.get("A", "")).upper() == search_term.upper():
-                                        is_own_product = True
-                                        break
-                                
-                                if not is_own_product:
-                                    # Add to targeting keywords
-                                    if sku not in targeting_keywords:
-                                        targeting_keywords[sku] = []
-                                    targeting_keywords[sku].append(keyword_info)
-                            else:
-                                # Add to regular keywords
-                                sku_key = f"{sku}|{orders}"
-                                if sku_key not in sku_keywords:
-                                    sku_keywords[sku_key] = []
-                                sku_keywords[sku_key].append(keyword_info)
-            except Exception as e:
-                logger.error(f"Error processing row: {e}")
-                continue
-        
+        # Filter by ACOS threshold and orders, drop terms already covered by
+        # the keyword that triggered them, and drop excluded brands
+        already_targeted = pd.Series(
+            [term in keyword for term, keyword in zip(terms['term_lower'], terms['keyword_text'], strict=True)],
+            index=terms.index, dtype=bool
+        )
+        candidates = terms[
+            (terms['orders'] >= 1)
+            & (terms['acos'] < max_acos_threshold)
+            & ~already_targeted
+            & ~brand_exclusion_mask(terms, excluded_brands)
+        ]
+
+        # Skip our own products when targeting ASINs
+        own_asins = set()
+        if "A" in asin_list.columns:
+            own_asins = set(asin_list["A"].astype(str).str.upper())
+        candidates = candidates[~(candidates['is_asin'] & candidates['search_term'].str.upper().isin(own_asins))]
+
+        # Registry keys: ASIN targets are recorded under their own match type
+        sku_lookup = build_sku_lookup(sponsored_products)
+        candidates = candidates.assign(
+            sku=candidates['campaign_id'].map(lambda campaign_id: sku_lookup.get(campaign_id, "Not Found")),
+            registry_term=normalize_keyword_terms(candidates['search_term']),
+            registry_match_type=candidates['is_asin'].map({True: "asin", False: match_type.lower()}),
+        )
+        key_columns = ['sku', 'registry_term', 'registry_match_type']
+
+        # Skip keywords harvested in earlier runs with one bulk anti-join
+        if harvested_lookup is not None:
+            candidates = candidates.drop_duplicates(subset=key_columns)
+            candidate_keys = list(candidates[key_columns].itertuples(index=False, name=None))
+            known_keys = harvested_lookup(candidate_keys)
+            if known_keys:
+                already_harvested = [key in known_keys for key in candidate_keys]
+                candidates = candidates[~pd.Series(already_harvested, index=candidates.index)]
+            logger.info(f"Skipped {len(known_keys)} previously harvested keywords")
+        harvested_keys = list(candidates[key_columns].drop_duplicates().itertuples(index=False, name=None))
+
+        # Cluster regular keywords within each SKU / order bucket
+        cluster_labels = pd.Series(-1, index=candidates.index)
+        if cluster_similarity is not None:
+            progress.stage("clustering")
+            regular = candidates[~candidates['is_asin']]
+            buckets = regular['sku'].astype(str) + "|" + regular['orders'].astype(int).astype(str)
+            cluster_labels.loc[regular.index] = cluster_similar_terms(
+                regular['registry_term'], buckets, cluster_similarity
+            )
+        candidates = candidates.assign(cluster=cluster_labels)
+        progress.stage("building campaigns", total=len(candidates))
+
+        for row in candidates.itertuples(index=False):
+            sku = row.sku
+            orders = int(row.orders)
+
+            # Create keyword info array
+            keyword_info = [row.search_term, orders, row.bid, row.ad_group_name]
+            if row.cluster >= 0:
+                keyword_info.append(row.cluster)
+
+            if row.is_asin:
+                # Add to targeting keywords
+                targeting_keywords.setdefault(sku, []).append(keyword_info)
+            else:
+                # Add to regular keywords
+                sku_keywords.setdefault(f"{sku}|{orders}", []).append(keyword_info)
+
         # Create Excel writer for output
         writer = pd.ExcelWriter(output_path, engine='openpyxl')
-        
+
         # Create DataFrames for each sheet
-        high_df = pd.DataFrame(columns=[
-            "Product", "Entity", "Operation", "Campaign ID", "Ad Group ID", 
-            "Portfolio ID", "Ad ID", "Keyword ID", "Product Targeting ID", 
-            "Campaign Name", "Ad Group Name", "Start Date", "End Date", 
-            "Targeting Type", "State", "Daily Budget", "SKU", 
-            "Ad Group Default Bid", "Bid", "Keyword Text", 
-            "Native Language Keyword", "Native Language Locale", 
-            "Match Type", "Bidding Strategy", "Placement", 
-            "Percentage", "Product Targeting Expression"
-        ])
-        
-        high_review_df = pd.DataFrame(columns=[
-            "Review Needed", "Product", "Entity", "Operation", "Campaign ID", 
-            "Ad Group ID", "Portfolio ID", "Ad ID", "Keyword ID", 
-            "Product Targeting ID", "Campaign Name", "Ad Group Name", 
-            "Start Date", "End Date", "Targeting Type", "State", 
-            "Daily Budget", "SKU", "Ad Group Default Bid", "Bid", 
-            "Keyword Text", "Native Language Keyword", "Native Language Locale", 
-            "Match Type", "Bidding Strategy", "Placement", 
-            "Percentage", "Product Targeting Expression"
-        ])
-        
+        high_df = pd.DataFrame(columns=BULK_COLUMNS)
+        high_review_df = pd.DataFrame(columns=BULK_REVIEW_COLUMNS)
+
         low_df = high_df.copy()
         low_review_df = high_review_df.copy()
         product_targets_df = high_df.copy()
         product_targets_review_df = high_review_df.copy()
-        
+
         # Write regular keywords
         high_row = 0
         high_review_row = 0
         low_row = 0
         low_review_row = 0
-        
+
         for sku_key, keywords in sku_keywords.items():
             sku, orders_str = sku_key.split('|')
             orders = int(orders_str)
-            
+            progress.advance(len(keywords))
+
             # Determine target DataFrame
             if orders >= 3:
                 if sku == "Multi ASIN":
@@ -895,19 +1954,17 @@ def process_keyword_mining(
                 else:
                     target_df = low_df
                     row_index = low_row
-            
+
             campaign_count = 0
-            keyword_count = 0
             new_id = ""
-            
-            for keyword_info in keywords:
-                if keyword_count % 10 == 0:
+
+            for keyword_info, starts_campaign in iter_campaign_breaks(keywords):
+                if starts_campaign:
                     campaign_count += 1
-                    keyword_count = 0
-                    
+
                     # Create campaign
                     new_id = f"{sku} - SP {match_type} - {campaign_count}"
-                    
+
                     # Add campaign row
                     campaign_row = {}
                     if sku == "Multi ASIN":
@@ -933,10 +1990,10 @@ def process_keyword_mining(
                         campaign_row["State"] = "enabled"
                         campaign_row["Daily Budget"] = 10
                         campaign_row["Bidding Strategy"] = "Dynamic bids - down only"
-                    
+
                     target_df.loc[row_index] = campaign_row
                     row_index += 1
-                    
+
                     # Add ad group row
                     ad_group_row = {}
                     if sku == "Multi ASIN":
@@ -958,10 +2015,10 @@ def process_keyword_mining(
                         ad_group_row["Ad Group Name"] = new_id
                         ad_group_row["State"] = "enabled"
                         ad_group_row["Ad Group Default Bid"] = 1
-                    
+
                     target_df.loc[row_index] = ad_group_row
                     row_index += 1
-                    
+
                     # Add product ad row
                     product_ad_row = {}
                     if sku == "Multi ASIN":
@@ -981,10 +2038,10 @@ def process_keyword_mining(
                         product_ad_row["Ad Group ID"] = new_id
                         product_ad_row["State"] = "enabled"
                         product_ad_row["SKU"] = sku
-                    
+
                     target_df.loc[row_index] = product_ad_row
                     row_index += 1
-                
+
                 # Add keyword row
                 keyword_row = {}
                 if sku == "Multi ASIN":
@@ -1008,11 +2065,10 @@ def process_keyword_mining(
                     keyword_row["Bid"] = keyword_info[2]
                     keyword_row["Keyword Text"] = keyword_info[0]
                     keyword_row["Match Type"] = match_type
-                
+
                 target_df.loc[row_index] = keyword_row
                 row_index += 1
-                keyword_count += 1
-            
+
             # Update the row index
             if orders >= 3:
                 if sku == "Multi ASIN":
@@ -1024,31 +2080,32 @@ def process_keyword_mining(
                     low_review_row = row_index
                 else:
                     low_row = row_index
-        
+
         # Write targeting keywords (B0 ASINs)
         b0_row = 0
         b0_review_row = 0
-        
+
         for sku, keywords in targeting_keywords.items():
+            progress.advance(len(keywords))
             if sku == "Multi ASIN":
                 target_df = product_targets_review_df
                 row_index = b0_review_row
             else:
                 target_df = product_targets_df
                 row_index = b0_row
-            
+
             campaign_count = 0
             keyword_count = 0
             new_id = ""
-            
+
             for keyword_info in keywords:
                 if keyword_count % 10 == 0:
                     campaign_count += 1
                     keyword_count = 0
-                    
+
                     # Create campaign
                     new_id = f"{sku} - SP ASIN - {campaign_count}"
-                    
+
                     # Add campaign row
                     campaign_row = {}
                     if sku == "Multi ASIN":
@@ -1074,10 +2131,10 @@ def process_keyword_mining(
                         campaign_row["State"] = "enabled"
                         campaign_row["Daily Budget"] = 10
                         campaign_row["Bidding Strategy"] = "Dynamic bids - down only"
-                    
+
                     target_df.loc[row_index] = campaign_row
                     row_index += 1
-                    
+
                     # Add ad group row
                     ad_group_row = {}
                     if sku == "Multi ASIN":
@@ -1099,10 +2156,10 @@ def process_keyword_mining(
                         ad_group_row["Ad Group Name"] = new_id
                         ad_group_row["State"] = "enabled"
                         ad_group_row["Ad Group Default Bid"] = 1
-                    
+
                     target_df.loc[row_index] = ad_group_row
                     row_index += 1
-                    
+
                     # Add product ad row
                     product_ad_row = {}
                     if sku == "Multi ASIN":
@@ -1122,10 +2179,10 @@ def process_keyword_mining(
                         product_ad_row["Ad Group ID"] = new_id
                         product_ad_row["State"] = "enabled"
                         product_ad_row["SKU"] = sku
-                    
+
                     target_df.loc[row_index] = product_ad_row
                     row_index += 1
-                
+
                 # Add product targeting row
                 targeting_row = {}
                 if sku == "Multi ASIN":
@@ -1147,183 +2204,481 @@ def process_keyword_mining(
                     targeting_row["State"] = "enabled"
                     targeting_row["Bid"] = keyword_info[2]
                     targeting_row["Product Targeting Expression"] = f'asin="{keyword_info[0]}"'
-                
+
                 target_df.loc[row_index] = targeting_row
                 row_index += 1
                 keyword_count += 1
-            
+
             # Update the row index
             if sku == "Multi ASIN":
                 b0_review_row = row_index
             else:
                 b0_row = row_index
-        
+
         # Write DataFrames to Excel
+        progress.stage("writing")
         high_df.to_excel(writer, sheet_name="3+ Orders", index=False)
         high_review_df.to_excel(writer, sheet_name="3+ Orders - Review", index=False)
         low_df.to_excel(writer, sheet_name="1-2 Orders", index=False)
         low_review_df.to_excel(writer, sheet_name="1-2 Orders - Review", index=False)
         product_targets_df.to_excel(writer, sheet_name="Product Targets", index=False)
         product_targets_review_df.to_excel(writer, sheet_name="Product Targets - Review", index=False)
-        
+
+        # Harvest negatives from the same parsed report
+        summary_types = ["Regular Keywords", "ASIN Targets", "Total"]
+        summary_counts = [
+            sum(len(keywords) for keywords in sku_keywords.values()),
+            sum(len(keywords) for keywords in targeting_keywords.values()),
+            sum(len(keywords) for keywords in sku_keywords.values()) +
+            sum(len(keywords) for keywords in targeting_keywords.values())
+        ]
+        if negative_options is not None:
+            negatives = build_negative_keyword_rows(terms, negative_options)
+            wasted_spend = write_negative_keyword_sheet(writer, negatives)
+            summary_types += ["Negative Keywords", "Negative Product Targets", "Wasted Spend Covered"]
+            summary_counts += [
+                int((negatives["Entity"] == "Negative Keyword").sum()),
+                int((negatives["Entity"] == "Negative Product Targeting").sum()),
+                round(wasted_spend, 2)
+            ]
+
         # Add a summary sheet
         summary_df = pd.DataFrame({
-            "Type": ["Regular Keywords", "ASIN Targets", "Total"],
-            "Count": [
-                sum(len(keywords) for keywords in sku_keywords.values()),
-                sum(len(keywords) for keywords in targeting_keywords.values()),
-                sum(len(keywords) for keywords in sku_keywords.values()) + 
-                sum(len(keywords) for keywords in targeting_keywords.values())
-            ]
+            "Type": summary_types,
+            "Count": summary_counts
         })
         summary_df.to_excel(writer, sheet_name="Summary", index=False)
-        
+
         # Save the Excel file
         writer.close()
-        
+
         logger.info(f"Keyword mining completed successfully. Results saved to {output_path}")
-        
+        return harvested_keys
+
     except Exception as e:
         logger.error(f"Error processing keyword mining: {e}", exc_info=True)
         raise e
 
-def get_sku(sponsored_products, campaign_id):
+def minhash_signatures(terms: pd.Series, num_perm: int = MINHASH_PERMUTATIONS, seed: int = 1) -> np.ndarray:
+    """
+    Computes MinHash signatures of search terms over their words and the
+    character trigrams of those words.
+
+    Since the MinHash of a union is the element-wise minimum of the parts'
+    MinHashes, each distinct word is hashed once and a term's signature is
+    the minimum over its words, taken with `np.minimum.reduceat` in bounded
+    chunks.
+
+    Returns:
+        ndarray: uint32 array of shape (len(terms), num_perm).
+    """
+    signatures = np.full((len(terms), num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    words = terms.reset_index(drop=True).str.split().explode().dropna()
+    if words.empty:
+        return signatures
+
+    word_ids, vocabulary = pd.factorize(words)
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MINHASH_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, MINHASH_PRIME, num_perm, dtype=np.uint64)
+
+    # Shingles of each distinct word: the word itself plus its padded trigrams
+    shingle_words, shingle_hashes = [], []
+    for word_id, word in enumerate(vocabulary):
+        padded = f" {word} "
+        for shingle in [f"w:{word}"] + [padded[i:i + 3] for i in range(len(padded) - 2)]:
+            shingle_words.append(word_id)
+            shingle_hashes.append(zlib.crc32(shingle.encode("utf-8")))
+    hashes = np.array(shingle_hashes, dtype=np.uint64)
+    permuted = ((hashes[:, None] * a + b) % np.uint64(MINHASH_PRIME)).astype(np.uint32)
+    word_starts = np.flatnonzero(np.diff(np.array(shingle_words), prepend=-1))
+    word_signatures = np.minimum.reduceat(permuted, word_starts, axis=0).T.copy()
+
+    # Reduce word signatures into term signatures (permutation-major for speed)
+    rows = words.index.to_numpy()
+    term_starts = np.searchsorted(rows, np.arange(len(terms) + 1))
+    chunk = 50_000
+    for first in range(0, len(terms), chunk):
+        last = min(first + chunk, len(terms))
+        present = np.arange(first, last)[term_starts[first:last] < term_starts[first + 1:last + 1]]
+        if len(present) == 0:
+            continue
+        window = word_signatures[:, word_ids[term_starts[first]:term_starts[last]]]
+        signatures[present] = np.minimum.reduceat(window, term_starts[present] - term_starts[first], axis=1).T
+    return signatures
+
+def lsh_band_layout(num_perm: int, threshold: float):
+    """Picks the (bands, rows) split whose LSH threshold (1/b)^(1/r) is closest to `threshold`."""
+    layouts = [(bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    return min(layouts, key=lambda layout: abs((1 / layout[0]) ** (1 / layout[1]) - threshold))
+
+def cluster_similar_terms(terms: pd.Series, buckets: pd.Series, threshold: float) -> np.ndarray:
+    """
+    Clusters terms by estimated Jaccard similarity with MinHash and LSH.
+
+    Terms only join a cluster with terms from the same bucket (SKU and
+    order band). Candidate pairs come from LSH band collisions and are
+    kept only if their signature agreement reaches `threshold`, so the
+    work stays near-linear in the number of terms.
+
+    Returns:
+        ndarray: Cluster label per term (the position of the cluster's
+        first term), aligned with `terms`.
+    """
+    count = len(terms)
+    labels = np.arange(count)
+    if count < 2:
+        return labels
+
+    signatures = minhash_signatures(terms)
+    bucket_codes = pd.factorize(buckets)[0].astype(np.uint64)
+    bands, rows = lsh_band_layout(signatures.shape[1], threshold)
+
+    sources, targets = [], []
+    positions = pd.Series(np.arange(count))
+    for band in range(bands):
+        band_key = bucket_codes.copy()
+        for column in range(band * rows, (band + 1) * rows):
+            band_key = band_key * np.uint64(1000003) + signatures[:, column].astype(np.uint64)
+        # Link every term to the first term that landed in the same LSH bucket
+        representatives = positions.groupby(pd.factorize(band_key)[0]).transform('first').to_numpy()
+        linked = np.flatnonzero(representatives != labels)
+        if len(linked) == 0:
+            continue
+        similarity = (signatures[linked] == signatures[representatives[linked]]).mean(axis=1)
+        verified = linked[similarity >= threshold]
+        sources.append(verified)
+        targets.append(representatives[verified])
+
+    if not sources:
+        return labels
+    linked_from = np.concatenate(sources)
+    linked_to = np.concatenate(targets)
+
+    # Connected components by min-label propagation with pointer jumping
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, linked_from, labels[linked_to])
+        np.minimum.at(updated, linked_to, labels[linked_from])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+def iter_campaign_breaks(keywords: list[list[Any]], ad_group_size: int = 10):
     """
-    Gets the SKU for a campaign ID from the sponsored products DataFrame.
-    Returns "Multi ASIN" if multiple SKUs found, or "Not Found" if none.
-    
+    Yields (keyword_info, starts_campaign) in the order keywords are written.
+
+    Without cluster labels, a new campaign starts every `ad_group_size`
+    keywords, in report order. When keyword_info carries a cluster label
+    (5th element), keywords are written cluster by cluster, largest first;
+    a cluster too big for one ad group fills several, and a new campaign is
+    started whenever the next cluster does not fit in the current one.
+    """
+    if not keywords or len(keywords[0]) < 5:
+        for position, keyword_info in enumerate(keywords):
+            yield keyword_info, position % ad_group_size == 0
+        return
+
+    clusters: dict[Any, list[list[Any]]] = {}
+    for keyword_info in keywords:
+        clusters.setdefault(keyword_info[4], []).append(keyword_info)
+
+    used = 0
+    for cluster in sorted(clusters.values(), key=len, reverse=True):
+        if used and used + len(cluster) > ad_group_size:
+            used = 0
+        for keyword_info in cluster:
+            if used == ad_group_size:
+                used = 0
+            yield keyword_info, used == 0
+            used += 1
+
+@router.post(
+    "/ngram-analysis",
+    summary="Analyze Search Term N-gram Performance",
+)
+async def ngram_analysis(
+    request: Request,
+    file: UploadFile = File(..., description="XLSX, XLS, or CSV file containing the SP Search Term Report."),
+    ngram_sizes: str = Form("1,2,3", description="Comma-separated n-gram sizes to analyze (1 to 5)."),
+    sort_by: str = Form("spend", description="Metric to rank n-grams by (spend, sales, orders, clicks, acos, search_terms)."),
+    top_n: int = Form(25, ge=1, le=500, description="Number of n-grams returned at each end of the ranking."),
+    min_search_terms: int = Form(2, ge=1, description="Minimum number of search terms an n-gram must appear in."),
+):
+    """
+    Aggregates spend, sales, orders, clicks and ACOS by 1-, 2- and 3-word
+    n-grams across the whole search term report, and returns the top and
+    bottom n-grams by the chosen metric. Useful for spotting wasteful or
+    winning modifiers such as "cheap" or "for kids". The analysis stops if
+    the client disconnects.
+    """
+    logger.info(f"Entered /ngram-analysis endpoint with params: ngram_sizes={ngram_sizes}, sort_by={sort_by}, top_n={top_n}")
+    try:
+        sizes = sorted({int(size) for size in ngram_sizes.split(',') if size.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="N-gram sizes must be comma-separated integers.")
+    if not sizes or sizes[0] < 1 or sizes[-1] > 5:
+        raise HTTPException(status_code=400, detail="N-gram sizes must be between 1 and 5.")
+    if sort_by not in NGRAM_METRICS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of: {', '.join(NGRAM_METRICS)}.")
+
+    upload = await save_upload(file, in_memory=True)
+    try:
+        results = await run_until_disconnected(
+            request, analyze_ngram_report, upload_source(upload), sizes, sort_by, top_n, min_search_terms
+        )
+        return JSONResponse(content=results)
+
+    except HTTPException:
+        raise
+    except ComputePoolSaturated as e:
+        logger.warning(f"Rejected n-gram analysis: {e}")
+        raise HTTPException(status_code=503, detail="The server is busy processing other files. Please try again shortly.", headers={"Retry-After": "10"})
+    except ValueError as ve:
+        logger.error(f"Value error during n-gram analysis: {ve}")
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Error analyzing n-grams from file {file.filename}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error analyzing n-grams: {e}")
+    finally:
+        await file_io_pool.run(discard_upload, upload)
+
+def analyze_ngram_report(
+    input_path,
+    sizes: list[int],
+    sort_by: str,
+    top_n: int,
+    min_search_terms: int,
+    progress: ProgressReporter | None = None
+) -> dict[str, Any]:
+    """
+    Reads an uploaded search term report (a path, or its bytes when the upload
+    was kept in memory) and runs `process_ngram_analysis` on it.
+    """
+    progress = progress or ProgressReporter(None)
+    progress.stage("reading")
+    source = io.BytesIO(input_path) if isinstance(input_path, bytes) else input_path
+    search_report = read_search_term_report(source)
+    return process_ngram_analysis(search_report, sizes, sort_by, top_n, min_search_terms, progress=progress)
+
+def read_search_term_report(source) -> pd.DataFrame:
+    """
+    Reads only the "SP Search Term Report" sheet (or the whole CSV).
+
+    Raises:
+        ValueError: If the report cannot be read.
+    """
+    try:
+        if spreadsheet_type(source) != "csv":
+            return pd.read_excel(source, sheet_name="SP Search Term Report")
+        return pd.read_csv(source)
+    except Exception as e:
+        raise ValueError(f"Could not read the SP Search Term Report: {e}")
+
+def explode_ngrams(tokens: pd.DataFrame, n: int) -> pd.DataFrame:
+    """
+    Builds all n-grams of size `n` from a frame of one token per row.
+
+    Args:
+        tokens (DataFrame): Columns 'row' (search term index) and 'code'
+            (integer token id), in word order within each search term.
+        n (int): N-gram size.
+
+    Returns:
+        DataFrame: Columns 'row' and 'w0'..'w{n-1}' (token ids), one entry
+        per distinct n-gram of each search term.
+    """
+    grams = pd.DataFrame({'row': tokens['row'], 'w0': tokens['code']})
+    valid = pd.Series(True, index=tokens.index)
+    for offset in range(1, n):
+        # Shifting the token column lines up the next word of the same term
+        valid &= tokens['row'].shift(-offset) == tokens['row']
+        grams[f'w{offset}'] = tokens['code'].shift(-offset, fill_value=-1)
+    return grams[valid].drop_duplicates()
+
+def process_ngram_analysis(
+    search_report: pd.DataFrame,
+    ngram_sizes: list[int],
+    sort_by: str,
+    top_n: int,
+    min_search_terms: int,
+    progress: ProgressReporter | None = None
+) -> dict[str, Any]:
+    """
+    Aggregates search term performance by n-gram.
+
+    The search term column is tokenized and factorized to integer ids once;
+    n-grams are built with column shifts over those ids and aggregated with
+    groupby, so there is no per-term Python loop. Only the n-grams returned
+    are turned back into text.
+
     Args:
-        sponsored_products (DataFrame): The sponsored products DataFrame
-        campaign_id (str): The campaign ID to look up
-    
+        search_report (DataFrame): Raw SP Search Term Report.
+        ngram_sizes (list): N-gram sizes to analyze.
+        sort_by (str): Metric from NGRAM_METRICS to rank by.
+        top_n (int): Number of n-grams returned at each end of the ranking.
+        min_search_terms (int): Minimum distinct search terms per n-gram.
+        progress (ProgressReporter): Receives one stage per n-gram size.
+
     Returns:
-        str: The SKU, "Multi ASIN", or "Not Found"
-    """
-    if sponsored_products.empty:
-        return "Not Found"
-    
-    # Filter rows by campaign ID and Product Ad entity type
-    filtered = sponsored_products[(sponsored_products.get("D") == campaign_id) & 
-                                  (sponsored_products.get("B") == "Product Ad")]
-    
-    if filtered.empty:
-        return "Not Found"
-    
-    # Get unique SKUs
-    skus = filtered["V"].dropna().unique()
-    
-    if len(skus) == 0:
-        return "Not Found"
-    elif len(skus) == 1:
-        return skus[0]
-    else:
-        return "Multi ASIN"
+        dict: Per-size "top" and "bottom" rankings plus a summary.
+    """
+    logger.info(f"Starting n-gram analysis for {len(search_report)} rows, sizes: {ngram_sizes}")
+    progress = progress or ProgressReporter(None)
+    progress.stage("tokenizing")
+    terms = prepare_search_terms(search_report)
+    metrics = pd.DataFrame({
+        'clicks': terms['clicks'],
+        'spend': terms['spend'],
+        'sales': terms['sales'],
+        'orders': terms['orders'].fillna(0),
+    })
+
+    tokens = terms['term_lower'].str.split().explode().dropna()
+    codes, vocabulary = pd.factorize(tokens)
+    tokens = pd.DataFrame({'row': tokens.index, 'code': codes})
+
+    results = {}
+    for n in ngram_sizes:
+        progress.stage(f"{n}-grams")
+        word_columns = [f'w{offset}' for offset in range(n)]
+        grams = explode_ngrams(tokens, n)
+        grams = grams.join(metrics, on='row')
+        aggregated = grams.groupby(word_columns, sort=False).agg(
+            search_terms=('row', 'size'),
+            clicks=('clicks', 'sum'),
+            spend=('spend', 'sum'),
+            sales=('sales', 'sum'),
+            orders=('orders', 'sum'),
+        )
+        aggregated = aggregated[aggregated['search_terms'] >= min_search_terms]
+        aggregated['acos'] = (aggregated['spend'] / aggregated['sales'].where(aggregated['sales'] > 0) * 100).round(2)
+        aggregated[['spend', 'sales']] = aggregated[['spend', 'sales']].round(2)
+
+        # N-grams without sales have no ACOS; they rank as the worst ACOS
+        ranking = aggregated.sort_values(sort_by, ascending=False, na_position='first' if sort_by == 'acos' else 'last', kind='stable')
+        results[str(n)] = {
+            "ngram_count": len(aggregated),
+            "top": ngram_records(ranking.head(top_n), vocabulary),
+            "bottom": ngram_records(ranking.tail(top_n).iloc[::-1], vocabulary),
+        }
+
+    logger.info("N-gram analysis completed successfully.")
+    return {
+        "sort_by": sort_by,
+        "ngrams": results,
+        "summary": {
+            "search_term_rows": len(terms),
+            "total_spend": round(float(metrics['spend'].sum()), 2),
+            "total_sales": round(float(metrics['sales'].sum()), 2),
+        },
+    }
+
+def ngram_records(frame: pd.DataFrame, vocabulary) -> list[dict[str, Any]]:
+    """Converts an aggregated n-gram frame into JSON-safe records with n-gram text."""
+    frame = frame.reset_index()
+    word_columns = [column for column in frame.columns if str(column).startswith('w') and str(column)[1:].isdigit()]
+    words = [vocabulary.take(frame[column].to_numpy()) for column in word_columns]
+    ngrams = [" ".join(parts) for parts in zip(*words, strict=True)]
+    frame = frame.drop(columns=word_columns).astype(object)
+    frame.insert(0, 'ngram', ngrams)
+    records: list[dict[str, Any]] = frame.where(frame.notna(), None).to_dict(orient="records")
+    return records
 
 @router.post(
     "/create-campaigns",
     summary="Create Amazon PPC Campaigns",
+    status_code=202,
 )
 async def create_campaigns(
-    background_tasks: BackgroundTasks,
-    campaigns: Dict[str, List[Dict[str, Any]]],
+    session: SessionDep,
+    current_user: OptionalUser,
+    campaigns: dict[str, list[dict[str, Any]]],
+    idempotency_key: str | None = Header(None, max_length=128, description="Repeats of a request with the same key get the job the first one queued."),
 ):
     """
     Creates new Amazon PPC campaigns based on user input.
-    
+
     Each campaign can be either automatic or manual, with different targeting options.
-    Returns an Excel template that can be uploaded to Amazon.
+    The Excel template that can be uploaded to Amazon is built by a background
+    job; poll `/jobs/{job_id}` for its download ID.
     """
     logger.info(f"Entered /create-campaigns endpoint with {len(campaigns.get('campaigns', []))} campaigns")
-    download_id = str(uuid.uuid4())
-    output_path = os.path.join(TEMP_DIR, f"{download_id}")  # Format to match what download endpoint expects
-    
-    try:
-        logger.info("Processing campaign data...")
-        # Process the campaign data
-        process_campaign_creation(
-            output_path,
-            campaigns.get('campaigns', [])
-        )
-        logger.info("Campaign creation completed successfully.")
-        
-        # Schedule cleanup
-        schedule_file_cleanup(background_tasks, output_path, delay=3600)
-        
-        return {
-            "message": "Campaigns created successfully",
-            "download_id": download_id
-        }
-    
-    except Exception as e:
-        logger.error(f"Error creating campaigns: {e}", exc_info=True)
-        # Clean up temporary files if error occurs
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        raise HTTPException(status_code=500, detail=f"Error creating campaigns: {e}")
+    job = await db_pool.run(
+        queue_job,
+        session=session,
+        kind="create-campaigns",
+        idempotency_key=idempotency_key,
+        owner_id=current_user.id if current_user else None,
+        params={"campaigns": campaigns.get('campaigns', [])},
+    )
+    logger.info(f"Queued campaign creation job {job.id}")
+    return job_accepted(job, "Campaigns queued for creation")
+
+@ppc_job("create-campaigns")
+def run_campaign_creation_job(_session, job: PPCJob, output_path: str, progress: ProgressReporter):
+    compute_pool.run(run_buffered, process_campaign_creation, None, output_path, job.params["campaigns"], progress=progress)
+    logger.info("Campaign creation completed successfully.")
 
-def process_campaign_creation(output_path: str, campaigns_data: List[Dict[str, Any]]):
+def process_campaign_creation(output_path, campaigns_data: list[dict[str, Any]], progress: ProgressReporter | None = None):
     """
     Process campaign data and create an Excel file with campaigns.
-    
+
     Args:
-        output_path (str): Path where the processed file will be saved.
+        output_path (str or file): Path or binary file object the processed file is written to.
         campaigns_data (List[Dict]): List of campaign configurations.
+        progress (ProgressReporter, optional): Receives one row per campaign.
     """
     logger.info(f"Starting campaign creation process for {len(campaigns_data)} campaigns")
-    
+    progress = progress or ProgressReporter(None)
+
     try:
         # Get current date in YYYYMMDD format
         current_date = datetime.now().strftime("%Y%m%d")
-        
+
         # Create Excel writer for output
         writer = pd.ExcelWriter(output_path, engine='openpyxl')
-        
+
         # Create the output DataFrame with appropriate headers
-        output_df = pd.DataFrame(columns=[
-            "Product", "Entity", "Operation", "Campaign ID", "Ad Group ID", 
-            "Portfolio ID", "Ad ID", "Keyword ID", "Product Targeting ID", 
-            "Campaign Name", "Ad Group Name", "Start Date", "End Date", 
-            "Targeting Type", "State", "Daily Budget", "SKU", 
-            "Ad Group Default Bid", "Bid", "Keyword Text", 
-            "Native Language Keyword", "Native Language Locale", 
-            "Match Type", "Bidding Strategy", "Placement", 
-            "Percentage", "Product Targeting Expression"
-        ])
-        
+        output_df = pd.DataFrame(columns=BULK_COLUMNS)
+
         # Process each campaign
         campaign_counter = 0
         current_row = 0
-        
+
+        progress.stage("creating campaigns", total=len(campaigns_data))
         for campaign_data in campaigns_data:
             campaign_counter += 1
-            
+            progress.advance()
+
             sku = campaign_data.get('sku', '')
             product_identifier = campaign_data.get('productIdentifier', '')
             is_auto_campaign = campaign_data.get('isAutoCampaign', True)
             match_type = campaign_data.get('matchType', 'exact')
-            
+
             # Capitalize match type for display
             display_match_type = match_type.capitalize()
-            
+
             # Generate IDs and names based on campaign type
             if not is_auto_campaign:
                 campaign_id = f"{product_identifier} - SP {display_match_type} - {campaign_counter}"
                 ad_group_id = f"{product_identifier} - SP {display_match_type} - {campaign_counter}"
-                
+
                 # Get keywords
                 keywords = campaign_data.get('keywords', '').split(',')
                 keywords = [k.strip() for k in keywords if k.strip()]
             else:
                 # Auto campaign - handle targeting types
                 targeting_types = campaign_data.get('targetingTypes', [])
-                
+
                 # Remove 'all' if present as it's just for UI
                 if 'all' in targeting_types:
                     targeting_types.remove('all')
-                
+
                 # All available targeting types
                 all_types = ["close-match", "loose-match", "substitutes", "complements"]
-                
+
                 # Format targeting name for campaign name
                 if len(targeting_types) == 4 or "all" in targeting_types:
                     targeting_name = "All"
@@ -1340,15 +2695,15 @@ def process_campaign_creation(output_path: str, campaigns_data: List[Dict[str, A
                             display_types.append("Substitutes")
                         elif t == "complements":
                             display_types.append("Complements")
-                    
+
                     targeting_name = " and ".join(display_types)
-                
+
                 campaign_id = f"{product_identifier} - SP Auto - {targeting_name} - {campaign_counter}"
                 ad_group_id = f"{product_identifier} - SP Auto - {targeting_name} - {campaign_counter}"
-                
+
                 # Determine paused targeting types
                 paused_types = [t for t in all_types if t not in targeting_types]
-            
+
             # Write common campaign structure
             # Campaign row
             campaign_row = {
@@ -1365,7 +2720,7 @@ def process_campaign_creation(output_path: str, campaigns_data: List[Dict[str, A
             }
             output_df.loc[current_row] = campaign_row
             current_row += 1
-            
+
             # Ad Group row
             ad_group_row = {
                 "Product": "Sponsored Products",
@@ -1379,7 +2734,7 @@ def process_campaign_creation(output_path: str, campaigns_data: List[Dict[str, A
             }
             output_df.loc[current_row] = ad_group_row
             current_row += 1
-            
+
             # Product Ad row
             product_ad_row = {
                 "Product": "Sponsored Products",
@@ -1392,7 +2747,7 @@ def process_campaign_creation(output_path: str, campaigns_data: List[Dict[str, A
             }
             output_df.loc[current_row] = product_ad_row
             current_row += 1
-            
+
             # Handle manual vs auto campaign
             if not is_auto_campaign:
                 # Manual campaign - add keywords
@@ -1425,7 +2780,7 @@ def process_campaign_creation(output_path: str, campaigns_data: List[Dict[str, A
                     }
                     output_df.loc[current_row] = targeting_row
                     current_row += 1
-                
+
                 # Add paused targeting types
                 for targeting_type in paused_types:
                     targeting_row = {
@@ -1440,10 +2795,10 @@ def process_campaign_creation(output_path: str, campaigns_data: List[Dict[str, A
                     }
                     output_df.loc[current_row] = targeting_row
                     current_row += 1
-        
+
         # Write DataFrame to Excel
         output_df.to_excel(writer, sheet_name="New Campaigns", index=False)
-        
+
         # Add a summary sheet
         summary_df = pd.DataFrame({
             "Statistic": ["Number of Campaigns Created", "Auto Campaigns", "Manual Campaigns"],
@@ -1454,12 +2809,590 @@ def process_campaign_creation(output_path: str, campaigns_data: List[Dict[str, A
             ]
         })
         summary_df.to_excel(writer, sheet_name="Summary", index=False)
-        
+
         # Save the Excel file
         writer.close()
-        
+
         logger.info(f"Campaign creation completed successfully. File saved to {output_path}")
-        
+
     except Exception as e:
         logger.error(f"Error during campaign creation: {e}", exc_info=True)
         raise e
+
+@router.post(
+    "/create-campaigns/catalog",
+    summary="Create Amazon PPC Campaigns from a SKU Catalog",
+    status_code=202,
+)
+async def create_campaigns_from_catalog(
+    session: SessionDep,
+    current_user: OptionalUser,
+    file: UploadFile = File(..., description="CSV or XLSX catalog with columns: SKU, Identifier, Keywords, Starting Bid, Campaign Types."),
+    default_campaign_types: str = Form("auto,exact,phrase", description="Campaign types used when a catalog row leaves Campaign Types empty."),
+    idempotency_key: str | None = Header(None, max_length=128, description="Repeats of a request with the same key get the job the first one queued."),
+):
+    """
+    Creates Amazon PPC campaigns for a whole catalog in one upload.
+
+    Each catalog row is expanded into one campaign per campaign type
+    (auto, exact, phrase or broad). Auto campaigns enable all four
+    targeting groups; manual campaigns get one keyword row per keyword in
+    the comma-separated Keywords column. Queues a job producing the same
+    bulk template as `/create-campaigns`.
+    """
+    logger.info(f"Entered /create-campaigns/catalog endpoint with file {file.filename}")
+    default_types = parse_campaign_types(default_campaign_types)
+    if not default_types:
+        raise HTTPException(status_code=400, detail="At least one default campaign type is required.")
+
+    owner_id = current_user.id if current_user else None
+    job_input = await save_job_input(session, file, owner_id, allowed_types=CATALOG_FILE_TYPES)
+
+    job = await db_pool.run(
+        queue_job,
+        session=session,
+        kind="create-campaigns-catalog",
+        idempotency_key=idempotency_key,
+        owner_id=owner_id,
+        params={**job_input, "default_types": default_types},
+    )
+    logger.info(f"Queued catalog campaign creation job {job.id}")
+    return job_accepted(job, "Catalog queued for campaign creation")
+
+@ppc_job("create-campaigns-catalog")
+def run_catalog_campaign_creation_job(_session, job: PPCJob, output_path: str, progress: ProgressReporter):
+    with job_input(job) as input_path:
+        summary = compute_pool.run(
+            run_buffered, process_catalog_campaign_creation, input_path, output_path, job.params["default_types"], progress=progress
+        )
+    logger.info("Catalog campaign creation completed successfully.")
+    return {"summary": summary}
+
+def parse_campaign_types(value: str) -> list[str]:
+    """Parses a comma-separated campaign type list, keeping known types in order."""
+    types = []
+    for campaign_type in str(value).split(','):
+        campaign_type = campaign_type.strip().lower()
+        if campaign_type in CAMPAIGN_TYPES and campaign_type not in types:
+            types.append(campaign_type)
+    return types
+
+# openpyxl, which iter_catalog_chunks streams workbooks with, cannot read xls
+CATALOG_FILE_TYPES = ("xlsx", "csv")
+
+def iter_catalog_chunks(input_path, chunk_size: int = CATALOG_CHUNK_SIZE):
+    """
+    Yields the catalog as DataFrames of at most `chunk_size` rows with
+    normalized column names, without loading the whole file.
+
+    CSV files are read with pandas' chunked reader and xlsx files with
+    openpyxl's read-only row iterator.
+    """
+    def normalize(frame):
+        frame.columns = [CATALOG_COLUMN_ALIASES.get(key, key) for key in (
+            str(col).strip().lower().replace(' ', '_').replace('-', '_') for col in frame.columns
+        )]
+        missing = [column for column in ("sku", "identifier") if column not in frame.columns]
+        if missing:
+            raise ValueError(f"Catalog is missing required column(s): {', '.join(missing)}")
+        return frame
+
+    if spreadsheet_type(input_path) != "csv":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(input_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == chunk_size:
+                    yield normalize(pd.DataFrame(batch, columns=header))
+                    batch = []
+            if batch:
+                yield normalize(pd.DataFrame(batch, columns=header))
+        finally:
+            workbook.close()
+    else:
+        for chunk in pd.read_csv(input_path, chunksize=chunk_size, dtype=str):
+            yield normalize(chunk)
+
+def expand_catalog_chunk(
+    catalog: pd.DataFrame,
+    default_types: list[str],
+    first_campaign_number: int,
+    current_date: str
+) -> pd.DataFrame:
+    """
+    Expands catalog rows into bulk rows using whole-column template
+    operations: one frame per entity type is built from the exploded
+    campaign list and the frames are interleaved with a stable sort.
+
+    Returns:
+        DataFrame: Bulk rows in BULK_COLUMNS order, grouped per campaign as
+        Campaign, Ad Group, Product Ad, then keywords or targets.
+    """
+    catalog = catalog.dropna(subset=["sku"]).reset_index(drop=True)
+    sku = catalog["sku"].astype(str).str.strip()
+    identifier = catalog["identifier"].where(catalog["identifier"].notna(), sku).astype(str).str.strip()
+    bid = pd.to_numeric(catalog.get("starting_bid"), errors='coerce') if "starting_bid" in catalog else pd.Series(np.nan, index=catalog.index)
+    bid = bid.fillna(1)
+    keywords = catalog["keywords"].fillna('').astype(str) if "keywords" in catalog else pd.Series('', index=catalog.index)
+    types = catalog["campaign_types"] if "campaign_types" in catalog else pd.Series(None, index=catalog.index)
+    types = types.map(lambda value: parse_campaign_types(value) if isinstance(value, str) and value.strip() else default_types)
+
+    # One row per campaign
+    campaigns = pd.DataFrame({
+        "sku": sku, "identifier": identifier, "bid": bid, "keywords": keywords, "campaign_type": types
+    }).explode("campaign_type").dropna(subset=["campaign_type"]).reset_index(drop=True)
+    campaigns["number"] = np.arange(first_campaign_number, first_campaign_number + len(campaigns))
+    is_auto = campaigns["campaign_type"] == "auto"
+    display_type = campaigns["campaign_type"].str.capitalize()
+    campaigns["name"] = np.where(
+        is_auto,
+        campaigns["identifier"] + " - SP Auto - All - " + campaigns["number"].astype(str),
+        campaigns["identifier"] + " - SP " + display_type + " - " + campaigns["number"].astype(str),
+    )
+
+    def entity_rows(frame, entity, order, **columns):
+        rows = pd.DataFrame({
+            "Product": "Sponsored Products",
+            "Entity": entity,
+            "Operation": "Create",
+            "Campaign ID": frame["name"],
+            **columns,
+        }, index=frame.index)
+        rows["_campaign"] = frame["number"]
+        rows["_order"] = order
+        return rows
+
+    frames = [
+        entity_rows(campaigns, "Campaign", 0, **{
+            "Campaign Name": campaigns["name"],
+            "Start Date": current_date,
+            "Targeting Type": np.where(is_auto, "AUTO", "MANUAL"),
+            "State": "enabled",
+            "Daily Budget": 10,
+            "Bidding Strategy": "Dynamic bids - down only",
+        }),
+        entity_rows(campaigns, "Ad Group", 1, **{
+            "Ad Group ID": campaigns["name"],
+            "Ad Group Name": campaigns["name"],
+            "State": "enabled",
+            "Ad Group Default Bid": campaigns["bid"],
+        }),
+        entity_rows(campaigns, "Product Ad", 2, **{
+            "Ad Group ID": campaigns["name"],
+            "State": "enabled",
+            "SKU": campaigns["sku"],
+        }),
+    ]
+
+    manual = campaigns[~is_auto].assign(keyword=lambda frame: frame["keywords"].str.split(','))
+    manual = manual.explode("keyword")
+    manual["keyword"] = manual["keyword"].fillna('').str.strip()
+    manual = manual[manual["keyword"] != '']
+    frames.append(entity_rows(manual, "Keyword", 3, **{
+        "Ad Group ID": manual["name"],
+        "State": "enabled",
+        "Bid": manual["bid"],
+        "Keyword Text": manual["keyword"],
+        "Match Type": manual["campaign_type"],
+    }))
+
+    auto = campaigns[is_auto].assign(target=[AUTO_TARGETING_TYPES] * int(is_auto.sum())).explode("target")
+    frames.append(entity_rows(auto, "Product Targeting", 3, **{
+        "Ad Group ID": auto["name"],
+        "State": "enabled",
+        "Bid": auto["bid"],
+        "Product Targeting Expression": auto["target"],
+    }))
+
+    rows = pd.concat(frames, ignore_index=True)
+    rows = rows.sort_values(["_campaign", "_order"], kind="stable")
+    return rows.reindex(columns=BULK_COLUMNS)
+
+def process_catalog_campaign_creation(input_path, output_path, default_types: list[str], progress: ProgressReporter | None = None) -> dict[str, int]:
+    """
+    Streams a SKU catalog into an Amazon bulk campaign file.
+
+    The catalog is read and expanded in chunks and each chunk's rows are
+    appended to a write-only workbook, so memory stays bounded by the
+    chunk size rather than the catalog size.
+
+    Args:
+        input_path (str or file): Path or binary file object of the CSV or XLSX catalog.
+        output_path (str or file): Path or binary file object the bulk file is written to.
+        default_types (list): Campaign types for rows without any.
+        progress (ProgressReporter, optional): Receives catalog rows as chunks
+            are expanded; the total is unknown while streaming.
+
+    Returns:
+        dict: Counts of SKUs, campaigns and bulk rows written.
+    """
+    from openpyxl import Workbook
+
+    progress = progress or ProgressReporter(None)
+
+    logger.info(f"Starting catalog campaign creation for {input_path}")
+    current_date = datetime.now().strftime("%Y%m%d")
+    summary = {"skus": 0, "campaigns": 0, "auto_campaigns": 0, "manual_campaigns": 0, "rows": 0}
+
+    # Read the first chunk before opening the writer so header errors fail fast
+    chunks = iter_catalog_chunks(input_path)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        raise ValueError("Catalog file is empty.")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("New Campaigns")
+    sheet.append(BULK_COLUMNS)
+
+    progress.stage("expanding catalog")
+    for chunk in itertools.chain([first_chunk], chunks):
+        rows = expand_catalog_chunk(chunk, default_types, summary["campaigns"] + 1, current_date)
+        campaign_rows = rows[rows["Entity"] == "Campaign"]
+        summary["skus"] += int(chunk["sku"].notna().sum())
+        summary["campaigns"] += len(campaign_rows)
+        summary["auto_campaigns"] += int((campaign_rows["Targeting Type"] == "AUTO").sum())
+        summary["rows"] += len(rows)
+
+        rows = rows.astype(object).where(rows.notna(), None)
+        for row in rows.itertuples(index=False, name=None):
+            sheet.append(row)
+        logger.info(f"Expanded catalog chunk: {summary['skus']} SKUs, {summary['campaigns']} campaigns so far")
+        progress.advance(len(chunk))
+
+    summary["manual_campaigns"] = summary["campaigns"] - summary["auto_campaigns"]
+
+    summary_sheet = workbook.create_sheet("Summary")
+    summary_sheet.append(["Statistic", "Value"])
+    summary_sheet.append(["Number of Campaigns Created", summary["campaigns"]])
+    summary_sheet.append(["Auto Campaigns", summary["auto_campaigns"]])
+    summary_sheet.append(["Manual Campaigns", summary["manual_campaigns"]])
+    progress.stage("writing")
+    workbook.save(output_path)
+
+    logger.info(f"Catalog campaign creation completed successfully. File saved to {output_path}")
+    return summary
+
+# --- Batches ---
+
+class BidOptimizationParams(BaseModel):
+    target_acos: float = Field(ge=0, le=1000)
+    increase_spend: bool = False
+
+class NegativeHarvestingParams(BaseModel):
+    min_clicks: int = Field(10, ge=0)
+    min_spend: float = Field(0.0, ge=0)
+    max_orders: int = Field(0, ge=0)
+    min_acos: float | None = Field(None, ge=0)
+    match_type: str = "exact"
+
+class KeywordMiningParams(BaseModel):
+    max_acos: float = Field(ge=0, le=100)
+    match_type: str = "exact"
+    brands_to_exclude: str = ""
+    include_negatives: bool = False
+    negative_min_clicks: int = Field(10, ge=0)
+    negative_min_spend: float = Field(0.0, ge=0)
+    negative_max_orders: int = Field(0, ge=0)
+    negative_min_acos: float | None = Field(None, ge=0)
+    negative_match_type: str = "exact"
+    skip_harvested: bool = True
+    cluster_keywords: bool = False
+    cluster_similarity: float = Field(0.5, gt=0, le=1)
+
+class CatalogCampaignParams(BaseModel):
+    default_campaign_types: str = "auto,exact,phrase"
+
+def bid_optimization_job_params(params: BidOptimizationParams) -> dict[str, Any]:
+    return {"target_acos": params.target_acos, "increase_spend": params.increase_spend}
+
+def negative_harvesting_job_params(params: NegativeHarvestingParams) -> dict[str, Any]:
+    return {"negative_options": parse_negative_options(
+        params.min_clicks, params.min_spend, params.max_orders, params.min_acos, params.match_type
+    )}
+
+def keyword_mining_job_params(params: KeywordMiningParams) -> dict[str, Any]:
+    negative_options = None
+    if params.include_negatives:
+        negative_options = parse_negative_options(
+            params.negative_min_clicks, params.negative_min_spend, params.negative_max_orders,
+            params.negative_min_acos, params.negative_match_type
+        )
+    return {
+        "max_acos": params.max_acos,
+        "match_type": params.match_type,
+        "brands_to_exclude": params.brands_to_exclude,
+        "negative_options": negative_options,
+        "skip_harvested": params.skip_harvested,
+        "cluster_similarity": params.cluster_similarity if params.cluster_keywords else None,
+    }
+
+def catalog_campaign_job_params(params: CatalogCampaignParams) -> dict[str, Any]:
+    default_types = parse_campaign_types(params.default_campaign_types)
+    if not default_types:
+        raise HTTPException(status_code=400, detail="At least one default campaign type is required.")
+    return {"default_types": default_types}
+
+# Job kinds a batch can run: the form parameters of the single-file endpoint,
+# and how they become job params
+BATCH_KINDS: dict[str, tuple[type[BaseModel], Callable[[Any], dict[str, Any]]]] = {
+    "optimize-bids": (BidOptimizationParams, bid_optimization_job_params),
+    "harvest-negatives": (NegativeHarvestingParams, negative_harvesting_job_params),
+    "mine-keywords": (KeywordMiningParams, keyword_mining_job_params),
+    "create-campaigns-catalog": (CatalogCampaignParams, catalog_campaign_job_params),
+}
+
+UPLOAD_ERROR_STATUS = {EmptyUpload: 400, UploadTooLarge: 413, UnsupportedFileType: 415}
+
+def parse_json_object(value: str, field: str) -> dict[str, Any]:
+    try:
+        parsed = json.loads(value or "{}")
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"{field} is not valid JSON: {e}")
+    if not isinstance(parsed, dict):
+        raise HTTPException(status_code=400, detail=f"{field} must be a JSON object.")
+    return parsed
+
+def is_file_archive(upload: IngestedUpload) -> bool:
+    """True for a zip of files; xlsx workbooks are zip archives too, but carry [Content_Types].xml."""
+    if upload.file_type != "xlsx" or upload.path is None:
+        return False
+    try:
+        with zipfile.ZipFile(upload.path) as archive:
+            return "[Content_Types].xml" not in archive.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+def expand_archive(
+    upload: IngestedUpload, max_files: int, owner_id=None, allowed_types: tuple[str, ...] = SPREADSHEET_TYPES
+) -> list[tuple[str, IngestedUpload]]:
+    """
+    Ingests every spreadsheet in a zip upload, by the same rules and size
+    limit as a direct upload. Folders and macOS metadata are skipped. Room
+    for the extracted files is made first, as for a direct upload.
+    """
+    assert upload.path is not None
+    expanded = []
+    try:
+        with zipfile.ZipFile(upload.path) as archive:
+            members = [
+                member for member in archive.infolist()
+                if not member.is_dir()
+                and not member.filename.startswith("__MACOSX/")
+                and not os.path.basename(member.filename).startswith(".")
+            ]
+            if len(members) > max_files:
+                raise HTTPException(status_code=400, detail=f"A batch may contain at most {settings.PPC_BATCH_MAX_FILES} files.")
+            for member in members:
+                if member.file_size > settings.PPC_MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"{os.path.basename(member.filename)}: Upload exceeds the maximum size of {settings.PPC_MAX_UPLOAD_BYTES} bytes")
+            try:
+                reserve_storage(sum(member.file_size for member in members), owner_id)
+            except InsufficientStorage as e:
+                raise HTTPException(status_code=507, detail=str(e))
+            for member in members:
+                filename = os.path.basename(member.filename)
+                with archive.open(member) as source:
+                    try:
+                        expanded.append((filename, ingest_upload(source, TEMP_DIR, max_bytes=settings.PPC_MAX_UPLOAD_BYTES, allowed_types=allowed_types)))
+                    except tuple(UPLOAD_ERROR_STATUS) as e:
+                        raise HTTPException(status_code=UPLOAD_ERROR_STATUS[type(e)], detail=f"{filename}: {e}")
+    except BaseException:
+        for _, ingested in expanded:
+            discard_upload(ingested)
+        raise
+    return expanded
+
+def batch_job_params(kind: str, defaults: dict[str, Any], file_params: dict[str, Any], filename: str) -> dict[str, Any]:
+    """Validates one file's parameters (defaults overridden by its own) into job params."""
+    model, build = BATCH_KINDS[kind]
+    overrides = file_params.get(filename, {})
+    if not isinstance(overrides, dict):
+        raise HTTPException(status_code=400, detail=f"Parameters for {filename} must be a JSON object.")
+    try:
+        params = model.model_validate({**defaults, **overrides})
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+        raise HTTPException(status_code=400, detail=f"Invalid parameters for {filename}: {problems}")
+    try:
+        return build(params)
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Invalid parameters for {filename}: {e.detail}")
+
+@router.post(
+    "/batches",
+    summary="Submit a Batch of PPC Files",
+    status_code=202,
+)
+async def submit_batch(
+    session: SessionDep,
+    current_user: CurrentUser,
+    files: list[UploadFile] = File(..., description="XLSX, XLS or CSV files, or zip archives of them."),
+    kind: str = Form(..., description="Processing to run on every file: optimize-bids, harvest-negatives, mine-keywords or create-campaigns-catalog."),
+    params: str = Form("{}", description="JSON object of parameters for every file, named as on the single-file endpoint."),
+    file_params: str = Form("{}", description="JSON object mapping file names to parameters that override `params` for that file."),
+    max_concurrency: int = Form(settings.PPC_BATCH_MAX_CONCURRENCY, ge=1, le=settings.PPC_BATCH_MAX_CONCURRENCY, description="Most files of this batch processed at once."),
+    bundle: bool = Form(False, description="Also zip all outputs into one download when the batch finishes."),
+):
+    """
+    Queues one job per file, e.g. one bulk file per seller account. Files
+    inside zip archives are processed as if uploaded one by one.
+
+    Jobs of the batch run concurrently across the job workers, but never
+    more than `max_concurrency` at a time, so one large batch cannot take
+    every worker. Poll `/batches/{batch_id}` for per-file results; with
+    `bundle`, the batch also gets a zip of every output (and an errors.txt
+    for files that failed).
+    """
+    if kind not in BATCH_KINDS:
+        raise HTTPException(status_code=400, detail=f"Batch kind must be one of: {', '.join(BATCH_KINDS)}.")
+    if len(files) > settings.PPC_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {settings.PPC_BATCH_MAX_FILES} files.")
+    defaults = parse_json_object(params, "params")
+    per_file = parse_json_object(file_params, "file_params")
+    logger.info(f"Entered /batches endpoint with {len(files)} files for {kind}")
+    allowed_types = CATALOG_FILE_TYPES if kind == "create-campaigns-catalog" else SPREADSHEET_TYPES
+
+    uploads: list[tuple[str, IngestedUpload]] = []
+    stored: list[str] = []  # input_refs of uploads already moved into the artifact store
+    try:
+        for file in files:
+            filename = os.path.basename(file.filename or "upload")
+            upload = await save_upload(file, owner_id=current_user.id, allowed_types=allowed_types)
+            if await file_io_pool.run(is_file_archive, upload):
+                try:
+                    uploads += await file_io_pool.run(
+                        expand_archive, upload, settings.PPC_BATCH_MAX_FILES - len(uploads), current_user.id, allowed_types
+                    )
+                finally:
+                    await file_io_pool.run(discard_upload, upload)
+            else:
+                uploads.append((filename, upload))
+            if len(uploads) > settings.PPC_BATCH_MAX_FILES:
+                raise HTTPException(status_code=400, detail=f"A batch may contain at most {settings.PPC_BATCH_MAX_FILES} files.")
+
+        # Files are told apart by name, in file_params and in the bundle
+        duplicates = sorted(name for name, count in Counter(filename for filename, _ in uploads).items() if count > 1)
+        if duplicates:
+            raise HTTPException(status_code=400, detail=f"File names must be unique within a batch: {', '.join(duplicates)} appears more than once.")
+        unknown = set(per_file) - {filename for filename, _ in uploads}
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"file_params names files not in the batch: {', '.join(sorted(unknown))}")
+        job_params = [batch_job_params(kind, defaults, per_file, filename) for filename, _ in uploads]
+
+        for index, (filename, upload) in enumerate(uploads):
+            job_input = await file_io_pool.run(store_job_input, session, upload, current_user.id)
+            stored.append(job_input["input_ref"])
+            job_params[index] = {**job_input, **job_params[index], "filename": filename}
+    except BaseException:
+        for _, upload in uploads:
+            await file_io_pool.run(discard_upload, upload)
+        for input_ref in stored:
+            janitor.schedule_release(input_ref, 0)
+        raise
+
+    try:
+        batch, batch_jobs = await db_pool.run(
+            jobs.submit_batch,
+            session=session,
+            kind=kind,
+            params=job_params,
+            max_concurrency=max_concurrency,
+            bundle=bundle,
+            owner_id=current_user.id,
+        )
+    except jobs.JobQueueFull as e:
+        logger.warning(f"Rejected {kind} batch: {e}")
+        for entry in job_params:
+            janitor.schedule_release(entry["input_ref"], 0)
+        raise HTTPException(status_code=429, detail="Too many files are waiting to be processed. Please try again shortly.", headers={"Retry-After": "30"})
+
+    logger.info(f"Queued batch {batch.id} of {len(batch_jobs)} {kind} jobs")
+    return {
+        "message": f"{len(batch_jobs)} files queued for processing",
+        "batch_id": str(batch.id),
+        "jobs": [{"filename": job.params["filename"], "job_id": str(job.id)} for job in batch_jobs],
+    }
+
+def batch_status(batch: PPCBatch, counts: Counter[str], bundle_job: PPCJob | None) -> str:
+    if batch.finished_at is None:
+        return "queued" if counts["queued"] == sum(counts.values()) else "running"
+    if batch.bundle and (bundle_job is None or bundle_job.status not in FINISHED_STATUSES):
+        return "bundling"
+    if not counts["failed"] and not counts["cancelled"]:
+        return "succeeded"
+    if counts["succeeded"]:
+        return "partial"
+    return "failed" if counts["failed"] else "cancelled"
+
+@router.get(
+    "/batches/{batch_id}",
+    summary="Get PPC Batch Status",
+    response_model=PPCBatchPublic,
+)
+def read_batch(session: SessionDep, current_user: CurrentUser, batch_id: uuid.UUID) -> Any:
+    """
+    Returns a batch's overall status (queued, running, bundling, succeeded,
+    failed, cancelled or partial), job counts per status and every job with the name
+    of its file. With `bundle`, `bundle_job` carries the zip's download URL.
+    """
+    batch = session.get(PPCBatch, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+    if not current_user.is_superuser and batch.owner_id != current_user.id:
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    batch_jobs = crud.get_ppc_batch_jobs(session=session, batch_id=batch.id)
+    bundle_job = session.get(PPCJob, batch.bundle_job_id) if batch.bundle_job_id else None
+    counts = Counter(job.status for job in batch_jobs)
+    return PPCBatchPublic.model_validate(
+        batch,
+        update={
+            "status": batch_status(batch, counts, bundle_job),
+            "counts": dict(counts),
+            "bundle_job": job_public(bundle_job) if bundle_job else None,
+            "jobs": [
+                PPCBatchJobPublic.model_validate(job_public(job), update={"filename": job.params.get("filename")})
+                for job in batch_jobs
+            ],
+        },
+    )
+
+@ppc_job(jobs.BATCH_BUNDLE_KIND, file_type="zip")
+def run_batch_bundle_job(session, job: PPCJob, output_path: str, progress: ProgressReporter):
+    """Zips the outputs of a finished batch, listing files without one in errors.txt."""
+    batch_jobs = crud.get_ppc_batch_jobs(session=session, batch_id=uuid.UUID(job.params["batch_id"]))
+    progress.stage("bundling", total=len(batch_jobs))
+    names = set()
+    errors = []
+    # Outputs are already compressed spreadsheets, so they are stored as-is
+    with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_STORED) as bundle:
+        for batch_job in batch_jobs:
+            progress.advance()
+            filename = batch_job.params.get("filename") or str(batch_job.id)
+            blob = artifact_store.resolve(session, batch_job.download_id) if batch_job.download_id else None
+            if blob is None:
+                reason = "cancelled" if batch_job.status == "cancelled" else "output has expired"
+                errors.append(f"{filename}: {batch_job.error or reason}")
+                continue
+            stem = os.path.splitext(filename)[0]
+            name = f"{stem}_processed.{blob.file_type}"
+            for copy in itertools.count(2):
+                if name not in names:
+                    break
+                name = f"{stem}_processed_{copy}.{blob.file_type}"
+            names.add(name)
+            with bundle.open(name, "w", force_zip64=True) as destination:
+                if blob.size:
+                    blob_name = artifact_store.blob_name(blob.sha256, blob.file_type)
+                    for chunk in artifact_store.backend.iter_range(blob_name, 0, blob.size - 1):
+                        destination.write(chunk)
+        if errors:
+            bundle.writestr("errors.txt", "\n".join(errors) + "\n")
+    logger.info(f"Bundled {len(names)} outputs of batch {job.params['batch_id']}")
+    return {"files": len(names), "failed": len(errors)}
@@ -10,6 +10,7 @@ from app.api.deps import (
     SessionDep,
     get_current_active_superuser,
 )
+from app.core.capacity import auth_pool, runs_in
 from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
 from app.models import (
@@ -51,6 +52,7 @@ def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
 @router.post(
     "/", dependencies=[Depends(get_current_active_superuser)], response_model=UserPublic
 )
+@runs_in(auth_pool)
 def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
     """
     Create new user.
@@ -98,6 +100,7 @@ def update_user_me(
 
 
 @router.patch("/me/password", response_model=Message)
+@runs_in(auth_pool)
 def update_password_me(
     *, session: SessionDep, body: UpdatePassword, current_user: CurrentUser
 ) -> Any:
@@ -140,6 +143,7 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
 
 
 @router.post("/signup", response_model=UserPublic)
+@runs_in(auth_pool)
 def register_user(session: SessionDep, user_in: UserRegister) -> Any:
     """
     Create new user without the need to be logged in.
@@ -178,6 +182,7 @@ def read_user_by_id(
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UserPublic,
 )
+@runs_in(auth_pool)
 def update_user(
     *,
     session: SessionDep,
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
-from app.api.deps import get_current_active_superuser
-from app.models import Message
+from app.api.deps import SessionDep, get_current_active_superuser
+from app.core import jobs
+from app.core.capacity import db_pool, pools
+from app.models import CapacityPoolStats, JobQueueStats, Message
 from app.utils import generate_test_email, send_email
 
 router = APIRouter(prefix="/utils", tags=["utils"])
@@ -29,3 +31,31 @@ def test_email(email_to: EmailStr) -> Message:
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
+
+
+@router.get(
+    "/capacity/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=list[CapacityPoolStats],
+)
+async def read_capacity() -> list[dict[str, object]]:
+    """
+    Thread pool usage per workload class: threads in use, calls queued for
+    a thread, and how long calls have waited for one.
+    """
+    return [pool.statistics() for pool in pools]
+
+
+@router.get(
+    "/job-queue/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=list[JobQueueStats],
+)
+async def read_job_queue(session: SessionDep) -> list[dict[str, object]]:
+    """
+    Time in queue of PPC processing jobs per priority class (interactive and
+    batch): jobs waiting now and the longest wait among them, and the
+    average, 95th percentile and longest wait of jobs started within
+    PPC_QUEUE_STATS_WINDOW seconds.
+    """
+    return await db_pool.run(jobs.queue_statistics, session=session)
@@ -0,0 +1,270 @@
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager
+from datetime import datetime
+from typing import Any
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.models import ArtifactBlob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobBackend(ABC):
+    """
+    Where artifact blobs live. Names are relative ("ab/<sha256>.xlsx");
+    reads and writes stream in CHUNK_SIZE pieces, so blobs of any size pass
+    through in bounded memory.
+    """
+
+    @abstractmethod
+    def exists(self, name: str) -> bool: ...
+
+    @abstractmethod
+    def put_file(self, name: str, source_path: str) -> None:
+        """Stores a local file as `name`, consuming (removing) the local file."""
+
+    @abstractmethod
+    def iter_range(self, name: str, start: int, end: int) -> Iterator[bytes]:
+        """Yields bytes `start` to `end` (inclusive) of a blob."""
+
+    @abstractmethod
+    def local_copy(self, name: str) -> AbstractContextManager[str]:
+        """Context manager giving a local path with the blob's content."""
+
+    def local_path(self, name: str) -> str | None:
+        """The blob's path when it is a local file anyone on this host can read."""
+        return None
+
+    @abstractmethod
+    def delete(self, name: str) -> None: ...
+
+
+class LocalBlobBackend(BlobBackend):
+    """Blobs as files under `root`; only usable by a single host."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def local_path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.local_path(name))
+
+    def put_file(self, name: str, source_path: str) -> None:
+        path = self.local_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+
+    def iter_range(self, name: str, start: int, end: int) -> Iterator[bytes]:
+        with open(self.local_path(name), "rb") as source:
+            source.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = source.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    @contextmanager
+    def local_copy(self, name: str) -> Iterator[str]:
+        yield self.local_path(name)
+
+    def delete(self, name: str) -> None:
+        try:
+            os.remove(self.local_path(name))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobBackend(BlobBackend):
+    """
+    Blobs as objects in an S3-compatible bucket, shared by every app node.
+    Uploads use multipart transfers and reads are ranged GETs; processors
+    get a temporary local copy in `scratch_dir`.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        *,
+        prefix: str = "",
+        scratch_dir: str,
+        endpoint_url: str | None = None,
+        region: str | None = None,
+        access_key_id: str | None = None,
+        secret_access_key: str | None = None,
+    ) -> None:
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError(
+                "ARTIFACT_BACKEND=s3 requires boto3; install the app with the s3 extra"
+            )
+        self.bucket = bucket
+        self.prefix = prefix
+        self.scratch_dir = scratch_dir
+        self._client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+        )
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    def exists(self, name: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in (
+                "404",
+                "NoSuchKey",
+                "NotFound",
+            ):
+                return False
+            raise
+        return True
+
+    def put_file(self, name: str, source_path: str) -> None:
+        self._client.upload_file(source_path, self.bucket, self._key(name))
+        os.remove(source_path)
+
+    def iter_range(self, name: str, start: int, end: int) -> Iterator[bytes]:
+        response = self._client.get_object(
+            Bucket=self.bucket, Key=self._key(name), Range=f"bytes={start}-{end}"
+        )
+        body = response["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    @contextmanager
+    def local_copy(self, name: str) -> Iterator[str]:
+        # Keep the extension: readers pick the spreadsheet parser by it
+        descriptor, path = tempfile.mkstemp(
+            suffix=os.path.splitext(name)[1], dir=self.scratch_dir
+        )
+        os.close(descriptor)
+        try:
+            self._client.download_file(self.bucket, self._key(name), path)
+            yield path
+        finally:
+            os.remove(path)
+
+    def delete(self, name: str) -> None:
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+
+class ArtifactStore:
+    """
+    Content-addressed storage for PPC inputs and outputs.
+
+    Each distinct file is kept once in the blob backend, as
+    `<sha[:2]>/<sha256>.<type>`; identical uploads and outputs share the
+    blob. ArtifactRef rows name the blob (by download ID, or by a job's
+    input key) and hold it alive until they expire. `collect` removes blobs
+    once their reference count drops to zero; the janitor calls it on every
+    sweep.
+    """
+
+    def __init__(self, backend: BlobBackend) -> None:
+        self.backend = backend
+
+    @staticmethod
+    def blob_name(sha256: str, file_type: str) -> str:
+        return f"{sha256[:2]}/{sha256}.{file_type}"
+
+    def put(
+        self,
+        session: Session,
+        source_path: str,
+        *,
+        key: str,
+        sha256: str,
+        file_type: str,
+        expires_at: datetime | None = None,
+        owner_id: Any = None,
+        role: str = "result",
+    ) -> str:
+        """
+        Moves a finished local file into the store under `key` and returns its
+        blob name. When the content is already stored the file is dropped.
+        `owner_id` is the user charged for it and `role` (input, cache or
+        result) decides whether and in which order the storage manager may
+        evict it.
+        """
+        crud.create_artifact_ref(
+            session=session,
+            key=key,
+            sha256=sha256,
+            file_type=file_type,
+            size=os.path.getsize(source_path),
+            expires_at=expires_at,
+            owner_id=owner_id,
+            role=role,
+        )
+        # Placed only after the reference is committed, so a concurrent
+        # collect can no longer remove the blob underneath it
+        name = self.blob_name(sha256, file_type)
+        if self.backend.exists(name):
+            os.remove(source_path)
+            logger.info(f"Deduplicated {key} into existing blob {sha256}")
+        else:
+            self.backend.put_file(name, source_path)
+        return name
+
+    def resolve(self, session: Session, key: str) -> ArtifactBlob | None:
+        """Returns the blob behind `key`, recording the use for LRU eviction."""
+        now = datetime.utcnow()
+        crud.touch_artifact_ref(session=session, key=key, now=now)
+        return crud.get_artifact_blob(session=session, key=key, now=now)
+
+    def collect(self, session: Session, now: datetime) -> int:
+        """Releases references expired at `now` and removes unreferenced blobs."""
+        released = crud.release_expired_artifact_refs(session=session, now=now)
+        blobs = crud.pop_unreferenced_artifact_blobs(session=session)
+        for sha256, file_type in blobs:
+            name = self.blob_name(sha256, file_type)
+            try:
+                self.backend.delete(name)
+                logger.info(f"Removed unreferenced blob: {name}")
+            except Exception as e:
+                logger.error(f"Error removing blob {name}: {e}")
+        session.commit()
+        return released
+
+
+def create_blob_backend() -> BlobBackend:
+    if settings.ARTIFACT_BACKEND == "s3":
+        if not settings.ARTIFACT_S3_BUCKET:
+            raise RuntimeError("ARTIFACT_BACKEND=s3 requires ARTIFACT_S3_BUCKET")
+        secret = settings.ARTIFACT_S3_SECRET_ACCESS_KEY
+        return S3BlobBackend(
+            settings.ARTIFACT_S3_BUCKET,
+            prefix=settings.ARTIFACT_S3_PREFIX,
+            scratch_dir=settings.TEMP_FILE_DIR,
+            endpoint_url=settings.ARTIFACT_S3_ENDPOINT_URL,
+            region=settings.ARTIFACT_S3_REGION,
+            access_key_id=settings.ARTIFACT_S3_ACCESS_KEY_ID,
+            secret_access_key=secret.get_secret_value() if secret else None,
+        )
+    return LocalBlobBackend(os.path.join(settings.TEMP_FILE_DIR, "blobs"))
+
+
+artifact_store = ArtifactStore(create_blob_backend())
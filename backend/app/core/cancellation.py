@@ -0,0 +1,68 @@
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from app.core.config import settings
+
+
+class Cancelled(BaseException):
+    """
+    Raised by CancelToken.check once work has been cancelled. Like
+    asyncio.CancelledError it is not an Exception, so processing code that
+    turns errors into failures lets it through.
+    """
+
+
+class CancelToken(ABC):
+    """
+    Tells long-running processing that its result is no longer wanted.
+
+    Processing calls `check` between rows, chunks and stages (usually through
+    its ProgressReporter). The underlying signal is only looked at once every
+    PPC_CANCEL_CHECK_INTERVAL seconds, so calling `check` per row costs a
+    clock read. Tokens are picklable and can be passed to compute workers.
+    """
+
+    def __init__(self, interval: float | None = None) -> None:
+        self.interval = (
+            settings.PPC_CANCEL_CHECK_INTERVAL if interval is None else interval
+        )
+        self._next_check = 0.0
+
+    @abstractmethod
+    def is_cancelled(self) -> bool: ...
+
+    def check(self) -> None:
+        """Raises Cancelled if the work was cancelled."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.interval
+        if self.is_cancelled():
+            raise Cancelled()
+
+
+class FlagFileToken(CancelToken):
+    """
+    Cancelled once `cancel` creates the token's flag file in `directory`.
+    For work done for a synchronous request, which may run in a compute
+    worker while the request watches its client; `discard` removes the flag.
+    """
+
+    def __init__(self, directory: str, interval: float | None = None) -> None:
+        super().__init__(interval)
+        self.path = os.path.join(directory, f"cancel_{uuid.uuid4()}")
+
+    def cancel(self) -> None:
+        with open(self.path, "a"):
+            pass
+
+    def is_cancelled(self) -> bool:
+        return os.path.exists(self.path)
+
+    def discard(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,136 @@
+import functools
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import Any, TypeVar
+
+import anyio
+import anyio.to_thread
+from anyio.lowlevel import RunVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+_SENTINEL = object()
+
+
+class CapacityPool:
+    """
+    A named share of worker threads for one class of blocking work.
+
+    Each pool has its own AnyIO capacity limiter, so a burst in one class
+    (say, large uploads) queues behind its own limit instead of taking the
+    threads that login or user lookups need. The "db" pool is AnyIO's
+    default limiter, which FastAPI uses for sync routes and dependencies;
+    the others take their work off it.
+
+    Limiters belong to an event loop, so one is created per loop on first
+    use. Wait times are measured from submission until a thread picks the
+    call up.
+    """
+
+    def __init__(self, name: str, capacity: int, *, default: bool = False) -> None:
+        self.name = name
+        self.capacity = capacity
+        self.default = default
+        self._limiter: RunVar[anyio.CapacityLimiter] = RunVar(f"capacity_{name}")
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def limiter(self) -> anyio.CapacityLimiter:
+        return self._get_limiter()
+
+    def install(self) -> None:
+        """Sets up this loop's limiter now; for the db pool, resizes AnyIO's default."""
+        self._get_limiter()
+
+    def _get_limiter(self) -> anyio.CapacityLimiter:
+        try:
+            return self._limiter.get()
+        except LookupError:
+            if self.default:
+                limiter = anyio.to_thread.current_default_thread_limiter()
+                limiter.total_tokens = self.capacity
+            else:
+                limiter = anyio.CapacityLimiter(self.capacity)
+            self._limiter.set(limiter)
+            return limiter
+
+    def _record_wait(self, waited: float) -> None:
+        with self._lock:
+            self._completed += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Runs `fn` in a thread once this pool has a free slot."""
+        submitted = time.monotonic()
+
+        def call() -> T:
+            self._record_wait(time.monotonic() - submitted)
+            return fn(*args, **kwargs)
+
+        return await anyio.to_thread.run_sync(call, limiter=self.limiter)
+
+    async def iterate(self, iterator: Iterator[T]) -> AsyncIterator[T]:
+        """Drives a blocking iterator (e.g. file chunks) from this pool's threads."""
+        try:
+            while True:
+                item = await self.run(next, iterator, _SENTINEL)
+                if item is _SENTINEL:
+                    break
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                await self.run(close)
+
+    def statistics(self) -> dict[str, Any]:
+        try:
+            limiter_stats = self._limiter.get().statistics()
+            in_use, waiting = limiter_stats.borrowed_tokens, limiter_stats.tasks_waiting
+        except (LookupError, RuntimeError):
+            # Not in an event loop, or the pool has not been used in this one
+            in_use, waiting = 0, 0
+        with self._lock:
+            completed = self._completed
+            wait_avg = self._wait_total / completed if completed else 0.0
+            wait_max = self._wait_max
+        return {
+            "name": self.name,
+            "capacity": self.capacity,
+            "in_use": in_use,
+            "waiting": waiting,
+            "completed": completed,
+            "wait_avg_ms": round(wait_avg * 1000, 3),
+            "wait_max_ms": round(wait_max * 1000, 3),
+        }
+
+
+def runs_in(pool: CapacityPool) -> Callable[[Callable[..., T]], Callable[..., Any]]:
+    """
+    Runs a sync route in `pool` instead of FastAPI's default threadpool.
+    The signature is kept, so dependencies and the response model still
+    come from the original function.
+    """
+
+    def decorate(endpoint: Callable[..., T]) -> Callable[..., Any]:
+        @functools.wraps(endpoint)
+        async def run(*args: Any, **kwargs: Any) -> T:
+            return await pool.run(endpoint, *args, **kwargs)
+
+        return run
+
+    return decorate
+
+
+auth_pool = CapacityPool("auth", settings.CAPACITY_AUTH_THREADS)
+db_pool = CapacityPool("db", settings.CAPACITY_DB_THREADS, default=True)
+file_io_pool = CapacityPool("file_io", settings.CAPACITY_FILE_IO_THREADS)
+ppc_compute_pool = CapacityPool("ppc_compute", settings.CAPACITY_PPC_COMPUTE_THREADS)
+
+pools = (auth_pool, db_pool, file_io_pool, ppc_compute_pool)
@@ -0,0 +1,235 @@
+import zlib
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from typing import cast
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class Encoder(ABC):
+    """Incremental compressor for one response body."""
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes: ...
+
+    @abstractmethod
+    def flush(self) -> bytes:
+        """Returns everything compressed so far, so a streamed chunk reaches the client."""
+
+    @abstractmethod
+    def finish(self) -> bytes: ...
+
+
+class GzipEncoder(Encoder):
+    def __init__(self, level: int = 6) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder(Encoder):
+    def __init__(self, quality: int = 4) -> None:
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return cast(bytes, self._compressor.process(data))
+
+    def flush(self) -> bytes:
+        return cast(bytes, self._compressor.flush())
+
+    def finish(self) -> bytes:
+        return cast(bytes, self._compressor.finish())
+
+
+class ZstdEncoder(Encoder):
+    def __init__(self, level: int = 3) -> None:
+        import zstandard
+
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encoders() -> dict[str, Callable[[], Encoder]]:
+    """
+    Content codings this process can produce, most preferred first. Brotli
+    and zstd need the compression extra (brotli, zstandard); gzip always works.
+    """
+    encoders: dict[str, Callable[[], Encoder]] = {}
+    try:
+        import brotli  # noqa: F401
+
+        encoders["br"] = BrotliEncoder
+    except ImportError:
+        pass
+    try:
+        import zstandard  # noqa: F401
+
+        encoders["zstd"] = ZstdEncoder
+    except ImportError:
+        pass
+    encoders["gzip"] = GzipEncoder
+    return encoders
+
+
+def negotiate_encoding(accept_encoding: str, preferred: list[str]) -> str | None:
+    """
+    Picks the coding from `preferred` with the highest q-value in an
+    Accept-Encoding header; ties go to the earlier entry of `preferred`.
+    Returns None when the client accepts none of them.
+    """
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for parameter in parameters.split(";"):
+            name, _, value = parameter.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    best, best_weight = None, 0.0
+    for coding in preferred:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with the best coding the client accepts.
+
+    Only responses whose media type is in `content_types` are compressed,
+    so spreadsheets, zips and other compressed artifacts pass through
+    untouched, as do partial content, responses that are already encoded
+    and bodies under `minimum_size` bytes. Streaming responses are
+    compressed chunk by chunk, each chunk flushed to the client as it is
+    sent. A compressed response's ETag is made weak, since its bytes no
+    longer match the representation the strong ETag names.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        minimum_size: int = 1024,
+        content_types: list[str],
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = {content_type.lower() for content_type in content_types}
+        self.encoders = available_encoders()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept_encoding, list(self.encoders))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(
+        self, middleware: CompressionMiddleware, encoding: str, send: Send
+    ) -> None:
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self._start: Message | None = None
+        self._encoder: Encoder | None = None
+        self._passthrough = False
+
+    def _compressible(self, headers: MutableHeaders, status: int) -> bool:
+        media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return (
+            media_type in self.middleware.content_types
+            and status not in (204, 206, 304)
+            and "content-encoding" not in headers
+            and "content-range" not in headers
+        )
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows whether to compress
+            self._start = message
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self._encoder is None:
+            assert self._start is not None
+            start = self._start
+            headers = MutableHeaders(raw=start["headers"])
+            if not self._compressible(headers, start["status"]):
+                self._passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            # A stream's size is only known up front from its Content-Length
+            if more_body:
+                content_length = headers.get("content-length")
+                size = int(content_length) if content_length else None
+            else:
+                size = len(body)
+            if size is not None and size < self.middleware.minimum_size:
+                self._passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+
+            self._encoder = self.middleware.encoders[self.encoding]()
+            headers["Content-Encoding"] = self.encoding
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            if more_body:
+                if "content-length" in headers:
+                    del headers["content-length"]
+            else:
+                body = self._encoder.compress(body) + self._encoder.finish()
+                headers["Content-Length"] = str(len(body))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            await self._send(start)
+
+        if more_body:
+            chunk = self._encoder.compress(body) + self._encoder.flush()
+        else:
+            chunk = self._encoder.compress(body) + self._encoder.finish()
+        await self._send(
+            {"type": "http.response.body", "body": chunk, "more_body": more_body}
+        )
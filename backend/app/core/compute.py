@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+from app.core import progress
+from app.core.capacity import ppc_compute_pool
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ComputePoolSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class ComputePool:
+    """
+    Process pool for CPU-bound PPC work.
+
+    At most `workers + max_queue` tasks are admitted at once. `submit` fails
+    fast with ComputePoolSaturated beyond that, so request handlers can answer
+    503 instead of piling up work; background callers use `run`, which waits
+    for a slot instead. With `workers` set to 0 tasks run in the calling
+    thread (or the ppc_compute capacity pool, for `run_async`).
+
+    Functions and arguments must be picklable: module-level functions and
+    plain data only. Workers start from a fresh interpreter and open their
+    own database connections when they need one. Progress events they
+    publish are relayed back to this process's progress bus.
+    """
+
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self._slots = threading.BoundedSemaphore(max(self.capacity, 1))
+        self._executor: ProcessPoolExecutor | None = None
+        self._progress_queue: Any = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: the app process runs threads, which fork does not copy safely
+                context = multiprocessing.get_context("spawn")
+                if self._progress_queue is None:
+                    self._progress_queue = context.Queue()
+                    threading.Thread(
+                        target=progress.relay_events,
+                        args=(self._progress_queue,),
+                        name="ppc-progress-relay",
+                        daemon=True,
+                    ).start()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=progress.attach_relay,
+                    initargs=(self._progress_queue,),
+                )
+            return self._executor
+
+    def _release(self, _future: Future[Any] | None = None) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def submit(
+        self, fn: Callable[..., Any], *args: Any, block: bool = False, **kwargs: Any
+    ) -> Future[Any]:
+        if not self._slots.acquire(blocking=block):
+            raise ComputePoolSaturated(
+                f"All {self.workers} compute workers are busy and {self.capacity - self.workers} tasks are waiting"
+            )
+        with self._lock:
+            self._in_flight += 1
+        try:
+            try:
+                future = self._get_executor().submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); replace the pool once
+                logger.error("Compute pool broken, restarting worker processes")
+                with self._lock:
+                    self._executor = None
+                future = self._get_executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs `fn` in a worker process, waiting for a free slot if needed."""
+        if self.workers <= 0:
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, block=True, **kwargs).result()
+
+    async def run_async(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs `fn` in a worker process; raises ComputePoolSaturated when full."""
+        if self.workers <= 0:
+            return await ppc_compute_pool.run(fn, *args, **kwargs)
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            queue, self._progress_queue = self._progress_queue, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if queue is not None:
+            queue.put(None)  # Stops the relay thread
+
+
+compute_pool = ComputePool(
+    workers=settings.PPC_COMPUTE_WORKERS, max_queue=settings.PPC_COMPUTE_MAX_QUEUE
+)
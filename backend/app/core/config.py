@@ -1,6 +1,5 @@
-import secrets
 import warnings
-from typing import Annotated, Any, Literal, Type
+from typing import Annotated, Any, Literal
 
 from pydantic import (
     AnyUrl,
@@ -13,6 +12,7 @@ from pydantic import (
 )
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+
 # Function to parse CORS settings
 def parse_cors(v: Any) -> list[str] | str:
     if isinstance(v, str) and not v.startswith("["):
@@ -82,7 +82,7 @@ class Settings(BaseSettings):
     EMAILS_FROM_NAME: EmailStr | None = None
 
     @model_validator(mode="after")
-    def _set_default_emails_from(self) -> Type["Settings"]:
+    def _set_default_emails_from(self) -> type["Settings"]:
         if not self.EMAILS_FROM_NAME:
             self.EMAILS_FROM_NAME = self.PROJECT_NAME
         return self
@@ -105,6 +105,66 @@ class Settings(BaseSettings):
     # --- Token Encryption ---
     TOKEN_ENCRYPTION_KEY: SecretStr | None = None
 
+    # --- PPC File Processing ---
+    TEMP_FILE_DIR: str = "/tmp/ppc_files"
+    TEMP_FILE_CLEANUP_DELAY: int = 3600  # Seconds before processed files are removed
+    TEMP_FILE_SWEEP_INTERVAL: int = 60  # Max seconds between janitor sweeps
+    STORAGE_QUOTA_BYTES: int = 20 * 1024 * 1024 * 1024  # Stored artifact bytes before least recently used ones are evicted
+    STORAGE_USER_QUOTA_BYTES: int = 2 * 1024 * 1024 * 1024  # Artifact bytes charged to one user before theirs are evicted
+    STORAGE_MIN_FREE_BYTES: int = 1024 * 1024 * 1024  # Free space TEMP_FILE_DIR keeps after accepting an upload
+    PPC_MAX_UPLOAD_BYTES: int = 200 * 1024 * 1024  # Larger uploads are rejected with 413
+    PPC_SPOOL_MAX_BYTES: int = 32 * 1024 * 1024  # Inputs/outputs up to this size are processed in memory
+    PPC_JOB_WORKERS: int = 2  # Worker threads per app process; 0 disables job execution
+    PPC_JOB_POLL_INTERVAL: float = 2.0  # Seconds between queue polls when idle
+    PPC_JOB_HEARTBEAT_INTERVAL: float = 30.0  # Seconds between lease renewals of running jobs (and stale job sweeps)
+    PPC_JOB_LEASE: int = 120  # Running jobs whose lease was not renewed for this long are requeued
+    PPC_JOB_MAX_QUEUED: int = 100  # Submissions beyond this many queued jobs get 429
+    PPC_JOB_AGING: int = 300  # Seconds after which a queued job goes ahead regardless of class and size
+    PPC_QUEUE_STATS_WINDOW: int = 3600  # Seconds of started jobs summarized in the job queue statistics
+    PPC_COMPUTE_WORKERS: int = 2  # Processes for CPU-bound PPC work; 0 runs it in-thread
+    PPC_COMPUTE_MAX_QUEUE: int = 4  # Tasks allowed to wait for a compute process before 503
+    PPC_DOWNLOAD_ACCEL_PREFIX: str | None = None  # nginx internal location aliased to the directory mounted at TEMP_FILE_DIR, e.g. "/protected-ppc-files/"
+    PPC_SIGNED_DOWNLOADS: bool = False  # Require HMAC-signed, expiring download URLs
+    PPC_DOWNLOAD_URL_TTL: int = 3600  # Seconds a signed download URL stays valid
+    PPC_BATCH_MAX_FILES: int = 50  # Files per batch, counting those inside zip archives
+    PPC_BATCH_MAX_CONCURRENCY: int = 4  # Upper bound (and default) for a batch's concurrently running jobs
+    PPC_IDEMPOTENCY_TTL: int = 86400  # Seconds an Idempotency-Key keeps returning its first job
+    PPC_ESTIMATE_SAMPLE_ROWS: int = 2000  # Rows evaluated by the bid optimizer's estimate mode
+    PPC_PREVIEW_CACHE_TABLES: int = 8  # Result preview tables kept open per process
+    PPC_PREVIEW_MAX_LIMIT: int = 500  # Most rows per preview page
+    PPC_PROGRESS_INTERVAL: float = 0.5  # Min seconds between progress events of a job
+    PPC_PROGRESS_KEEPALIVE: float = 15.0  # Seconds between SSE keepalives
+    PPC_PROGRESS_SAVE_INTERVAL: float = 2.0  # Seconds between saving running jobs' progress to their rows (and SSE polls of them)
+    PPC_CANCEL_CHECK_INTERVAL: float = 0.5  # Min seconds between checks whether running work was cancelled
+
+    # --- Response Compression (app.core.compression) ---
+    # Brotli and zstd are offered when the compression extra is installed
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # Smaller bodies are sent as-is
+    COMPRESSION_CONTENT_TYPES: Annotated[list[str] | str, BeforeValidator(parse_cors)] = [
+        "application/json",
+        "text/csv",
+        "text/plain",
+        "text/html",
+        "text/css",
+        "application/javascript",
+    ]  # Compressed media types; xlsx, zip and Parquet are already compressed
+
+    # --- Thread Capacity per Workload Class (app.core.capacity) ---
+    CAPACITY_DB_THREADS: int = 40  # AnyIO's default limiter: sync routes and their dependencies
+    CAPACITY_AUTH_THREADS: int = 4  # Password hashing on login, signup and password changes
+    CAPACITY_FILE_IO_THREADS: int = 8  # Upload ingest, artifact transfers, downloads, sweeps
+    CAPACITY_PPC_COMPUTE_THREADS: int = 2  # In-thread PPC processing when PPC_COMPUTE_WORKERS=0
+
+    # --- Artifact Storage ---
+    # "s3" shares inputs and outputs between app nodes; needs the s3 extra (boto3)
+    ARTIFACT_BACKEND: Literal["local", "s3"] = "local"
+    ARTIFACT_S3_BUCKET: str | None = None
+    ARTIFACT_S3_PREFIX: str = "ppc-artifacts/"
+    ARTIFACT_S3_ENDPOINT_URL: str | None = None  # For MinIO and other S3-compatible services
+    ARTIFACT_S3_REGION: str | None = None
+    ARTIFACT_S3_ACCESS_KEY_ID: str | None = None  # Falls back to the standard AWS credential chain
+    ARTIFACT_S3_SECRET_ACCESS_KEY: SecretStr | None = None
+
     def _check_default_secret(self, var_name: str, value: SecretStr | str | None) -> None:
         secret_value = value.get_secret_value() if isinstance(value, SecretStr) else value
         if secret_value == "changethis":
@@ -118,7 +178,7 @@ class Settings(BaseSettings):
                 raise ValueError(message)
 
     @model_validator(mode="after")
-    def _enforce_non_default_secrets(self) -> Type["Settings"]:
+    def _enforce_non_default_secrets(self) -> type["Settings"]:
         self._check_default_secret("SECRET_KEY", self.SECRET_KEY)
         self._check_default_secret("POSTGRES_PASSWORD", self.POSTGRES_PASSWORD)
         self._check_default_secret(
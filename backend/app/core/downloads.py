@@ -0,0 +1,131 @@
+import hashlib
+import re
+from collections.abc import Callable, Iterator
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.core.capacity import file_io_pool
+
+CHUNK_SIZE = 1024 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        while chunk := source.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Returns the inclusive (start, end) byte positions requested by a Range
+    header, or None when the header should be ignored and the whole file
+    served: malformed values, other units and multi-range requests.
+
+    Raises:
+        RangeNotSatisfiable: If the range lies entirely past the end of the file.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(f"Cannot serve the last {length} bytes of {size}")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(f"Range starts at {start}, file has {size} bytes")
+    return start, end
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison against an If-None-Match header, as RFC 9110 requires."""
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in (
+        candidate.removeprefix("W/") for candidate in candidates
+    )
+
+
+def download_response(
+    request: Request,
+    *,
+    sha256: str,
+    size: int,
+    iter_range: Callable[[int, int], Iterator[bytes]],
+    media_type: str,
+    filename: str,
+    accel_redirect: str | None = None,
+) -> Response:
+    """
+    Serves an artifact with a strong ETag derived from its content hash,
+    streaming its bytes from `iter_range(start, end)` in the file_io
+    capacity pool.
+
+    Answers 304 when If-None-Match matches, 206 for a single satisfiable
+    byte range and 416 for an unsatisfiable one. A Range request is only
+    honoured when its If-Range (if any) is the current ETag; date validators
+    fall back to the full body, which is always correct.
+
+    With `accel_redirect` (the nginx internal URI of the file) the body is
+    left to nginx through X-Accel-Redirect, which also serves any ranges.
+    Only a Range with a stale If-Range is still answered here, because nginx
+    would compare it against its own ETag rather than the content hash.
+    """
+    etag = f'"{sha256}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    honour_range = range_header and (if_range is None or if_range.strip() == etag)
+
+    disposition = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if accel_redirect and (honour_range or not range_header):
+        return Response(
+            media_type=media_type,
+            headers={**headers, **disposition, "X-Accel-Redirect": accel_redirect},
+        )
+
+    if range_header and honour_range:
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            return StreamingResponse(
+                file_io_pool.iterate(iter_range(start, end)),
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    **headers,
+                    **disposition,
+                    "Content-Range": f"bytes {start}-{end}/{size}",
+                    "Content-Length": str(end - start + 1),
+                },
+            )
+
+    return StreamingResponse(
+        file_io_pool.iterate(iter_range(0, size - 1) if size else iter(())),
+        media_type=media_type,
+        headers={**headers, **disposition, "Content-Length": str(size)},
+    )
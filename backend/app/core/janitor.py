@@ -0,0 +1,125 @@
+import asyncio
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.artifacts import artifact_store
+from app.core.capacity import file_io_pool
+from app.core.config import settings
+from app.core.db import engine
+from app.core.storage import storage_manager
+
+logger = logging.getLogger(__name__)
+
+
+class TempFileJanitor:
+    """
+    Removes temporary files, and releases artifact references, once their
+    time-to-live runs out.
+
+    Expiries are stored in the tempfileexpiry and artifactref tables, so pending deletions
+    survive restarts and any process's sweep can remove any file. A min-heap
+    of the expiries scheduled by this process tells the sweeper when the next
+    one is due; without local entries it sweeps every `sweep_interval`
+    seconds. Waiting is a plain asyncio wait, so no thread is held between
+    sweeps.
+    """
+
+    def __init__(self, sweep_interval: float) -> None:
+        self.sweep_interval = sweep_interval
+        self._heap: list[tuple[datetime, str]] = []
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    def schedule(self, path: str, ttl: float) -> None:
+        """Removes `path` `ttl` seconds from now, replacing any earlier expiry."""
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        with Session(engine) as session:
+            crud.set_temp_file_expiry(session=session, path=path, expires_at=expires_at)
+        self._remind(expires_at, path)
+
+    def schedule_release(self, key: str, ttl: float) -> None:
+        """Releases the artifact reference `key` `ttl` seconds from now."""
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        with Session(engine) as session:
+            crud.set_artifact_ref_expiry(
+                session=session, key=key, expires_at=expires_at
+            )
+        self._remind(expires_at, key)
+
+    def _remind(self, expires_at: datetime, name: str) -> None:
+        with self._lock:
+            heapq.heappush(self._heap, (expires_at, name))
+            is_next = self._heap[0][1] == name
+        if is_next and self._loop is not None and self._wake is not None:
+            # May be called from job worker threads; wake the sweeper on its loop
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def sweep(self) -> int:
+        """
+        Deletes every file and releases every artifact reference whose expiry
+        has passed. Returns how many were due.
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                heapq.heappop(self._heap)
+        with Session(engine) as session:
+            paths = crud.pop_expired_temp_files(session=session, now=now)
+            released = artifact_store.collect(session, now)
+            storage_manager.enforce(session)
+            crud.delete_expired_idempotency_keys(session=session, now=now)
+            crud.delete_expired_ppc_results(session=session, now=now)
+        for path in paths:
+            try:
+                os.remove(path)
+                logger.info(f"Cleaned up temporary file: {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error during file cleanup for {path}: {e}")
+        return len(paths) + released
+
+    def _seconds_until_next(self) -> float:
+        with self._lock:
+            if not self._heap:
+                return self.sweep_interval
+            due = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+        return min(max(due, 0.0), self.sweep_interval)
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while True:
+            self._wake.clear()
+            try:
+                await file_io_pool.run(self.sweep)
+            except Exception as e:
+                logger.error(f"Temporary file sweep failed: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self._seconds_until_next())
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = self._loop = self._wake = None
+
+
+janitor = TempFileJanitor(sweep_interval=settings.TEMP_FILE_SWEEP_INTERVAL)
@@ -0,0 +1,422 @@
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.cancellation import Cancelled, CancelToken
+from app.core.config import settings
+from app.core.db import engine
+from app.core.progress import progress_bus
+from app.models import PPCBatch, PPCJob
+
+logger = logging.getLogger(__name__)
+
+# A handler runs one job and returns its result; "download_id" in the result
+# is stored on the job row, the rest is kept as the job's result summary.
+JobHandler = Callable[[Session, PPCJob], dict[str, Any]]
+
+# Job kind that zips a finished batch's outputs, for batches submitted with bundle=True
+BATCH_BUNDLE_KIND = "bundle-batch"
+
+# Scheduling classes, first served first: single submissions a user is
+# waiting on, then batch jobs (see crud.claim_ppc_job for the full order).
+# A job's "input_rows" param, when set, is its estimated size.
+PRIORITIES = ("interactive", "batch")
+
+_handlers: dict[str, JobHandler] = {}
+_wakeup = threading.Event()
+# Ids of the jobs this process is running, whose leases the heartbeat renews
+_running: set[Any] = set()
+_running_lock = threading.Lock()
+# Progress last saved per running job, so unchanged progress is not written again
+_saved_progress: dict[Any, dict[str, Any]] = {}
+
+
+class JobQueueFull(Exception):
+    """Raised when PPC_JOB_MAX_QUEUED jobs are already waiting."""
+
+
+class IdempotencyKeyReused(Exception):
+    """Raised when an idempotency key is sent again with a different request."""
+
+
+class JobCancelToken(CancelToken):
+    """Cancelled once DELETE /jobs/{job_id} has asked the job to stop."""
+
+    def __init__(self, job_id: Any, interval: float | None = None) -> None:
+        super().__init__(interval)
+        self.job_id = job_id
+
+    def is_cancelled(self) -> bool:
+        try:
+            with Session(engine) as session:
+                return crud.ppc_job_cancel_requested(
+                    session=session, job_id=self.job_id
+                )
+        except Exception as e:
+            # A failed check must not fail the job; the next one tries again
+            logger.warning(f"Could not check cancellation of job {self.job_id}: {e}")
+            return False
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Registers the decorated function as the handler for jobs of `kind`."""
+
+    def register(handler: JobHandler) -> JobHandler:
+        _handlers[kind] = handler
+        return handler
+
+    return register
+
+
+def submit_job(
+    *,
+    session: Session,
+    kind: str,
+    params: dict[str, Any],
+    owner_id: Any = None,
+    priority: str = "interactive",
+) -> PPCJob:
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown job priority '{priority}'")
+    if crud.count_queued_ppc_jobs(session=session) >= settings.PPC_JOB_MAX_QUEUED:
+        raise JobQueueFull(f"{settings.PPC_JOB_MAX_QUEUED} jobs are already queued")
+    job = crud.create_ppc_job(
+        session=session, kind=kind, params=params, owner_id=owner_id, priority=priority
+    )
+    # Wake an idle worker in this process; workers elsewhere pick it up on their next poll
+    _wakeup.set()
+    return job
+
+
+def submit_job_once(
+    *,
+    session: Session,
+    kind: str,
+    params: dict[str, Any],
+    idempotency_key: str,
+    fingerprint: str,
+    owner_id: Any = None,
+) -> tuple[PPCJob, bool]:
+    """
+    Queues a job unless an earlier request with the same idempotency key
+    (per kind and owner) queued one within PPC_IDEMPOTENCY_TTL seconds.
+    `fingerprint` identifies the request, so a key cannot be reused for a
+    different one.
+
+    Returns:
+        The job, and whether it was queued by this call.
+
+    Raises:
+        IdempotencyKeyReused: If the key was used with a different fingerprint.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+    key = f"{kind}:{owner_id or '-'}:{idempotency_key}"
+    now = datetime.utcnow()
+    # A repeat is answered even when the queue is full
+    record = crud.get_idempotency_key(session=session, key=key, now=now)
+    created = False
+    if record is None:
+        if crud.count_queued_ppc_jobs(session=session) >= settings.PPC_JOB_MAX_QUEUED:
+            raise JobQueueFull(f"{settings.PPC_JOB_MAX_QUEUED} jobs are already queued")
+        job, record, created = crud.create_ppc_job_once(
+            session=session,
+            idempotency_key=key,
+            fingerprint=fingerprint,
+            expires_at=now + timedelta(seconds=settings.PPC_IDEMPOTENCY_TTL),
+            kind=kind,
+            params=params,
+            owner_id=owner_id,
+        )
+    else:
+        # The key is deleted along with its job
+        existing = session.get(PPCJob, record.job_id)
+        assert existing is not None
+        job = existing
+    if record.fingerprint != fingerprint:
+        raise IdempotencyKeyReused(
+            f"Idempotency key '{idempotency_key}' was used for a different request"
+        )
+    if created:
+        _wakeup.set()
+    return job, created
+
+
+def submit_batch(
+    *,
+    session: Session,
+    kind: str,
+    params: list[dict[str, Any]],
+    max_concurrency: int,
+    bundle: bool = False,
+    owner_id: Any = None,
+) -> tuple[PPCBatch, list[PPCJob]]:
+    """Queues one job per entry of `params`, at most `max_concurrency` running at once."""
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+    queued = crud.count_queued_ppc_jobs(session=session)
+    if queued + len(params) > settings.PPC_JOB_MAX_QUEUED:
+        raise JobQueueFull(
+            f"{queued} jobs are queued; {len(params)} more would exceed {settings.PPC_JOB_MAX_QUEUED}"
+        )
+    batch, batch_jobs = crud.create_ppc_batch(
+        session=session,
+        kind=kind,
+        params=params,
+        max_concurrency=max_concurrency,
+        bundle=bundle,
+        owner_id=owner_id,
+    )
+    _wakeup.set()
+    return batch, batch_jobs
+
+
+def _finish_batch(session: Session, batch_id: uuid.UUID) -> None:
+    """Completes a batch once its last job is done, queueing the bundle if wanted."""
+    batch = crud.complete_ppc_batch(session=session, batch_id=batch_id)
+    if batch is None:
+        return
+    logger.info(f"Batch {batch.id} finished")
+    if batch.bundle:
+        # Not subject to PPC_JOB_MAX_QUEUED: the batch was admitted already
+        bundle_job = crud.create_ppc_job(
+            session=session,
+            kind=BATCH_BUNDLE_KIND,
+            params={"batch_id": str(batch.id)},
+            owner_id=batch.owner_id,
+            priority="batch",
+        )
+        batch.bundle_job_id = bundle_job.id
+        session.add(batch)
+        session.commit()
+        _wakeup.set()
+
+
+def cancel_job(*, session: Session, job_id: Any) -> tuple[PPCJob | None, bool]:
+    """
+    Cancels a queued job, or asks a running one to stop: it raises Cancelled
+    at its next check, within PPC_CANCEL_CHECK_INTERVAL seconds of its
+    current row, chunk or stage ending.
+
+    Returns:
+        The job (None if there is none), and whether this call took it off
+        the queue.
+    """
+    job, dequeued = crud.cancel_ppc_job(session=session, job_id=job_id)
+    if dequeued and job is not None:
+        logger.info(f"{job.kind} job {job.id} cancelled before it started")
+        progress_bus.publish({"job_id": str(job.id), "status": job.status})
+        if job.batch_id is not None:
+            _finish_batch(session, job.batch_id)
+    return job, dequeued
+
+
+def run_next_job() -> bool:
+    """Claims and runs one queued job. Returns False when the queue is empty."""
+    with Session(engine) as session:
+        aged_before = datetime.utcnow() - timedelta(seconds=settings.PPC_JOB_AGING)
+        job = crud.claim_ppc_job(session=session, aged_before=aged_before)
+        if not job:
+            return False
+        logger.info(f"Running {job.kind} job {job.id}")
+        job_id = str(job.id)
+        progress_bus.publish(
+            {"job_id": job_id, "status": "running", "stage": "started"}
+        )
+        with _running_lock:
+            _running.add(job.id)
+        try:
+            result = _handlers[job.kind](session, job)
+        except Cancelled:
+            logger.info(f"{job.kind} job {job.id} cancelled")
+            session.rollback()
+            crud.finish_ppc_job(session=session, job=job, cancelled=True)
+        except Exception as e:
+            logger.error(f"{job.kind} job {job.id} failed: {e}", exc_info=True)
+            session.rollback()
+            crud.finish_ppc_job(
+                session=session, job=job, error=str(e) or type(e).__name__
+            )
+        else:
+            crud.finish_ppc_job(session=session, job=job, result=result)
+            logger.info(f"{job.kind} job {job.id} succeeded")
+        finally:
+            with _running_lock:
+                _running.discard(job.id)
+        progress_bus.publish({"job_id": job_id, "status": job.status})
+        if job.batch_id is not None:
+            _finish_batch(session, job.batch_id)
+        return True
+
+
+def save_progress() -> None:
+    """
+    Saves the latest progress of the jobs this process is running to their
+    rows, where SSE streams served by other processes read it.
+    """
+    with _running_lock:
+        job_ids = list(_running)
+    for job_id in list(_saved_progress):
+        if job_id not in job_ids:
+            del _saved_progress[job_id]
+    changed = {}
+    for job_id in job_ids:
+        event = progress_bus.latest(str(job_id))
+        if event is not None and event != _saved_progress.get(job_id):
+            changed[job_id] = event
+    if not changed:
+        return
+    with Session(engine) as session:
+        crud.save_ppc_job_progress(
+            session=session, progress=changed, now=datetime.utcnow()
+        )
+    _saved_progress.update(changed)
+
+
+def renew_leases() -> None:
+    """Renews the leases of the jobs this process is running."""
+    with _running_lock:
+        job_ids = list(_running)
+    if not job_ids:
+        return
+    with Session(engine) as session:
+        crud.renew_ppc_job_leases(
+            session=session, job_ids=job_ids, now=datetime.utcnow()
+        )
+
+
+def requeue_stale_jobs() -> int:
+    """
+    Requeues running jobs whose lease expired PPC_JOB_LEASE seconds ago:
+    the process running them died, or has been cut off from the database.
+    Returns the number of jobs requeued.
+    """
+    expired_before = datetime.utcnow() - timedelta(seconds=settings.PPC_JOB_LEASE)
+    with Session(engine) as session:
+        requeued, cancelled = crud.requeue_stale_ppc_jobs(
+            session=session, expired_before=expired_before
+        )
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale PPC jobs")
+            _wakeup.set()
+        for job in cancelled:
+            logger.info(f"Stale {job.kind} job {job.id} cancelled")
+            progress_bus.publish({"job_id": str(job.id), "status": job.status})
+            if job.batch_id is not None:
+                _finish_batch(session, job.batch_id)
+    return requeued
+
+
+def queue_statistics(*, session: Session) -> list[dict[str, Any]]:
+    """
+    Time in queue per priority class: the jobs queued now and how long the
+    oldest has waited, and the waits of jobs started in the last
+    PPC_QUEUE_STATS_WINDOW seconds.
+    """
+    now = datetime.utcnow()
+    started_after = now - timedelta(seconds=settings.PPC_QUEUE_STATS_WINDOW)
+    queued: dict[str, list[float]] = {priority: [] for priority in PRIORITIES}
+    waits: dict[str, list[float]] = {priority: [] for priority in PRIORITIES}
+    for priority, created_at, started_at in crud.get_ppc_job_waits(
+        session=session, started_after=started_after
+    ):
+        if started_at is None:
+            queued[priority].append((now - created_at).total_seconds())
+        else:
+            waits[priority].append((started_at - created_at).total_seconds())
+    statistics = []
+    for priority in PRIORITIES:
+        started = sorted(waits[priority])
+        p95 = (
+            started[min(int(len(started) * 0.95), len(started) - 1)] if started else 0.0
+        )
+        statistics.append(
+            {
+                "priority": priority,
+                "queued": len(queued[priority]),
+                "oldest_queued_ms": round(max(queued[priority], default=0.0) * 1000, 3),
+                "started": len(started),
+                "wait_avg_ms": round(sum(started) / len(started) * 1000, 3)
+                if started
+                else 0.0,
+                "wait_p95_ms": round(p95 * 1000, 3),
+                "wait_max_ms": round(started[-1] * 1000, 3) if started else 0.0,
+            }
+        )
+    return statistics
+
+
+class JobWorkerPool:
+    """
+    Threads that drain the job table until stopped, and one that saves the
+    progress of their jobs every PPC_PROGRESS_SAVE_INTERVAL seconds, and
+    renews their leases and requeues the jobs of dead processes every
+    PPC_JOB_HEARTBEAT_INTERVAL seconds.
+    """
+
+    def __init__(self, workers: int, poll_interval: float) -> None:
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stopping = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        if self.workers <= 0:
+            return
+        self._stopping.clear()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, name="ppc-job-heartbeat", daemon=True
+        )
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"ppc-job-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stopping.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                if run_next_job():
+                    continue
+            except Exception as e:
+                # Database unavailable or similar; back off for one poll interval
+                logger.error(f"PPC job worker error: {e}", exc_info=True)
+            _wakeup.wait(self.poll_interval)
+            _wakeup.clear()
+
+    def _heartbeat(self) -> None:
+        next_sweep = 0.0
+        while not self._stopping.is_set():
+            try:
+                save_progress()
+                if time.monotonic() >= next_sweep:
+                    next_sweep = time.monotonic() + settings.PPC_JOB_HEARTBEAT_INTERVAL
+                    renew_leases()
+                    requeue_stale_jobs()
+            except Exception as e:
+                logger.error(f"PPC job heartbeat error: {e}", exc_info=True)
+            self._stopping.wait(settings.PPC_PROGRESS_SAVE_INTERVAL)
+
+
+worker_pool = JobWorkerPool(
+    workers=settings.PPC_JOB_WORKERS, poll_interval=settings.PPC_JOB_POLL_INTERVAL
+)
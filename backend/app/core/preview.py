@@ -0,0 +1,272 @@
+import base64
+import functools
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, NamedTuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from app.core.artifacts import artifact_store
+from app.core.config import settings
+
+# Position of each row in its sheet: the keyset tie-breaker, returned with every row
+ROW_COLUMN = "_row"
+
+FILTER_OPS = ("eq", "ne", "lt", "le", "gt", "ge", "contains", "in", "null", "notnull")
+
+
+class InvalidPreviewQuery(ValueError):
+    pass
+
+
+class PreviewFilter(NamedTuple):
+    column: str
+    op: str
+    value: str
+
+
+def parse_filter(expression: str) -> PreviewFilter:
+    """
+    Parses "<column>:<op>[:<value>]", e.g. "Update:eq:Update" or
+    "Campaign Name:contains:shoes". `in` takes comma-separated values.
+    """
+    column, _, rest = expression.partition(":")
+    op, _, value = rest.partition(":")
+    if not column or op not in FILTER_OPS:
+        raise InvalidPreviewQuery(
+            f"Filter '{expression}' must be <column>:<op>:<value> with op one of {', '.join(FILTER_OPS)}"
+        )
+    return PreviewFilter(column, op, value)
+
+
+def _normalize_column(column: pd.Series) -> pd.Series:
+    # Parquet columns need one type; spreadsheet columns mixing text and
+    # numbers (or other objects) are stored as text
+    kind = pd.api.types.infer_dtype(column, skipna=True)
+    if column.dtype == object and kind not in (
+        "string",
+        "empty",
+        "boolean",
+        "datetime",
+        "date",
+    ):
+        return column.map(lambda value: None if pd.isna(value) else str(value))
+    return column
+
+
+def write_preview_tables(source: Any, directory: str) -> list[tuple[str, str]]:
+    """
+    Converts every sheet of a workbook into a Parquet file in `directory`,
+    with a ROW_COLUMN holding each row's position. Returns (sheet name,
+    path) pairs in sheet order; nothing is left behind on failure.
+    """
+    written: list[tuple[str, str]] = []
+    try:
+        for sheet, frame in pd.read_excel(source, sheet_name=None).items():
+            frame.columns = [str(column) for column in frame.columns]
+            frame = frame.apply(_normalize_column)
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            table = table.append_column(
+                ROW_COLUMN, pa.array(range(len(frame)), pa.int64())
+            )
+            path = os.path.join(directory, f"preview_{uuid.uuid4()}.parquet")
+            pq.write_table(table, path)
+            written.append((str(sheet), path))
+    except BaseException:
+        for _, path in written:
+            os.remove(path)
+        raise
+    return written
+
+
+def _scalar(value: Any, field: pa.Field) -> pa.Scalar:
+    """Converts a filter or cursor value to the column's type."""
+    try:
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            return pa.scalar(float(value))
+        if pa.types.is_boolean(field.type):
+            return pa.scalar(str(value).lower() in ("true", "1", "yes"))
+        if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+            return pa.scalar(pd.Timestamp(value).to_pydatetime())
+    except (TypeError, ValueError):
+        raise InvalidPreviewQuery(
+            f"'{value}' is not a valid value for column '{field.name}'"
+        )
+    return pa.scalar(str(value))
+
+
+def _filter_mask(table: pa.Table, preview_filter: PreviewFilter) -> pa.ChunkedArray:
+    if preview_filter.column not in table.column_names:
+        raise InvalidPreviewQuery(f"Unknown column '{preview_filter.column}'")
+    column = table[preview_filter.column]
+    field = table.schema.field(preview_filter.column)
+    op, value = preview_filter.op, preview_filter.value
+    if op == "null":
+        return pc.is_null(column)
+    if op == "notnull":
+        return pc.is_valid(column)
+    if op == "contains":
+        text = (
+            column if pa.types.is_string(field.type) else pc.cast(column, pa.string())
+        )
+        return pc.match_substring(text, value, ignore_case=True)
+    if op == "in":
+        masks = [
+            pc.equal(column, _scalar(item.strip(), field)) for item in value.split(",")
+        ]
+        return functools.reduce(pc.or_, masks)
+    compare = {
+        "eq": pc.equal,
+        "ne": pc.not_equal,
+        "lt": pc.less,
+        "le": pc.less_equal,
+        "gt": pc.greater,
+        "ge": pc.greater_equal,
+    }[op]
+    return compare(column, _scalar(value, field))
+
+
+def _json_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def _fingerprint(filters: list[PreviewFilter], sort: str | None) -> str:
+    return hashlib.sha256(json.dumps([filters, sort]).encode()).hexdigest()[:16]
+
+
+def encode_cursor(fingerprint: str, value: Any, row: int) -> str:
+    payload = json.dumps({"q": fingerprint, "v": _json_value(value), "r": row})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> tuple[Any, int]:
+    try:
+        payload = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        value, row, query = payload["v"], int(payload["r"]), payload["q"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidPreviewQuery("Invalid cursor")
+    if query != fingerprint:
+        raise InvalidPreviewQuery("Cursor belongs to a different filter or sort")
+    return value, row
+
+
+def query_preview(
+    table: pa.Table,
+    *,
+    filters: list[PreviewFilter],
+    sort: str | None = None,
+    limit: int = 50,
+    cursor: str | None = None,
+) -> dict[str, Any]:
+    """
+    Returns one page of `table`: the rows matching every filter, ordered by
+    `sort` ("-<column>" for descending; nulls last) and then by row, after
+    the row named by `cursor`. Only the filter and sort columns are scanned;
+    a page is picked with a top-k selection instead of a full sort, so its
+    cost grows with the table size but not with the page position.
+
+    Raises:
+        InvalidPreviewQuery: For unknown columns, bad values or a cursor
+            from another query.
+    """
+    descending = bool(sort and sort.startswith("-"))
+    sort_column = sort.lstrip("-") if sort else None
+    if sort_column is not None and sort_column not in table.column_names:
+        raise InvalidPreviewQuery(f"Unknown column '{sort_column}'")
+    fingerprint = _fingerprint(filters, sort)
+
+    rows = table[ROW_COLUMN]
+    mask = pc.is_valid(rows)
+    for preview_filter in filters:
+        mask = pc.and_(mask, pc.fill_null(_filter_mask(table, preview_filter), False))
+    total = pc.sum(mask).as_py() or 0
+
+    if cursor is not None:
+        value, row = decode_cursor(cursor, fingerprint)
+        after_row = pc.greater(rows, row)
+        if sort_column is None:
+            after = after_row
+        else:
+            column = table[sort_column]
+            if value is None:
+                after = pc.and_(pc.is_null(column), after_row)
+            else:
+                bound = _scalar(value, table.schema.field(sort_column))
+                beyond = (pc.less if descending else pc.greater)(column, bound)
+                tied = pc.and_(pc.equal(column, bound), after_row)
+                after = pc.or_(
+                    pc.or_(pc.fill_null(beyond, False), pc.fill_null(tied, False)),
+                    pc.is_null(column),
+                )
+        mask = pc.and_(mask, after)
+
+    # Rows are stored in sheet order, so a row's position is its ROW_COLUMN value
+    positions = pc.indices_nonzero(mask)
+    if sort_column is None:
+        selected = positions[: limit + 1]
+    else:
+        candidates = pa.table(
+            {"value": pc.take(table[sort_column], positions), "row": positions}
+        )
+        order = "descending" if descending else "ascending"
+        top = pc.select_k_unstable(
+            candidates, k=limit + 1, sort_keys=[("value", order), ("row", "ascending")]
+        )
+        selected = pc.take(candidates["row"], top)
+
+    page = table.take(selected[:limit])
+    next_cursor = None
+    if len(selected) > limit:
+        last = page.slice(limit - 1, 1).to_pylist()[0]
+        next_cursor = encode_cursor(
+            fingerprint, last[sort_column] if sort_column else None, last[ROW_COLUMN]
+        )
+    return {
+        "columns": table.column_names,
+        "rows": page.to_pylist(),
+        "total": total,
+        "next_cursor": next_cursor,
+    }
+
+
+class PreviewTables:
+    """
+    Most recently used preview tables, keyed by blob name. Local blobs are
+    memory-mapped, so holding one costs little until its pages are touched;
+    remote ones are read into memory once.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._tables: OrderedDict[str, pa.Table] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> pa.Table:
+        with self._lock:
+            if name in self._tables:
+                self._tables.move_to_end(name)
+                return self._tables[name]
+        path = artifact_store.backend.local_path(name)
+        if path is not None:
+            table = pq.read_table(path, memory_map=True)
+        else:
+            with artifact_store.backend.local_copy(name) as copy:
+                table = pq.read_table(copy)
+        with self._lock:
+            self._tables[name] = table
+            while len(self._tables) > self.capacity:
+                self._tables.popitem(last=False)
+        return table
+
+
+preview_tables = PreviewTables(settings.PPC_PREVIEW_CACHE_TABLES)
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from app.core.cancellation import CancelToken
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+# Set in compute worker processes, whose events are relayed to the app process
+_relay: Any = None
+
+
+class Subscription:
+    """Events for one job, delivered to a single listener on its event loop."""
+
+    def __init__(self, job_id: str, loop: asyncio.AbstractEventLoop) -> None:
+        self.job_id = job_id
+        self._loop = loop
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=16)
+
+    def _offer(self, event: dict[str, Any]) -> None:
+        # Events are snapshots, so a listener that falls behind only needs the newest
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    def deliver(self, event: dict[str, Any]) -> None:
+        self._loop.call_soon_threadsafe(self._offer, event)
+
+    async def get(self) -> dict[str, Any]:
+        return await self._queue.get()
+
+
+class ProgressBus:
+    """
+    In-process publish/subscribe for job progress events.
+
+    Publishers are job worker threads (or the relay from compute processes);
+    subscribers are SSE responses on the event loop. The newest event of each
+    running job is kept so new subscribers start from the current state, and
+    dropped once the job finishes. Events only reach subscribers in the
+    process that runs the job; the job worker pool saves the newest to the
+    job row for listeners elsewhere (see jobs.save_progress).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._latest: dict[str, dict[str, Any]] = {}
+        self._subscribers: dict[str, set[Subscription]] = {}
+
+    def publish(self, event: dict[str, Any]) -> None:
+        job_id = event["job_id"]
+        with self._lock:
+            if event.get("status") in FINISHED_STATUSES:
+                self._latest.pop(job_id, None)
+            else:
+                self._latest[job_id] = event
+            subscribers = list(self._subscribers.get(job_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # The listener's event loop has closed; it unsubscribes on its own
+                pass
+
+    def latest(self, job_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            return self._latest.get(job_id)
+
+    @contextmanager
+    def subscribe(self, job_id: str) -> Iterator[Subscription]:
+        """Listens for events of `job_id` for the duration of the block."""
+        subscription = Subscription(job_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(job_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[job_id]
+
+
+progress_bus = ProgressBus()
+
+
+def publish(event: dict[str, Any]) -> None:
+    """Publishes an event to this process's bus, or relays it from a compute worker."""
+    if _relay is not None:
+        _relay.put(event)
+    else:
+        progress_bus.publish(event)
+
+
+def attach_relay(queue: Any) -> None:
+    """Compute worker initializer: send progress events through `queue`."""
+    global _relay
+    _relay = queue
+
+
+def relay_events(queue: Any) -> None:
+    """Publishes events arriving from compute workers until a None is received."""
+    while True:
+        event = queue.get()
+        if event is None:
+            return
+        try:
+            progress_bus.publish(event)
+        except Exception as e:
+            logger.error(f"Error relaying progress event: {e}")
+
+
+class ProgressReporter:
+    """
+    Reports the progress of one job as it moves through named stages.
+
+    Processing code calls `stage` when it starts a step and `advance` as rows
+    are done; `advance` only publishes once every PPC_PROGRESS_INTERVAL
+    seconds, so calling it per row costs a clock read. Events carry the
+    stage, rows processed and (when the total is known) rows/sec and ETA.
+
+    With a `cancel` token, every `stage` and `advance` call also checks it
+    and raises Cancelled once the work is no longer wanted, so processing
+    stops at its next row, chunk or stage.
+
+    Reporters are picklable and can be passed to compute workers. One made
+    without a job ID reports nothing.
+    """
+
+    def __init__(
+        self,
+        job_id: str | None,
+        interval: float | None = None,
+        cancel: CancelToken | None = None,
+    ) -> None:
+        self.job_id = job_id
+        self.cancel = cancel
+        self.interval = settings.PPC_PROGRESS_INTERVAL if interval is None else interval
+        self.stage_name: str | None = None
+        self.rows_total: int | None = None
+        self.rows_processed = 0
+        self._started = 0.0
+        self._next_report = 0.0
+
+    def stage(self, name: str, total: int | None = None) -> None:
+        """Starts stage `name` of `total` rows (None when unknown) and reports it."""
+        if self.cancel is not None:
+            self.cancel.check()
+        self.stage_name = name
+        self.rows_total = total
+        self.rows_processed = 0
+        self._started = time.monotonic()
+        self._report(self._started)
+
+    def advance(self, rows: int = 1) -> None:
+        if self.cancel is not None:
+            self.cancel.check()
+        self.rows_processed += rows
+        now = time.monotonic()
+        if now >= self._next_report:
+            self._report(now)
+
+    def _report(self, now: float) -> None:
+        if self.job_id is None:
+            return
+        self._next_report = now + self.interval
+        elapsed = now - self._started
+        rate = self.rows_processed / elapsed if elapsed > 0 else None
+        eta = None
+        if rate and self.rows_total is not None:
+            eta = round(max(self.rows_total - self.rows_processed, 0) / rate, 1)
+        publish(
+            {
+                "job_id": self.job_id,
+                "status": "running",
+                "stage": self.stage_name,
+                "rows_processed": self.rows_processed,
+                "rows_total": self.rows_total,
+                "rows_per_sec": round(rate, 1) if rate is not None else None,
+                "eta_seconds": eta,
+            }
+        )
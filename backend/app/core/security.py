@@ -1,3 +1,5 @@
+import hashlib
+import hmac
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
@@ -14,12 +16,21 @@ def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     # Check if SECRET_KEY is empty
     if not settings.SECRET_KEY.get_secret_value():
         raise ValueError("SECRET_KEY must be a non-empty string.")
-    
+
     expire = datetime.now(timezone.utc) + expires_delta
     to_encode = {"exp": expire, "sub": str(subject)}
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY.get_secret_value(), algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_download_signature(download_id: str, expires: int) -> str:
+    message = f"{download_id}:{expires}".encode()
+    return hmac.new(settings.SECRET_KEY.get_secret_value().encode(), message, hashlib.sha256).hexdigest()
+
+def verify_download_signature(download_id: str, expires: int, signature: str) -> bool:
+    if expires < datetime.now(timezone.utc).timestamp():
+        return False
+    return hmac.compare_digest(create_download_signature(download_id, expires), signature)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -0,0 +1,182 @@
+import logging
+import shutil
+import threading
+import uuid
+from datetime import datetime
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.artifacts import ArtifactStore, artifact_store
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# References looked at per eviction query
+EVICTION_BATCH = 200
+
+
+class InsufficientStorage(Exception):
+    """Raised when an upload does not fit even after evicting what may be evicted."""
+
+
+class StorageManager:
+    """
+    Keeps stored artifacts within a global and a per-user byte budget.
+
+    Usage is read from the artifact tables. Each blob counts once toward
+    STORAGE_QUOTA_BYTES; a user is charged the blob size of every
+    reference they own toward STORAGE_USER_QUOTA_BYTES. When a budget is
+    exceeded, the least recently used unpinned references are expired:
+    preview caches before user results, and never the inputs of pending
+    jobs. The artifact store's `collect` then removes blobs nothing refers
+    to. Every eviction and rejection is logged.
+
+    `reserve` runs before an upload is accepted. It also keeps
+    STORAGE_MIN_FREE_BYTES free in `directory`. Evicting only frees local
+    disk when blobs are stored there; with S3 storage it does not.
+    """
+
+    def __init__(
+        self,
+        store: ArtifactStore,
+        directory: str,
+        *,
+        quota: int,
+        user_quota: int,
+        min_free: int,
+    ) -> None:
+        self.store = store
+        self.directory = directory
+        self.quota = quota
+        self.user_quota = user_quota
+        self.min_free = min_free
+        # One eviction at a time per process; concurrent ones would pick the same references
+        self._lock = threading.Lock()
+
+    def free_bytes(self) -> int:
+        return shutil.disk_usage(self.directory).free
+
+    def evict(
+        self,
+        session: Session,
+        needed: int,
+        *,
+        reason: str,
+        owner_id: uuid.UUID | None = None,
+    ) -> int:
+        """
+        Expires least recently used references until `needed` bytes are
+        freed. Only `owner_id`'s references are taken when it is given, and
+        then each counts its full size, since that is what the user is
+        charged. Otherwise a blob counts once all its references are taken.
+        Returns the bytes freed.
+        """
+        freed = 0
+        now = datetime.utcnow()
+        taken: dict[str, int] = {}
+        with self._lock:
+            while freed < needed:
+                candidates = crud.get_evictable_artifact_refs(
+                    session=session, now=now, limit=EVICTION_BATCH, owner_id=owner_id
+                )
+                if not candidates:
+                    break
+                evicted = []
+                for key, role, _, sha256, size, refcount, accessed_at in candidates:
+                    if freed >= needed:
+                        break
+                    evicted.append(key)
+                    taken[sha256] = taken.get(sha256, 0) + 1
+                    if owner_id is not None or taken[sha256] >= refcount:
+                        freed += size
+                    logger.info(
+                        f"Evicting {role} {key} ({size} bytes, last used {accessed_at:%Y-%m-%d %H:%M}) for {reason}"
+                    )
+                crud.expire_artifact_refs(session=session, keys=evicted, now=now)
+            if taken:
+                self.store.collect(session, now)
+        logger.info(
+            f"Evicted {sum(taken.values())} references, {freed} of {needed} bytes needed, for {reason}"
+        )
+        return freed
+
+    def enforce(self, session: Session) -> int:
+        """Evicts down to the global and every per-user quota. Returns the bytes freed."""
+        freed = 0
+        over = crud.get_artifact_bytes(session=session) - self.quota
+        if over > 0:
+            freed += self.evict(session, over, reason="global quota")
+        charged = crud.get_owner_artifact_bytes(session=session, now=datetime.utcnow())
+        for owner_id, used in charged.items():
+            if used > self.user_quota:
+                freed += self.evict(
+                    session,
+                    used - self.user_quota,
+                    reason=f"quota of user {owner_id}",
+                    owner_id=owner_id,
+                )
+        return freed
+
+    def reserve(
+        self, session: Session, size: int, owner_id: uuid.UUID | None = None
+    ) -> None:
+        """
+        Makes room for an upload of `size` bytes, evicting as needed.
+
+        Raises:
+            InsufficientStorage: If the upload would still exceed a quota or
+                leave less than `min_free` bytes free.
+        """
+        over = crud.get_artifact_bytes(session=session) + size - self.quota
+        if over > 0:
+            self.evict(session, over, reason="global quota")
+            if crud.get_artifact_bytes(session=session) + size > self.quota:
+                logger.warning(
+                    f"Rejected {size} byte upload: storage quota of {self.quota} bytes is used up"
+                )
+                raise InsufficientStorage(
+                    "The server's storage is full. Please try again later."
+                )
+        if owner_id is not None:
+            now = datetime.utcnow()
+            used = crud.get_owner_artifact_bytes(
+                session=session, now=now, owner_id=owner_id
+            ).get(owner_id, 0)
+            if used + size > self.user_quota:
+                self.evict(
+                    session,
+                    used + size - self.user_quota,
+                    reason=f"quota of user {owner_id}",
+                    owner_id=owner_id,
+                )
+                used = crud.get_owner_artifact_bytes(
+                    session=session, now=now, owner_id=owner_id
+                ).get(owner_id, 0)
+                if used + size > self.user_quota:
+                    logger.warning(
+                        f"Rejected {size} byte upload of user {owner_id}: {used} of {self.user_quota} bytes in use"
+                    )
+                    raise InsufficientStorage(
+                        "Your storage quota is used up by files still being processed. Please try again later."
+                    )
+        short = self.min_free + size - self.free_bytes()
+        if short > 0:
+            if self.store.backend.local_path("") is not None:
+                self.evict(session, short, reason="free disk space")
+            if self.min_free + size > self.free_bytes():
+                logger.warning(
+                    f"Rejected {size} byte upload: {self.free_bytes()} bytes free in {self.directory}"
+                )
+                raise InsufficientStorage(
+                    "The server is low on disk space. Please try again later."
+                )
+
+
+storage_manager = StorageManager(
+    artifact_store,
+    settings.TEMP_FILE_DIR,
+    quota=settings.STORAGE_QUOTA_BYTES,
+    user_quota=settings.STORAGE_USER_QUOTA_BYTES,
+    min_free=settings.STORAGE_MIN_FREE_BYTES,
+)
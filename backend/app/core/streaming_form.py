@@ -0,0 +1,231 @@
+import os
+import uuid
+from collections.abc import AsyncIterator, Callable, Coroutine
+from typing import Any, BinaryIO
+
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from starlette.datastructures import FormData, Headers, UploadFile
+
+from app.core.capacity import file_io_pool
+from app.core.config import settings
+from app.core.uploads import CHUNK_SIZE, UploadDigest, UploadTooLarge
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart  # type: ignore[no-redef, import-untyped]
+    from multipart.multipart import parse_options_header  # type: ignore[no-redef, import-untyped]
+
+# Largest non-file field, as in Starlette's own parser
+MAX_FIELD_BYTES = 1024 * 1024
+
+
+class MalformedForm(ValueError):
+    pass
+
+
+class StreamedUpload(UploadFile):
+    """
+    A file part that was written to `path` while the request body arrived;
+    `digest` was fed every byte of it. Closing it removes the file unless it
+    was moved away (see `uploads.adopt_upload`).
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        path: str,
+        digest: UploadDigest,
+        filename: str,
+        headers: Headers,
+    ) -> None:
+        super().__init__(file, size=digest.size, filename=filename, headers=headers)
+        self.path = path
+        self.digest = digest
+
+    async def close(self) -> None:
+        await super().close()
+        await file_io_pool.run(_remove, self.path)
+
+
+def _remove(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _write(file: BinaryIO, digest: UploadDigest, data: bytes) -> None:
+    digest.update(data)
+    file.write(data)
+
+
+async def parse_form(
+    headers: Headers,
+    stream: AsyncIterator[bytes],
+    directory: str,
+    *,
+    max_bytes: int,
+    max_files: int | float = 1000,
+    max_fields: int | float = 1000,
+) -> FormData:
+    """
+    Parses a multipart/form-data body while it is received. Each file part
+    is written to `directory` in CHUNK_SIZE pieces, hashed and counted on
+    the way, and becomes a StreamedUpload; nothing is left behind when
+    parsing fails.
+
+    Raises:
+        UploadTooLarge: Within CHUNK_SIZE bytes of a file part exceeding
+            `max_bytes`, before the rest of the body is read.
+        MalformedForm: If the body is not valid multipart/form-data or has
+            too many or too large parts.
+    """
+    _, options = parse_options_header(headers.get("Content-Type"))
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise MalformedForm("Missing boundary in multipart.")
+
+    events: list[tuple[str, bytes]] = []
+
+    def on_data(name: str) -> Callable[[bytes, int, int], None]:
+        return lambda data, start, end: events.append((name, data[start:end]))
+
+    def on_event(name: str) -> Callable[[], None]:
+        return lambda: events.append((name, b""))
+
+    parser = multipart.MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_event("part_begin"),
+            "on_part_data": on_data("part_data"),
+            "on_part_end": on_event("part_end"),
+            "on_header_field": on_data("header_field"),
+            "on_header_value": on_data("header_value"),
+            "on_header_end": on_event("header_end"),
+            "on_headers_finished": on_event("headers_finished"),
+        },
+    )
+    items: list[tuple[str, str | UploadFile]] = []
+    opened: list[tuple[BinaryIO, str]] = []
+    files = fields = 0
+    part_headers: list[tuple[bytes, bytes]] = []
+    header_field = header_value = b""
+    name = ""
+    filename: str | None = None
+    data = bytearray()
+    file: BinaryIO | None = None
+    path = ""
+    digest = UploadDigest(max_bytes)
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+            for event, value in events:
+                if event == "part_begin":
+                    part_headers = []
+                    data = bytearray()
+                    file = None
+                elif event == "header_field":
+                    header_field += value
+                elif event == "header_value":
+                    header_value += value
+                elif event == "header_end":
+                    part_headers.append((header_field.lower(), header_value))
+                    header_field = header_value = b""
+                elif event == "headers_finished":
+                    disposition = dict(part_headers).get(b"content-disposition", b"")
+                    _, part_options = parse_options_header(disposition)
+                    if b"name" not in part_options:
+                        raise MalformedForm(
+                            'The Content-Disposition header field "name" must be provided.'
+                        )
+                    name = part_options[b"name"].decode("utf-8", "replace")
+                    if b"filename" in part_options:
+                        files += 1
+                        if files > max_files:
+                            raise MalformedForm(
+                                f"Too many files. Maximum number of files is {max_files}."
+                            )
+                        filename = part_options[b"filename"].decode("utf-8", "replace")
+                        path = os.path.join(directory, f"upload_{uuid.uuid4()}.part")
+                        part_file: BinaryIO = await file_io_pool.run(open, path, "w+b")
+                        opened.append((part_file, path))
+                        file = part_file
+                        digest = UploadDigest(max_bytes)
+                    else:
+                        fields += 1
+                        if fields > max_fields:
+                            raise MalformedForm(
+                                f"Too many fields. Maximum number of fields is {max_fields}."
+                            )
+                        filename = None
+                elif event == "part_data":
+                    data += value
+                    if file is None and len(data) > MAX_FIELD_BYTES:
+                        raise MalformedForm(
+                            f"Field {name} exceeds {MAX_FIELD_BYTES} bytes."
+                        )
+                    if file is not None and len(data) >= CHUNK_SIZE:
+                        await file_io_pool.run(_write, file, digest, bytes(data))
+                        data = bytearray()
+                elif event == "part_end":
+                    if file is None:
+                        items.append((name, data.decode("utf-8", "replace")))
+                    else:
+                        await file_io_pool.run(_write, file, digest, bytes(data))
+                        await file_io_pool.run(file.seek, 0)
+                        upload = StreamedUpload(
+                            file,
+                            path,
+                            digest,
+                            filename or "",
+                            Headers(raw=part_headers),
+                        )
+                        items.append((name, upload))
+            events.clear()
+        parser.finalize()
+    except BaseException:
+        for opened_file, opened_path in opened:
+            opened_file.close()
+            _remove(opened_path)
+        raise
+    return FormData(items)
+
+
+class StreamingUploadRequest(Request):
+    """
+    Request whose multipart form is parsed by `parse_form` into
+    TEMP_FILE_DIR, answering 413 as soon as a file exceeds
+    PPC_MAX_UPLOAD_BYTES, instead of being spooled in full by Starlette.
+    """
+
+    async def _get_form(self, **limits: Any) -> FormData:
+        content_type, _ = parse_options_header(self.headers.get("Content-Type"))
+        if self._form is None and content_type == b"multipart/form-data":
+            try:
+                self._form = await parse_form(
+                    self.headers,
+                    self.stream(),
+                    settings.TEMP_FILE_DIR,
+                    max_bytes=settings.PPC_MAX_UPLOAD_BYTES,
+                    max_files=limits.get("max_files", 1000),
+                    max_fields=limits.get("max_fields", 1000),
+                )
+            except UploadTooLarge as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            except ValueError as e:
+                # MalformedForm, or a parse error of python-multipart
+                raise HTTPException(status_code=400, detail=str(e))
+        return await super()._get_form(**limits)
+
+
+class StreamingUploadRoute(APIRoute):
+    """Route class whose requests' file uploads are streamed to disk; see `StreamingUploadRequest`."""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def streaming_upload_handler(request: Request) -> Response:
+            return await handler(StreamingUploadRequest(request.scope, request.receive))
+
+        return streaming_upload_handler
@@ -0,0 +1,258 @@
+import hashlib
+import io
+import os
+import re
+import uuid
+import zipfile
+from typing import IO, BinaryIO, NamedTuple
+
+CHUNK_SIZE = 1024 * 1024
+SNIFF_BYTES = 8192  # Leading bytes a file type is identified from
+
+# Leading bytes of each accepted spreadsheet format
+XLSX_MAGIC = b"PK\x03\x04"  # Office Open XML is a zip archive
+XLS_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"  # OLE2 compound document
+TEXT_BYTES = (
+    b"\t\n\r\x0c" + bytes(range(0x20, 0x7F)) + bytes(range(0x80, 0x100))
+)  # Any encoding, no control characters
+
+# Rough size of one row of a typical report, for workbooks whose rows cannot be counted cheaply
+XLSX_BYTES_PER_ROW = 100
+XLS_BYTES_PER_ROW = 250
+# Used range of a worksheet, e.g. <dimension ref="A1:K20001"/>
+DIMENSION_PATTERN = re.compile(rb'<dimension ref="[A-Z]+\d+:[A-Z]+(\d+)"')
+
+
+class EmptyUpload(ValueError):
+    pass
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class UnsupportedFileType(ValueError):
+    pass
+
+
+class IngestedUpload(NamedTuple):
+    path: str | None  # Set when the upload was written to disk
+    size: int
+    sha256: str
+    file_type: str  # "xlsx", "xls" or "csv"
+    content: bytes | None = None  # Set when the upload was kept in memory
+    lines: int = 0  # Lines of a CSV upload (counted while copying it)
+
+
+class UploadDigest:
+    """
+    Size, SHA-256, leading bytes and newline count of an upload, fed chunk
+    by chunk as it is stored. `update` raises UploadTooLarge as soon as
+    more than `max_bytes` have been fed.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.head = b""
+        self.newlines = 0
+        self.last = b""
+        self._hash = hashlib.sha256()
+
+    def update(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(
+                f"Upload exceeds the maximum size of {self.max_bytes} bytes"
+            )
+        if len(self.head) < SNIFF_BYTES:
+            self.head += chunk[: SNIFF_BYTES - len(self.head)]
+        self._hash.update(chunk)
+        self.newlines += chunk.count(b"\n")
+        self.last = chunk[-1:]
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    @property
+    def lines(self) -> int:
+        """Lines of the content read as text, a last one without newline included."""
+        return self.newlines + (self.last != b"\n") if self.size else 0
+
+
+def sniff_file_type(head: bytes) -> str | None:
+    """Identifies an upload from its first bytes rather than its filename."""
+    if head.startswith(XLSX_MAGIC):
+        return "xlsx"
+    if head.startswith(XLS_MAGIC):
+        return "xls"
+    if head.startswith(b"%PDF"):
+        return None
+    if head and not head.translate(None, TEXT_BYTES):
+        # No binary signature and no control characters: treat as delimited text
+        return "csv"
+    return None
+
+
+def ingest_upload(
+    source: IO[bytes],
+    directory: str,
+    *,
+    max_bytes: int,
+    in_memory_max: int = 0,
+    allowed_types: tuple[str, ...] = ("xlsx", "xls", "csv"),
+    prefix: str = "input",
+) -> IngestedUpload:
+    """
+    Copies an upload in CHUNK_SIZE pieces, hashing and counting bytes on the
+    way, so memory use stays bounded whatever the upload size.
+
+    Uploads of up to `in_memory_max` bytes are returned as `content` without
+    touching the disk; larger ones are written to `directory` and returned as
+    `path`. The stored file is named after its sniffed type, which is what
+    readers dispatch on. Nothing is left behind when the upload is rejected.
+
+    Raises:
+        EmptyUpload: If the upload has no content.
+        UploadTooLarge: As soon as more than `max_bytes` have been read.
+        UnsupportedFileType: If the content is not one of `allowed_types`.
+    """
+    head = source.read(CHUNK_SIZE)
+    if not head:
+        raise EmptyUpload("Uploaded file content is empty.")
+    file_type = sniff_file_type(head[:SNIFF_BYTES])
+    if file_type not in allowed_types:
+        raise UnsupportedFileType(
+            f"Unsupported file type; expected one of: {', '.join(allowed_types)}"
+        )
+
+    digest = UploadDigest(max_bytes)
+    path = None
+    buffer = io.BytesIO()
+    destination: BinaryIO = buffer
+    try:
+        chunk = head
+        while chunk:
+            digest.update(chunk)
+            if path is None and digest.size > in_memory_max:
+                # Spill to disk once the upload outgrows the in-memory limit
+                path = os.path.join(directory, f"{prefix}_{uuid.uuid4()}.{file_type}")
+                destination = open(path, "wb")
+                destination.write(buffer.getvalue())
+                buffer = io.BytesIO()
+            destination.write(chunk)
+            chunk = source.read(CHUNK_SIZE)
+    except BaseException:
+        if path is not None:
+            destination.close()
+            os.remove(path)
+        raise
+
+    if path is not None:
+        destination.close()
+    return IngestedUpload(
+        path=path,
+        size=digest.size,
+        sha256=digest.sha256,
+        file_type=file_type,
+        content=None if path is not None else buffer.getvalue(),
+        lines=digest.lines if file_type == "csv" else 0,
+    )
+
+
+def adopt_upload(
+    path: str,
+    digest: UploadDigest,
+    directory: str,
+    *,
+    in_memory_max: int = 0,
+    allowed_types: tuple[str, ...] = ("xlsx", "xls", "csv"),
+    prefix: str = "input",
+) -> IngestedUpload:
+    """
+    Takes over an upload that was already written to `path` while `digest`
+    was fed (see `streaming_form`), by the same rules as `ingest_upload`,
+    but moving the file into `directory` instead of copying it. Uploads of
+    up to `in_memory_max` bytes are read into memory and the file removed.
+    A rejected upload's file is left for its owner to remove.
+
+    Raises:
+        EmptyUpload: If the upload has no content.
+        UnsupportedFileType: If the content is not one of `allowed_types`.
+    """
+    if not digest.size:
+        raise EmptyUpload("Uploaded file content is empty.")
+    file_type = sniff_file_type(digest.head)
+    if file_type not in allowed_types:
+        raise UnsupportedFileType(
+            f"Unsupported file type; expected one of: {', '.join(allowed_types)}"
+        )
+    lines = digest.lines if file_type == "csv" else 0
+    if digest.size <= in_memory_max:
+        with open(path, "rb") as source:
+            content = source.read()
+        os.remove(path)
+        return IngestedUpload(
+            path=None,
+            size=digest.size,
+            sha256=digest.sha256,
+            file_type=file_type,
+            content=content,
+            lines=lines,
+        )
+    destination = os.path.join(directory, f"{prefix}_{uuid.uuid4()}.{file_type}")
+    os.replace(path, destination)
+    return IngestedUpload(
+        path=destination,
+        size=digest.size,
+        sha256=digest.sha256,
+        file_type=file_type,
+        lines=lines,
+    )
+
+
+def xlsx_dimension_rows(source: str | BinaryIO) -> int | None:
+    """
+    Data rows of a workbook's first sheet according to its <dimension>
+    element, which writers put before the cell data, so only the start of
+    the sheet is decompressed. None when the sheet does not declare one.
+    """
+    try:
+        with zipfile.ZipFile(source) as archive:
+            sheets = sorted(
+                name
+                for name in archive.namelist()
+                if name.startswith("xl/worksheets/") and name.endswith(".xml")
+            )
+            if not sheets:
+                return None
+            first = (
+                "xl/worksheets/sheet1.xml"
+                if "xl/worksheets/sheet1.xml" in sheets
+                else sheets[0]
+            )
+            with archive.open(first) as sheet:
+                head = sheet.read(64 * 1024)
+    except (zipfile.BadZipFile, OSError):
+        return None
+    match = DIMENSION_PATTERN.search(head)
+    return max(int(match.group(1)) - 1, 0) if match else None
+
+
+def estimate_rows(upload: IngestedUpload) -> int:
+    """
+    Data rows in an upload, used to size its job: counted for CSV, read
+    from the first sheet's dimension for XLSX, otherwise estimated from
+    the byte count.
+    """
+    if upload.file_type == "csv":
+        return max(upload.lines - 1, 0)
+    if upload.file_type == "xlsx":
+        rows = xlsx_dimension_rows(upload.path or io.BytesIO(upload.content or b""))
+        if rows is not None:
+            return rows
+        return upload.size // XLSX_BYTES_PER_ROW
+    return upload.size // XLS_BYTES_PER_ROW
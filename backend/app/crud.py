@@ -1,12 +1,42 @@
 import uuid
-from typing import Any
 from datetime import datetime, timedelta, timezone
+from typing import Any, cast
 
-from sqlmodel import Session, select
+from sqlalchemy import (
+    CursorResult,
+    String,
+    and_,
+    bindparam,
+    case,
+    delete,
+    exists,
+    func,
+    literal,
+    or_,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, col, select
 
 from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
-from app.utils import encrypt_token, decrypt_token
+from app.models import (
+    ArtifactBlob,
+    ArtifactRef,
+    HarvestedKeyword,
+    IdempotencyKey,
+    Item,
+    ItemCreate,
+    PPCBatch,
+    PPCJob,
+    PPCResult,
+    TempFileExpiry,
+    User,
+    UserCreate,
+    UserUpdate,
+)
+from app.utils import decrypt_token, encrypt_token
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -56,6 +86,701 @@ def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -
     return db_item
 
 
+def get_harvested_keywords(
+    *, session: Session, owner_id: uuid.UUID, keys: list[tuple[str, str, str]]
+) -> set[tuple[str, str, str]]:
+    """Returns the (sku, term, match_type) keys the user has already harvested.
+
+    All candidate keys are sent as three arrays and joined against the
+    registry in a single query, so the check costs one round trip however
+    many terms a report produces.
+    """
+    if not keys:
+        return set()
+    skus, terms, match_types = (list(column) for column in zip(*keys, strict=True))
+    candidates = (
+        func.unnest(
+            bindparam("skus", skus, type_=ARRAY(String)),
+            bindparam("terms", terms, type_=ARRAY(String)),
+            bindparam("match_types", match_types, type_=ARRAY(String)),
+        )
+        .table_valued("sku", "term", "match_type")
+        .render_derived()
+    )
+    statement = (
+        select(HarvestedKeyword.sku, HarvestedKeyword.term, HarvestedKeyword.match_type)
+        .join(
+            candidates,
+            and_(
+                col(HarvestedKeyword.sku) == candidates.c.sku,
+                col(HarvestedKeyword.term) == candidates.c.term,
+                col(HarvestedKeyword.match_type) == candidates.c.match_type,
+            ),
+        )
+        .where(HarvestedKeyword.owner_id == owner_id)
+    )
+    return {(sku, term, match_type) for sku, term, match_type in session.exec(statement).all()}
+
+
+def create_harvested_keywords(
+    *, session: Session, owner_id: uuid.UUID, keys: list[tuple[str, str, str]]
+) -> None:
+    """Records harvested keys in one batched insert, ignoring ones already present."""
+    if not keys:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "owner_id": owner_id,
+            "sku": sku,
+            "term": term,
+            "match_type": match_type,
+            "created_at": now,
+        }
+        for sku, term, match_type in keys
+    ]
+    statement = insert(HarvestedKeyword).on_conflict_do_nothing(
+        index_elements=["owner_id", "sku", "term", "match_type"]
+    )
+    session.execute(statement, rows)
+    session.commit()
+
+
+def create_ppc_job(
+    *,
+    session: Session,
+    kind: str,
+    params: dict[str, Any],
+    owner_id: uuid.UUID | None = None,
+    priority: str = "interactive",
+) -> PPCJob:
+    db_obj = PPCJob(
+        kind=kind,
+        params=params,
+        owner_id=owner_id,
+        priority=priority,
+        estimated_rows=params.get("input_rows"),
+    )
+    session.add(db_obj)
+    session.commit()
+    session.refresh(db_obj)
+    return db_obj
+
+
+def get_idempotency_key(*, session: Session, key: str, now: datetime) -> IdempotencyKey | None:
+    """Returns the entry for `key` unless it has expired at `now`."""
+    record = session.get(IdempotencyKey, key)
+    return record if record is not None and record.expires_at > now else None
+
+
+def create_ppc_job_once(
+    *,
+    session: Session,
+    idempotency_key: str,
+    fingerprint: str,
+    expires_at: datetime,
+    kind: str,
+    params: dict[str, Any],
+    owner_id: uuid.UUID | None = None,
+) -> tuple[PPCJob, IdempotencyKey, bool]:
+    """Creates a job recorded under `idempotency_key`, unless the key is in use.
+
+    The job and the key are written in one transaction, and the upsert only
+    takes over an expired key. A concurrent request with the same key waits
+    on the first one's uncommitted row, then finds that key in use; its own
+    job is rolled back and the first request's job is returned instead.
+
+    Returns:
+        The key's job, its entry and whether the job was created here.
+    """
+    job = PPCJob(
+        kind=kind, params=params, owner_id=owner_id, estimated_rows=params.get("input_rows")
+    )
+    session.add(job)
+    session.flush()
+    statement = (
+        insert(IdempotencyKey)
+        .values(key=idempotency_key, fingerprint=fingerprint, job_id=job.id, expires_at=expires_at)
+        .on_conflict_do_update(
+            index_elements=["key"],
+            set_={"fingerprint": fingerprint, "job_id": job.id, "expires_at": expires_at},
+            where=IdempotencyKey.expires_at <= datetime.utcnow(),  # type: ignore[arg-type]
+        )
+        .returning(col(IdempotencyKey.key))
+    )
+    if session.execute(statement).first() is not None:
+        session.commit()
+        session.refresh(job)
+        record = session.get(IdempotencyKey, idempotency_key)
+        assert record is not None
+        return job, record, True
+    session.rollback()
+    record = session.get(IdempotencyKey, idempotency_key)
+    assert record is not None  # Unexpired, so the janitor has not removed it
+    existing = session.get(PPCJob, record.job_id)
+    assert existing is not None
+    return existing, record, False
+
+
+def create_ppc_result(
+    *,
+    session: Session,
+    job: PPCJob,
+    params: dict[str, Any],
+    file_type: str,
+    size: int,
+    sha256: str,
+    expires_at: datetime,
+) -> PPCResult:
+    assert job.owner_id is not None
+    db_obj = PPCResult(
+        job_id=job.id,
+        owner_id=job.owner_id,
+        kind=job.kind,
+        params=params,
+        filename=job.params.get("filename"),
+        file_type=file_type,
+        size=size,
+        sha256=sha256,
+        expires_at=expires_at,
+    )
+    session.add(db_obj)
+    session.commit()
+    session.refresh(db_obj)
+    return db_obj
+
+
+def list_ppc_results(
+    *,
+    session: Session,
+    owner_id: uuid.UUID,
+    now: datetime,
+    limit: int,
+    kind: str | None = None,
+    before: tuple[datetime, uuid.UUID] | None = None,
+) -> list[PPCResult]:
+    """Returns up to `limit` unexpired results of a user, newest first.
+
+    `before` is the (created_at, job_id) of the last result of the previous
+    page. Pages are read from the owner/created_at/job_id index, so each
+    costs the same wherever it starts.
+    """
+    statement = select(PPCResult).where(
+        PPCResult.owner_id == owner_id,
+        col(PPCResult.expires_at) > now,
+    )
+    if kind is not None:
+        statement = statement.where(PPCResult.kind == kind)
+    if before is not None:
+        statement = statement.where(
+            tuple_(col(PPCResult.created_at), col(PPCResult.job_id))
+            < tuple_(literal(before[0]), literal(before[1]))
+        )
+    statement = statement.order_by(
+        col(PPCResult.created_at).desc(),
+        col(PPCResult.job_id).desc(),
+    ).limit(limit)
+    return list(session.exec(statement).all())
+
+
+def delete_expired_ppc_results(*, session: Session, now: datetime) -> int:
+    statement = delete(PPCResult).where(col(PPCResult.expires_at) <= now)
+    deleted = cast(CursorResult[Any], session.execute(statement)).rowcount
+    session.commit()
+    return deleted
+
+
+def delete_expired_idempotency_keys(*, session: Session, now: datetime) -> int:
+    statement = delete(IdempotencyKey).where(col(IdempotencyKey.expires_at) <= now)
+    deleted = cast(CursorResult[Any], session.execute(statement)).rowcount
+    session.commit()
+    return deleted
+
+
+def create_ppc_batch(
+    *,
+    session: Session,
+    kind: str,
+    params: list[dict[str, Any]],
+    max_concurrency: int,
+    bundle: bool = False,
+    owner_id: uuid.UUID | None = None,
+) -> tuple[PPCBatch, list[PPCJob]]:
+    """Creates a batch with one queued batch-class job per entry of `params`, in one transaction."""
+    batch = PPCBatch(
+        kind=kind, max_concurrency=max_concurrency, bundle=bundle, owner_id=owner_id
+    )
+    session.add(batch)
+    jobs = [
+        PPCJob(
+            kind=kind,
+            params=job_params,
+            owner_id=owner_id,
+            batch_id=batch.id,
+            priority="batch",
+            estimated_rows=job_params.get("input_rows"),
+        )
+        for job_params in params
+    ]
+    session.add_all(jobs)
+    session.commit()
+    session.refresh(batch)
+    for job in jobs:
+        session.refresh(job)
+    return batch, jobs
+
+
+def get_ppc_batch_jobs(*, session: Session, batch_id: uuid.UUID) -> list[PPCJob]:
+    statement = (
+        select(PPCJob).where(PPCJob.batch_id == batch_id).order_by(col(PPCJob.created_at))
+    )
+    return list(session.exec(statement).all())
+
+
+def complete_ppc_batch(*, session: Session, batch_id: uuid.UUID) -> PPCBatch | None:
+    """Marks a batch finished once none of its jobs are queued or running.
+
+    Returns the batch only to the caller whose update finished it, so work
+    that follows a batch (such as bundling) is started once.
+    """
+    unfinished = select(PPCJob.id).where(
+        PPCJob.batch_id == batch_id,
+        PPCJob.status.in_(("queued", "running")),  # type: ignore[attr-defined]
+    )
+    finished = session.execute(
+        update(PPCBatch)
+        .where(
+            PPCBatch.id == batch_id,  # type: ignore[arg-type]
+            PPCBatch.finished_at.is_(None),  # type: ignore[union-attr]
+            ~exists(unfinished),
+        )
+        .values(finished_at=datetime.utcnow())
+    )
+    session.commit()
+    if cast(CursorResult[Any], finished).rowcount != 1:
+        return None
+    return session.get(PPCBatch, batch_id)
+
+
+def count_queued_ppc_jobs(*, session: Session) -> int:
+    statement = (
+        select(func.count()).select_from(PPCJob).where(PPCJob.status == "queued")
+    )
+    return session.exec(statement).one()
+
+
+def _running_for_owner(owner_id: Any) -> Any:
+    running = aliased(PPCJob)
+    return (
+        select(func.count())
+        .select_from(running)
+        .where(running.owner_id.is_not_distinct_from(owner_id), running.status == "running")  # type: ignore[union-attr]
+        .scalar_subquery()
+    )
+
+
+def _running_in_batch(batch_id: Any) -> Any:
+    running = aliased(PPCJob)
+    return (
+        select(func.count())
+        .select_from(running)
+        .where(running.batch_id == batch_id, running.status == "running")
+        .scalar_subquery()
+    )
+
+
+def claim_ppc_job(*, session: Session, aged_before: datetime) -> PPCJob | None:
+    """Marks the next queued job as running and returns it.
+
+    Jobs are taken in this order:
+
+    - Interactive jobs before batch jobs.
+    - Then jobs of owners with the fewest jobs running. This shares
+      workers fairly between signed-in users only: jobs queued
+      anonymously have no owner, so together they get one owner's share.
+    - Then jobs with the fewest estimated rows (shortest job first).
+    - Then the oldest.
+
+    Jobs queued before `aged_before` skip the class and size steps, so
+    neither batch nor large jobs wait forever. The order is computed over
+    every queued job, which PPC_JOB_MAX_QUEUED keeps few.
+
+    SKIP LOCKED lets workers in every app process poll the same table without
+    blocking on, or double-claiming, a job another worker is taking. Jobs of
+    a batch already running max_concurrency jobs are passed over; the batch
+    row is locked while its running jobs are recounted, so concurrent claims
+    cannot exceed the cap either.
+    """
+    batch_cap = (
+        select(PPCBatch.max_concurrency)
+        .where(PPCBatch.id == PPCJob.batch_id)
+        .scalar_subquery()
+    )
+    aged = col(PPCJob.created_at) < aged_before
+    statement = (
+        select(PPCJob)
+        .where(
+            PPCJob.status == "queued",
+            or_(
+                PPCJob.batch_id.is_(None),  # type: ignore[union-attr]
+                _running_in_batch(PPCJob.batch_id) < batch_cap,
+            ),
+        )
+        .order_by(
+            case((or_(aged, col(PPCJob.priority) == "interactive"), 0), else_=1),
+            _running_for_owner(PPCJob.owner_id),
+            case((aged, 0), else_=func.coalesce(PPCJob.estimated_rows, 0)),
+            col(PPCJob.created_at),
+        )
+        .limit(1)
+        .with_for_update(skip_locked=True, of=PPCJob)
+    )
+    job = session.exec(statement).first()
+    if not job:
+        session.rollback()
+        return None
+    if job.batch_id is not None:
+        batch = session.exec(
+            select(PPCBatch).where(PPCBatch.id == job.batch_id).with_for_update()
+        ).one()
+        running = session.exec(select(_running_in_batch(job.batch_id))).one()
+        if running >= batch.max_concurrency:
+            # Lost a race for the batch's last slot; the worker polls again
+            session.rollback()
+            return None
+    # Conditional update, so a job is claimed once even where row locks are unavailable
+    now = datetime.utcnow()
+    claimed = session.execute(
+        update(PPCJob)
+        .where(PPCJob.id == job.id, PPCJob.status == "queued")  # type: ignore[arg-type]
+        .values(status="running", started_at=now, heartbeat_at=now)
+    )
+    session.commit()
+    if cast(CursorResult[Any], claimed).rowcount != 1:
+        return None
+    session.refresh(job)
+    return job
+
+
+def finish_ppc_job(
+    *,
+    session: Session,
+    job: PPCJob,
+    result: dict[str, Any] | None = None,
+    error: str | None = None,
+    cancelled: bool = False,
+) -> PPCJob:
+    """Stores the outcome of a running job; an error marks it as failed."""
+    result = dict(result or {})
+    if cancelled:
+        job.status = "cancelled"
+    else:
+        job.status = "failed" if error else "succeeded"
+    job.download_id = result.pop("download_id", None)
+    job.result = result or None
+    job.error = error
+    job.progress = None
+    job.finished_at = datetime.utcnow()
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def cancel_ppc_job(*, session: Session, job_id: uuid.UUID) -> tuple[PPCJob | None, bool]:
+    """Cancels a queued job, or asks a running one to stop.
+
+    Both are conditional updates, so a job claimed or finished meanwhile is
+    never cancelled twice or after the fact. Returns the job (None if there
+    is none) and whether this call took it off the queue.
+    """
+    now = datetime.utcnow()
+    result = session.execute(
+        update(PPCJob)
+        .where(PPCJob.id == job_id, PPCJob.status == "queued")  # type: ignore[arg-type]
+        .values(status="cancelled", cancel_requested_at=now, finished_at=now)
+    )
+    dequeued = cast(CursorResult[Any], result).rowcount == 1
+    if not dequeued:
+        session.execute(
+            update(PPCJob)
+            .where(
+                PPCJob.id == job_id,  # type: ignore[arg-type]
+                PPCJob.status == "running",  # type: ignore[arg-type]
+                PPCJob.cancel_requested_at.is_(None),  # type: ignore[union-attr]
+            )
+            .values(cancel_requested_at=now)
+        )
+    session.commit()
+    return session.get(PPCJob, job_id), dequeued
+
+
+def ppc_job_cancel_requested(*, session: Session, job_id: uuid.UUID) -> bool:
+    statement = select(PPCJob.cancel_requested_at).where(PPCJob.id == job_id)
+    return session.exec(statement).first() is not None
+
+
+def get_ppc_job_waits(
+    *, session: Session, started_after: datetime
+) -> list[tuple[str, datetime, datetime | None]]:
+    """Returns (priority, created_at, started_at) of queued jobs and jobs started after `started_after`."""
+    statement = select(PPCJob.priority, PPCJob.created_at, PPCJob.started_at).where(
+        or_(col(PPCJob.status) == "queued", col(PPCJob.started_at) >= started_after)
+    )
+    return [tuple(row) for row in session.exec(statement).all()]  # type: ignore[misc]
+
+
+def save_ppc_job_progress(
+    *, session: Session, progress: dict[uuid.UUID, dict[str, Any]], now: datetime
+) -> None:
+    """Stores the latest progress event of running jobs, renewing their leases."""
+    for job_id, event in progress.items():
+        session.execute(
+            update(PPCJob)
+            .where(col(PPCJob.id) == job_id, col(PPCJob.status) == "running")
+            .values(progress=event, heartbeat_at=now)
+        )
+    session.commit()
+
+
+def renew_ppc_job_leases(*, session: Session, job_ids: list[uuid.UUID], now: datetime) -> None:
+    """Records that the jobs are still being run."""
+    session.execute(
+        update(PPCJob)
+        .where(col(PPCJob.id).in_(job_ids), col(PPCJob.status) == "running")
+        .values(heartbeat_at=now)
+    )
+    session.commit()
+
+
+def requeue_stale_ppc_jobs(
+    *, session: Session, expired_before: datetime
+) -> tuple[int, list[PPCJob]]:
+    """Puts jobs whose lease was last renewed before `expired_before` back on the queue.
+
+    Their worker crashed or lost the database, so nobody is running them.
+    Jobs whose cancellation was requested are finished as cancelled instead.
+    Both are conditional updates, so concurrent sweeps take each job once.
+    Returns how many jobs were requeued, and the cancelled jobs.
+    """
+    stale = and_(
+        col(PPCJob.status) == "running", col(PPCJob.heartbeat_at) < expired_before
+    )
+    cancelled_ids = (
+        session.execute(
+            update(PPCJob)
+            .where(stale, col(PPCJob.cancel_requested_at).is_not(None))
+            .values(status="cancelled", finished_at=datetime.utcnow())
+            .returning(col(PPCJob.id))
+        )
+        .scalars()
+        .all()
+    )
+    requeued = session.execute(
+        update(PPCJob)
+        .where(stale)
+        .values(status="queued", started_at=None, heartbeat_at=None, progress=None)
+        .returning(col(PPCJob.id))
+    )
+    count = len(requeued.all())
+    session.commit()
+    cancelled = [session.get(PPCJob, job_id) for job_id in cancelled_ids]
+    return count, [job for job in cancelled if job is not None]
+
+
+def set_temp_file_expiry(*, session: Session, path: str, expires_at: datetime) -> None:
+    """Records (or moves) the time a temporary file should be removed."""
+    session.merge(TempFileExpiry(path=path, expires_at=expires_at))
+    session.commit()
+
+
+def pop_expired_temp_files(*, session: Session, now: datetime) -> list[str]:
+    """Deletes and returns the expiry entries due at `now`.
+
+    The range delete walks the expires_at index, so a sweep costs only the
+    number of expired entries, and concurrent sweepers never get the same path.
+    """
+    statement = (
+        delete(TempFileExpiry)
+        .where(col(TempFileExpiry.expires_at) <= now)
+        .returning(col(TempFileExpiry.path))
+    )
+    paths = list(session.execute(statement).scalars())
+    session.commit()
+    return paths
+
+
+def create_artifact_ref(
+    *,
+    session: Session,
+    key: str,
+    sha256: str,
+    file_type: str,
+    size: int,
+    expires_at: datetime | None = None,
+    owner_id: uuid.UUID | None = None,
+    role: str = "result",
+) -> None:
+    """Points `key` at a blob, creating the blob's row or counting one more reference.
+
+    The upsert is a single statement, so it either sees a blob the janitor
+    has not deleted yet (and keeps it alive) or waits for that delete to
+    commit and starts a fresh row.
+    """
+    statement = (
+        insert(ArtifactBlob)
+        .values(sha256=sha256, file_type=file_type, size=size, refcount=1, created_at=datetime.utcnow())
+        .on_conflict_do_update(
+            index_elements=["sha256"], set_={"refcount": ArtifactBlob.refcount + 1}
+        )
+    )
+    session.execute(statement)
+    session.add(
+        ArtifactRef(key=key, sha256=sha256, expires_at=expires_at, owner_id=owner_id, role=role)
+    )
+    session.commit()
+
+
+def _unexpired_ref(now: datetime) -> Any:
+    return col(ArtifactRef.expires_at).is_(None) | (col(ArtifactRef.expires_at) > now)
+
+
+def get_artifact_blob(*, session: Session, key: str, now: datetime) -> ArtifactBlob | None:
+    """Returns the blob behind `key`, unless the reference has expired."""
+    statement = (
+        select(ArtifactBlob)
+        .join(ArtifactRef, ArtifactRef.sha256 == ArtifactBlob.sha256)  # type: ignore[arg-type]
+        .where(ArtifactRef.key == key)
+        .where(_unexpired_ref(now))
+    )
+    return session.exec(statement).first()
+
+
+def touch_artifact_ref(*, session: Session, key: str, now: datetime) -> None:
+    """Records a use of `key`; at most one write a minute per reference."""
+    session.execute(
+        update(ArtifactRef)
+        .where(
+            col(ArtifactRef.key) == key,
+            col(ArtifactRef.accessed_at) < now - timedelta(minutes=1),
+        )
+        .values(accessed_at=now)
+    )
+    session.commit()
+
+
+def get_artifact_bytes(*, session: Session) -> int:
+    """Bytes of all stored blobs, each counted once however many references share it."""
+    statement = select(func.coalesce(func.sum(col(ArtifactBlob.size)), 0))
+    return int(session.exec(statement).one())
+
+
+def get_owner_artifact_bytes(*, session: Session, now: datetime, owner_id: uuid.UUID | None = None) -> dict[Any, int]:
+    """Bytes charged per user: the size of every unexpired reference they own.
+
+    With `owner_id`, only that user's total is returned.
+    """
+    statement = (
+        select(col(ArtifactRef.owner_id), func.sum(col(ArtifactBlob.size)))
+        .join(ArtifactBlob, col(ArtifactBlob.sha256) == ArtifactRef.sha256)
+        .where(_unexpired_ref(now))
+        .group_by(col(ArtifactRef.owner_id))
+    )
+    if owner_id is not None:
+        statement = statement.where(col(ArtifactRef.owner_id) == owner_id)
+    else:
+        statement = statement.where(col(ArtifactRef.owner_id).is_not(None))
+    return {owner: int(total) for owner, total in session.exec(statement).all()}
+
+
+def get_evictable_artifact_refs(
+    *, session: Session, now: datetime, limit: int, owner_id: uuid.UUID | None = None
+) -> list[tuple[str, str, uuid.UUID | None, str, int, int, datetime]]:
+    """Returns unexpired, unpinned references in eviction order.
+
+    Cache entries come before results, least recently used first. Each is
+    (key, role, owner_id, sha256, blob size, blob refcount, accessed_at).
+    """
+    statement = (
+        select(ArtifactRef, col(ArtifactBlob.size), col(ArtifactBlob.refcount))
+        .join(ArtifactBlob, col(ArtifactBlob.sha256) == ArtifactRef.sha256)
+        .where(col(ArtifactRef.role) != "input", _unexpired_ref(now))
+        .order_by(case((col(ArtifactRef.role) == "cache", 0), else_=1), col(ArtifactRef.accessed_at))
+        .limit(limit)
+    )
+    if owner_id is not None:
+        statement = statement.where(col(ArtifactRef.owner_id) == owner_id)
+    return [
+        (ref.key, ref.role, ref.owner_id, ref.sha256, size, refcount, ref.accessed_at)
+        for ref, size, refcount in session.exec(statement).all()
+    ]
+
+
+def expire_artifact_refs(*, session: Session, keys: list[str], now: datetime) -> None:
+    """Expires references at `now`, along with the results listed under them."""
+    session.execute(
+        update(ArtifactRef).where(col(ArtifactRef.key).in_(keys)).values(expires_at=now)
+    )
+    # A result is stored under its job's ID
+    job_ids = []
+    for key in keys:
+        try:
+            job_ids.append(uuid.UUID(key))
+        except ValueError:
+            pass
+    if job_ids:
+        session.execute(
+            update(PPCResult)
+            .where(col(PPCResult.job_id).in_(job_ids))
+            .values(expires_at=now)
+        )
+    session.commit()
+
+
+def set_artifact_ref_expiry(*, session: Session, key: str, expires_at: datetime | None) -> None:
+    session.execute(
+        update(ArtifactRef).where(ArtifactRef.key == key).values(expires_at=expires_at)  # type: ignore[arg-type]
+    )
+    session.commit()
+
+
+def release_expired_artifact_refs(*, session: Session, now: datetime) -> int:
+    """Deletes the references due at `now` and drops their blobs' reference counts."""
+    statement = (
+        delete(ArtifactRef)
+        .where(col(ArtifactRef.expires_at) <= now)
+        .returning(col(ArtifactRef.sha256))
+    )
+    released: dict[str, int] = {}
+    for sha256 in session.execute(statement).scalars():
+        released[sha256] = released.get(sha256, 0) + 1
+    for sha256, count in released.items():
+        session.execute(
+            update(ArtifactBlob)
+            .where(ArtifactBlob.sha256 == sha256)  # type: ignore[arg-type]
+            .values(refcount=ArtifactBlob.refcount - count)
+        )
+    session.commit()
+    return sum(released.values())
+
+
+def pop_unreferenced_artifact_blobs(*, session: Session) -> list[tuple[str, str]]:
+    """Deletes the blobs nothing refers to any more, without committing, and
+    returns their (sha256, file_type).
+
+    The caller commits once the files are gone, so the deleted rows stay
+    locked meanwhile and a concurrent `create_artifact_ref` for the same
+    content waits instead of pointing at a file about to be removed.
+    """
+    statement = (
+        delete(ArtifactBlob)
+        .where(col(ArtifactBlob.refcount) <= 0)
+        .returning(col(ArtifactBlob.sha256), col(ArtifactBlob.file_type))
+    )
+    return [(sha256, file_type) for sha256, file_type in session.execute(statement)]
+
+
 def update_user_amazon_tokens(
     *,
     session: Session,
@@ -82,7 +807,7 @@ def update_user_amazon_tokens(
 
 
 def get_valid_amazon_access_token(*, session: Session, user: User) -> str | None:
-    """Retrieves a valid Amazon access token for the user, refreshing if necessary.""" 
+    """Retrieves a valid Amazon access token for the user, refreshing if necessary."""
     if not user.amazon_ads_encrypted_access_token or not user.amazon_ads_token_expiry:
         # No token stored
         return None
@@ -94,7 +819,7 @@ def get_valid_amazon_access_token(*, session: Session, user: User) -> str | None
         if not user.amazon_ads_encrypted_refresh_token:
             # No refresh token available
             return None
-        
+
         refresh_token = decrypt_token(user.amazon_ads_encrypted_refresh_token)
         if not refresh_token:
             # Failed to decrypt refresh token
@@ -119,12 +844,12 @@ def get_valid_amazon_access_token(*, session: Session, user: User) -> str | None
         #     return decrypt_token(user.amazon_ads_encrypted_access_token)
         # else:
         #     # Refresh failed
-        #     return None 
+        #     return None
         # -------------------------------------------------------
         # For now, just indicate refresh is needed but not implemented here
         print("Token needs refresh, but refresh logic is not implemented in CRUD.")
         return None # Or raise an exception
-    
+
     else:
         # Token is still valid, decrypt and return it
         return decrypt_token(user.amazon_ads_encrypted_access_token)
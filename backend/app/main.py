@@ -1,3 +1,6 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
@@ -5,7 +8,12 @@ from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
 from app.api.main import api_router
+from app.core.capacity import pools as capacity_pools
+from app.core.compression import CompressionMiddleware
+from app.core.compute import compute_pool
 from app.core.config import settings
+from app.core.janitor import janitor
+from app.core.jobs import worker_pool
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -19,8 +27,21 @@ if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
         send_default_pii=True,
     )
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    for pool in capacity_pools:
+        pool.install()
+    janitor.start()
+    worker_pool.start()
+    yield
+    worker_pool.stop(timeout=5)
+    await janitor.stop()
+    compute_pool.shutdown()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
+    lifespan=lifespan,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
 )
@@ -30,7 +51,7 @@ app.add_middleware(
     SessionMiddleware,
     secret_key=settings.SECRET_KEY.get_secret_value(),
     # Configure session cookie parameters as needed (e.g., https_only in production)
-    # https_only=settings.ENVIRONMENT != "local", 
+    # https_only=settings.ENVIRONMENT != "local",
     # max_age=... # Optional: session expiration
 )
 
@@ -44,4 +65,11 @@ if settings.all_cors_origins:
         allow_headers=["*"],
     )
 
+# Compress JSON and text responses for clients that accept it
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    content_types=settings.COMPRESSION_CONTENT_TYPES,
+)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -1,7 +1,9 @@
 import uuid
 from datetime import datetime
+from typing import Any
 
 from pydantic import EmailStr
+from sqlalchemy import JSON, BigInteger, Column, Index, Text
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -97,6 +99,246 @@ class ItemsPublic(SQLModel):
     count: int
 
 
+# Keyword already turned into a campaign by the keyword miner
+class HarvestedKeyword(SQLModel, table=True):
+    __table_args__ = (
+        # Leading owner_id keeps each user's registry contiguous, and the full
+        # key lets membership checks be answered from the index alone
+        Index(
+            "ix_harvestedkeyword_owner_sku_term_match",
+            "owner_id",
+            "sku",
+            "term",
+            "match_type",
+            unique=True,
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    owner_id: uuid.UUID = Field(
+        foreign_key="user.id", nullable=False, ondelete="CASCADE"
+    )
+    sku: str = Field(max_length=255)
+    term: str = Field(max_length=255)
+    match_type: str = Field(max_length=20)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# Group of PPC jobs submitted together; at most max_concurrency of them run at once
+class PPCBatch(SQLModel, table=True):
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    owner_id: uuid.UUID | None = Field(
+        default=None, foreign_key="user.id", ondelete="CASCADE"
+    )
+    kind: str = Field(max_length=50)
+    max_concurrency: int
+    bundle: bool = False  # Zip all outputs into one download once the batch finishes
+    bundle_job_id: uuid.UUID | None = Field(default=None)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = Field(default=None)
+
+
+# Background PPC processing job, executed by the worker pool in app.core.jobs
+class PPCJob(SQLModel, table=True):
+    __table_args__ = (
+        # Workers pick the next job from the queued ones
+        Index("ix_ppcjob_status_created_at", "status", "created_at"),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    owner_id: uuid.UUID | None = Field(
+        default=None, foreign_key="user.id", ondelete="CASCADE"
+    )
+    batch_id: uuid.UUID | None = Field(
+        default=None, foreign_key="ppcbatch.id", index=True, ondelete="CASCADE"
+    )
+    kind: str = Field(max_length=50)
+    status: str = Field(default="queued", max_length=20)
+    priority: str = Field(
+        default="interactive", max_length=20
+    )  # Scheduling class: interactive or batch
+    estimated_rows: int | None = Field(
+        default=None
+    )  # Input size, for shortest-job-first scheduling
+    params: dict[str, Any] = Field(
+        default_factory=dict, sa_column=Column(JSON, nullable=False)
+    )
+    download_id: str | None = Field(default=None, max_length=255)
+    result: dict[str, Any] | None = Field(default=None, sa_column=Column(JSON))
+    error: str | None = Field(default=None, sa_column=Column(Text))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: datetime | None = Field(default=None)
+    finished_at: datetime | None = Field(default=None)
+    cancel_requested_at: datetime | None = Field(
+        default=None
+    )  # Set by DELETE /jobs/{id}; running jobs stop at their next check
+    heartbeat_at: datetime | None = Field(
+        default=None
+    )  # Renewed by the process running the job; requeued once PPC_JOB_LEASE old
+    # Latest progress event of a running job, for listeners in other processes
+    progress: dict[str, Any] | None = Field(default=None, sa_column=Column(JSON))
+
+
+# Output of a finished job of a signed-in user, listed by GET /ppc/results
+# until it expires along with the job's artifact
+class PPCResult(SQLModel, table=True):
+    __table_args__ = (
+        # A user's results newest first, paged by (created_at, job_id) keyset
+        Index("ix_ppcresult_owner_created_job", "owner_id", "created_at", "job_id"),
+    )
+
+    job_id: uuid.UUID = Field(
+        foreign_key="ppcjob.id", primary_key=True, ondelete="CASCADE"
+    )
+    owner_id: uuid.UUID = Field(foreign_key="user.id", ondelete="CASCADE")
+    kind: str = Field(max_length=50)  # The tool that produced it
+    params: dict[str, Any] = Field(
+        default_factory=dict, sa_column=Column(JSON, nullable=False)
+    )
+    filename: str | None = Field(
+        default=None, max_length=255
+    )  # Uploaded file it was made from
+    file_type: str = Field(max_length=10)
+    size: int = Field(sa_column=Column(BigInteger, nullable=False))
+    sha256: str = Field(max_length=64)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime = Field(index=True)
+
+
+# Idempotency-Key sent with a processing request, naming the job the first
+# request with that key queued; repeats get that job until the key expires
+class IdempotencyKey(SQLModel, table=True):
+    key: str = Field(
+        primary_key=True, max_length=255
+    )  # "<job kind>:<owner ID or '-'>:<header value>"
+    fingerprint: str = Field(
+        max_length=64
+    )  # SHA-256 of the request's parameters and file
+    job_id: uuid.UUID = Field(foreign_key="ppcjob.id", ondelete="CASCADE")
+    expires_at: datetime = Field(index=True)
+
+
+# Properties to return via API
+class PPCJobPublic(SQLModel):
+    id: uuid.UUID
+    kind: str
+    status: str
+    priority: str = "interactive"
+    download_id: str | None
+    download_url: str | None = None
+    result: dict[str, Any] | None
+    error: str | None
+    created_at: datetime
+    started_at: datetime | None
+    finished_at: datetime | None
+    cancel_requested_at: datetime | None = None
+
+
+class PPCResultPublic(SQLModel):
+    job_id: uuid.UUID
+    kind: str
+    params: dict[str, Any]
+    filename: str | None
+    file_type: str
+    size: int
+    sha256: str
+    created_at: datetime
+    expires_at: datetime
+    download_url: str
+
+
+class PPCResultsPage(SQLModel):
+    data: list[PPCResultPublic]
+    next_cursor: str | None
+
+
+class PPCBatchJobPublic(PPCJobPublic):
+    filename: str | None = None
+
+
+class PPCBatchPublic(SQLModel):
+    id: uuid.UUID
+    kind: str
+    status: str  # queued, running, bundling, succeeded, failed, cancelled or partial
+    max_concurrency: int
+    counts: dict[str, int]  # Jobs per status
+    bundle: bool
+    bundle_job: PPCJobPublic | None = None
+    jobs: list[PPCBatchJobPublic]
+    created_at: datetime
+    finished_at: datetime | None
+
+
+class PPCPreviewPage(SQLModel):
+    sheets: list[str]
+    sheet: str
+    columns: list[str]
+    rows: list[dict[str, Any]]
+    total: int  # Rows matching the filters, across all pages
+    next_cursor: str | None
+
+
+# Expiry time of a temporary file, removed once due by the janitor in app.core.janitor
+class TempFileExpiry(SQLModel, table=True):
+    path: str = Field(primary_key=True, max_length=1024)
+    expires_at: datetime = Field(index=True)
+
+
+# File in the content-addressed artifact store (app.core.artifacts), named by
+# its SHA-256 and removed by the janitor once no ArtifactRef points at it
+class ArtifactBlob(SQLModel, table=True):
+    sha256: str = Field(primary_key=True, max_length=64)
+    file_type: str = Field(max_length=10)
+    size: int = Field(sa_column=Column(BigInteger, nullable=False))
+    refcount: int = Field(default=0, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# Name under which a blob is in use: a download ID, or a job's input
+class ArtifactRef(SQLModel, table=True):
+    __table_args__ = (
+        # Eviction takes the least recently used references of a role first
+        Index("ix_artifactref_role_accessed_at", "role", "accessed_at"),
+    )
+
+    key: str = Field(primary_key=True, max_length=255)
+    sha256: str = Field(foreign_key="artifactblob.sha256", index=True, max_length=64)
+    expires_at: datetime | None = Field(default=None, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    owner_id: uuid.UUID | None = Field(
+        default=None, index=True
+    )  # User charged for it; kept when the user is deleted so blobs stay counted
+    role: str = Field(
+        default="result", max_length=10
+    )  # input (pinned until its job ends), cache or result
+    accessed_at: datetime = Field(
+        default_factory=datetime.utcnow
+    )  # Last put or resolve, to the minute
+
+
+# Thread capacity pool status, see app.core.capacity
+class CapacityPoolStats(SQLModel):
+    name: str
+    capacity: int
+    in_use: int
+    waiting: int
+    completed: int
+    wait_avg_ms: float
+    wait_max_ms: float
+
+
+class JobQueueStats(SQLModel):
+    priority: str
+    queued: int
+    oldest_queued_ms: (
+        float  # Time the longest-waiting queued job has spent in the queue
+    )
+    started: int  # Jobs started within PPC_QUEUE_STATS_WINDOW
+    wait_avg_ms: float  # Time in queue of those jobs
+    wait_p95_ms: float
+    wait_max_ms: float
+
+
 # Generic message
 class Message(SQLModel):
     message: str
@@ -0,0 +1,916 @@
+import io
+import json
+import threading
+import time
+import uuid
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, cast
+
+import anyio
+import httpx
+import pandas as pd
+import pytest
+from fastapi import HTTPException, Request
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app import crud
+from app.api.routes import ppc
+from app.core.compute import ComputePool
+from app.core.config import settings
+from app.core.progress import ProgressReporter
+from app.core.storage import storage_manager
+from app.models import PPCJob
+from app.tests.utils.ppc import (
+    create_bid_workbook,
+    create_search_term_workbook,
+    get_job_output,
+    read_workbook,
+    wait_for_batch,
+    wait_for_job,
+)
+from app.tests.utils.user import create_random_user_headers
+
+
+def test_harvest_negatives(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"min_clicks": "10", "match_type": "both"},
+    )
+    sheets = read_workbook(get_job_output(client, response))
+    negatives = sheets["Negative Keywords"]
+    keywords = negatives[negatives["Entity"] == "Negative Keyword"]
+    assert set(keywords["Keyword Text"]) == {"cheap shoes"}
+    assert set(keywords["Match Type"]) == {"negativeExact", "negativePhrase"}
+    assert set(keywords["Ad Group ID"]) == {"ag1"}
+    targets = negatives[negatives["Entity"] == "Negative Product Targeting"]
+    assert list(targets["Product Targeting Expression"]) == ['asin="B0ABC12345"']
+
+
+def test_harvest_negatives_poor_acos(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"min_clicks": "5", "min_acos": "15"},
+    )
+    content = get_job_output(client, response)
+    negatives = read_workbook(content)["Negative Keywords"]
+    assert set(negatives["Keyword Text"].dropna()) == {
+        "cheap shoes",
+        "red running shoes",
+        "acme socks",
+    }
+
+
+def test_harvest_negatives_invalid_match_type(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"match_type": "broad"},
+    )
+    assert response.status_code == 400
+
+
+def test_harvest_negatives_unreadable_report(client: TestClient) -> None:
+    workbook = io.BytesIO()
+    pd.DataFrame({"A": [1]}).to_excel(workbook, sheet_name="Other", index=False)
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", workbook.getvalue())},
+    )
+    assert response.status_code == 202
+    job = wait_for_job(client, response.json()["job_id"])
+    assert job["status"] == "failed"
+    assert "SP Search Term Report" in job["error"]
+
+
+def test_mine_keywords_with_negatives(client: TestClient, db: Session) -> None:
+    headers = create_random_user_headers(client=client, db=db)
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/mine-keywords",
+        headers=headers,
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"max_acos": "30", "include_negatives": "true"},
+    )
+    content = get_job_output(client, response, headers)
+    sheets = read_workbook(content)
+    high = sheets["3+ Orders"]
+    assert list(high.loc[high["Entity"] == "Keyword", "Keyword Text"]) == [
+        "red running shoes"
+    ]
+    assert "Negative Keywords" in sheets
+    summary = dict(
+        zip(sheets["Summary"]["Type"], sheets["Summary"]["Count"], strict=True)
+    )
+    assert summary["Regular Keywords"] == 3
+    assert summary["Negative Keywords"] == 1
+
+
+def test_mine_keywords_skips_harvested(client: TestClient, db: Session) -> None:
+    headers = create_random_user_headers(client=client, db=db)
+    first = client.post(
+        f"{settings.API_V1_STR}/ppc/mine-keywords",
+        headers=headers,
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"max_acos": "30"},
+    )
+    get_job_output(client, first, headers)
+
+    second = client.post(
+        f"{settings.API_V1_STR}/ppc/mine-keywords",
+        headers=headers,
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"max_acos": "30"},
+    )
+    content = get_job_output(client, second, headers)
+    summary = read_workbook(content)["Summary"]
+    assert dict(zip(summary["Type"], summary["Count"], strict=True))["Total"] == 0
+
+    third = client.post(
+        f"{settings.API_V1_STR}/ppc/mine-keywords",
+        headers=headers,
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"max_acos": "30", "skip_harvested": "false"},
+    )
+    content = get_job_output(client, third, headers)
+    summary = read_workbook(content)["Summary"]
+    assert dict(zip(summary["Type"], summary["Count"], strict=True))["Total"] == 3
+
+
+def test_mine_keywords_requires_auth(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/mine-keywords",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"max_acos": "30"},
+    )
+    assert response.status_code == 401
+
+
+def test_ngram_analysis(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/ngram-analysis",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"ngram_sizes": "1,2", "sort_by": "spend", "min_search_terms": "2"},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    unigrams = content["ngrams"]["1"]["top"]
+    assert [row["ngram"] for row in unigrams] == ["socks", "shoes", "cheap"]
+    shoes = unigrams[1]
+    assert shoes["search_terms"] == 3
+    assert shoes["spend"] == 17
+    assert shoes["acos"] == 34.0
+    cheap = unigrams[2]
+    assert cheap["orders"] == 0
+    assert cheap["acos"] is None
+    assert [row["ngram"] for row in content["ngrams"]["2"]["top"]] == ["cheap shoes"]
+
+
+def test_ngram_analysis_invalid_metric(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/ngram-analysis",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"sort_by": "impressions"},
+    )
+    assert response.status_code == 400
+
+
+def test_cluster_similar_terms() -> None:
+    terms = pd.Series(
+        [
+            "red running shoes",
+            "wool socks",
+            "red running shoe",
+            "kids toy car",
+            "wool sock",
+            "toy car for kids",
+            "laptop stand",
+        ]
+    )
+    labels = ppc.cluster_similar_terms(terms, pd.Series(["SKU1"] * len(terms)), 0.5)
+    assert labels[0] == labels[2]
+    assert labels[1] == labels[4]
+    assert labels[3] == labels[5]
+    assert len({labels[0], labels[1], labels[3], labels[6]}) == 4
+
+    # Terms in different buckets never share a cluster
+    labels = ppc.cluster_similar_terms(
+        pd.Series(["wool socks", "wool socks"]), pd.Series(["SKU1", "SKU2"]), 0.5
+    )
+    assert labels[0] != labels[1]
+
+
+def test_iter_campaign_breaks_by_cluster() -> None:
+    keywords = [
+        ["a1", 1, 0.5, "Camp", 0],
+        ["b1", 1, 0.5, "Camp", 1],
+        ["a2", 1, 0.5, "Camp", 0],
+        ["b2", 1, 0.5, "Camp", 1],
+        ["a3", 1, 0.5, "Camp", 0],
+    ]
+    written = list(ppc.iter_campaign_breaks(keywords, ad_group_size=3))
+    assert [keyword_info[0] for keyword_info, _ in written] == [
+        "a1",
+        "a2",
+        "a3",
+        "b1",
+        "b2",
+    ]
+    assert [starts for _, starts in written] == [True, False, False, True, False]
+
+    unclustered = [keyword_info[:4] for keyword_info in keywords]
+    written = list(ppc.iter_campaign_breaks(unclustered, ad_group_size=3))
+    assert [starts for _, starts in written] == [True, False, False, True, False]
+
+
+def test_mine_keywords_clustered(client: TestClient, db: Session) -> None:
+    headers = create_random_user_headers(client=client, db=db)
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/mine-keywords",
+        headers=headers,
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"max_acos": "30", "cluster_keywords": "true"},
+    )
+    content = get_job_output(client, response, headers)
+    low = read_workbook(content)["1-2 Orders"]
+    assert set(low.loc[low["Entity"] == "Keyword", "Keyword Text"]) == {
+        "wool socks",
+        "acme socks",
+    }
+
+
+def test_create_campaigns_from_catalog(client: TestClient) -> None:
+    catalog = (
+        b"SKU,Identifier,Keywords,Starting Bid,Campaign Types\n"
+        b'SKU1,Widget,"red widget, blue widget",0.75,"auto,exact"\n'
+        b"SKU2,,gadget,,\n"
+    )
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/create-campaigns/catalog",
+        files={"file": ("catalog.csv", catalog)},
+        data={"default_campaign_types": "phrase"},
+    )
+    content = get_job_output(client, response)
+    job = wait_for_job(client, response.json()["job_id"])
+    assert job["result"]["summary"]["campaigns"] == 3
+    assert job["result"]["summary"]["auto_campaigns"] == 1
+
+    rows = read_workbook(content)["New Campaigns"]
+    assert list(rows.columns) == ppc.BULK_COLUMNS
+    campaigns = rows[rows["Entity"] == "Campaign"]
+    assert list(campaigns["Campaign Name"]) == [
+        "Widget - SP Auto - All - 1",
+        "Widget - SP Exact - 2",
+        "SKU2 - SP Phrase - 3",
+    ]
+    keywords = rows[rows["Entity"] == "Keyword"]
+    assert list(keywords["Keyword Text"]) == ["red widget", "blue widget", "gadget"]
+    assert list(keywords["Bid"]) == [0.75, 0.75, 1.0]
+    targets = rows[rows["Entity"] == "Product Targeting"]
+    assert len(targets) == len(ppc.AUTO_TARGETING_TYPES)
+    assert set(rows.loc[rows["Entity"] == "Product Ad", "SKU"]) == {"SKU1", "SKU2"}
+
+
+def test_create_campaigns_from_catalog_missing_sku(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/create-campaigns/catalog",
+        files={"file": ("catalog.csv", b"Identifier,Keywords\nWidget,red widget\n")},
+    )
+    assert response.status_code == 202
+    job = wait_for_job(client, response.json()["job_id"])
+    assert job["status"] == "failed"
+    assert "sku" in job["error"]
+    assert job["download_id"] is None
+
+
+def test_create_campaigns_from_catalog_rejects_xls(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/create-campaigns/catalog",
+        files={
+            "file": ("catalog.xls", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\x00" * 504)
+        },
+    )
+    assert response.status_code == 415
+
+
+def test_read_job_not_found(client: TestClient) -> None:
+    r = client.get(f"{settings.API_V1_STR}/ppc/jobs/{uuid.uuid4()}")
+    assert r.status_code == 404
+
+
+def test_ngram_analysis_busy(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    busy = ComputePool(workers=1, max_queue=0)
+    monkeypatch.setattr(ppc, "compute_pool", busy)
+    try:
+        running = busy.submit(time.sleep, 1)
+        response = client.post(
+            f"{settings.API_V1_STR}/ppc/ngram-analysis",
+            files={"file": ("report.xlsx", create_search_term_workbook())},
+        )
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        running.result()
+    finally:
+        busy.shutdown()
+
+
+def test_job_queue_full(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "PPC_JOB_MAX_QUEUED", 0)
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+    )
+    assert response.status_code == 429
+
+
+def test_upload_rejected_by_content(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", b"\x89PNG\r\n\x1a\n\x00\x00\x00")},
+    )
+    assert response.status_code == 415
+
+    monkeypatch.setattr(settings, "PPC_MAX_UPLOAD_BYTES", 100)
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+    )
+    assert response.status_code == 413
+
+
+def test_run_buffered_persists_only_final_output(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(ppc, "TEMP_DIR", str(tmp_path))
+    input_path = tmp_path / "input.xlsx"
+    input_path.write_bytes(create_search_term_workbook())
+    output_path = str(tmp_path / "output")
+
+    def copy_report(source: BinaryIO, output: BinaryIO, suffix: bytes) -> str:
+        assert ppc.spreadsheet_type(source) == "xlsx"
+        output.write(source.read() + suffix)
+        return "done"
+
+    assert ppc.run_buffered(copy_report, str(input_path), output_path, b"!") == "done"
+    assert open(output_path, "rb").read() == input_path.read_bytes() + b"!"
+
+    def fail(_source: BinaryIO, output: BinaryIO) -> None:
+        output.write(b"partial")
+        raise ValueError("boom")
+
+    failed_path = str(tmp_path / "failed")
+    with pytest.raises(ValueError):
+        ppc.run_buffered(fail, str(input_path), failed_path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["input.xlsx", "output"]
+
+
+def test_download_range_and_etag(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"min_clicks": "10", "match_type": "both"},
+    )
+    job = wait_for_job(client, response.json()["job_id"])
+    url = f"{settings.API_V1_STR}/ppc/download/{job['download_id']}"
+
+    full = client.get(url)
+    assert full.status_code == 200
+    etag = full.headers["etag"]
+    assert etag == f'"{job["result"]["sha256"]}"'
+    assert full.headers["accept-ranges"] == "bytes"
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get(url, headers={"Range": "bytes=100-", "If-Range": etag})
+    assert partial.status_code == 206
+    assert partial.content == full.content[100:]
+    assert (
+        partial.headers["content-range"]
+        == f"bytes 100-{len(full.content) - 1}/{len(full.content)}"
+    )
+
+    # A stale If-Range gets the whole (changed) file rather than a spliced one
+    stale = client.get(url, headers={"Range": "bytes=100-", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+    assert stale.content == full.content
+
+    unsatisfiable = client.get(url, headers={"Range": f"bytes={len(full.content)}-"})
+    assert unsatisfiable.status_code == 416
+    assert client.get(f"{settings.API_V1_STR}/ppc/download/..etc").status_code == 400
+    assert (
+        client.get(f"{settings.API_V1_STR}/ppc/download/{uuid.uuid4()}").status_code
+        == 404
+    )
+
+
+def test_download_signed_and_offloaded(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "PPC_SIGNED_DOWNLOADS", True)
+    monkeypatch.setattr(settings, "PPC_DOWNLOAD_ACCEL_PREFIX", "/protected-ppc-files/")
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"min_clicks": "10", "match_type": "both"},
+    )
+    job = wait_for_job(client, response.json()["job_id"])
+    unsigned = f"{settings.API_V1_STR}/ppc/download/{job['download_id']}"
+    assert job["download_url"].startswith(f"{unsigned}?expires=")
+    assert client.get(unsigned).status_code == 403
+    assert client.get(job["download_url"] + "0").status_code == 403
+
+    offloaded = client.get(job["download_url"])
+    assert offloaded.status_code == 200
+    assert offloaded.content == b""
+    sha256 = job["result"]["sha256"]
+    assert (
+        offloaded.headers["x-accel-redirect"]
+        == f"/protected-ppc-files/blobs/{sha256[:2]}/{sha256}.xlsx"
+    )
+    assert offloaded.headers["etag"] == f'"{sha256}"'
+
+    monkeypatch.setattr(settings, "PPC_DOWNLOAD_URL_TTL", -1)
+    expired = wait_for_job(client, job["id"])["download_url"]
+    assert client.get(expired).status_code == 403
+
+
+def test_download_url_expiry_in_any_timezone(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "PPC_SIGNED_DOWNLOADS", True)
+    # Europe/Berlin, spelled out so it needs no tz database
+    monkeypatch.setenv("TZ", "CET-1CEST,M3.5.0,M10.5.0/3")
+    time.tzset()
+    try:
+        url = ppc.download_url("abc")
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    expires = int(url.split("expires=")[1].split("&")[0])
+    assert abs(expires - (time.time() + settings.PPC_DOWNLOAD_URL_TTL)) < 60
+
+
+def test_job_events_stream(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+    )
+    job_id = response.json()["job_id"]
+    with client.stream(
+        "GET", f"{settings.API_V1_STR}/ppc/jobs/{job_id}/events"
+    ) as stream:
+        assert stream.headers["content-type"].startswith("text/event-stream")
+        body = stream.read().decode()
+
+    messages = [
+        message for message in body.split("\n\n") if message.startswith("event:")
+    ]
+    events = [
+        (
+            message.split("\n")[0].removeprefix("event: "),
+            json.loads(message.split("\n")[1].removeprefix("data: ")),
+        )
+        for message in messages
+    ]
+    assert all(name == "progress" and data["stage"] for name, data in events[:-1])
+    name, job = events[-1]
+    assert name == "succeeded"
+    assert job["id"] == job_id
+    assert job["download_url"] == f"{settings.API_V1_STR}/ppc/download/{job_id}"
+
+    missing = client.get(f"{settings.API_V1_STR}/ppc/jobs/{uuid.uuid4()}/events")
+    assert missing.status_code == 404
+
+
+def test_job_events_from_another_process(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "PPC_PROGRESS_SAVE_INTERVAL", 0.05)
+    # Run elsewhere: this process only sees the progress saved to the job row
+    progress = {
+        "job_id": "",
+        "status": "running",
+        "stage": "harvesting",
+        "rows_processed": 5,
+    }
+    job = PPCJob(
+        kind="harvest-negatives", status="running", started_at=datetime.utcnow()
+    )
+    db.add(job)
+    db.commit()
+    progress["job_id"] = str(job.id)
+    job.progress = progress
+    db.add(job)
+    db.commit()
+
+    def finish() -> None:
+        time.sleep(0.3)
+        with Session(db.get_bind()) as session:
+            finished = session.get(PPCJob, job.id)
+            assert finished
+            crud.finish_ppc_job(session=session, job=finished, result={})
+
+    finisher = threading.Thread(target=finish)
+    finisher.start()
+    try:
+        with client.stream(
+            "GET", f"{settings.API_V1_STR}/ppc/jobs/{job.id}/events"
+        ) as stream:
+            body = stream.read().decode()
+    finally:
+        finisher.join()
+        db.delete(db.get(PPCJob, job.id))
+        db.commit()
+
+    messages = [
+        message for message in body.split("\n\n") if message.startswith("event:")
+    ]
+    assert messages[0] == f"event: progress\ndata: {json.dumps(progress)}"
+    assert messages[-1].startswith("event: succeeded")
+
+
+def test_optimize_bids_estimate_matches_full_run(client: TestClient) -> None:
+    workbook = create_bid_workbook(60)
+    data = {"target_acos": "30", "increase_spend": "true"}
+    full = client.post(
+        f"{settings.API_V1_STR}/ppc/upload",
+        files={"file": ("bids.xlsx", workbook)},
+        data=data,
+    )
+    output = next(iter(read_workbook(get_job_output(client, full)).values()))
+
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/upload",
+        files={"file": ("bids.xlsx", workbook)},
+        data={**data, "mode": "estimate"},
+    )
+    assert response.status_code == 200
+    estimate = response.json()
+    # Small sheets are evaluated in full, so the estimate is exact
+    assert estimate["sampled_rows"] == estimate["total_rows"] == 60
+    updates = int((output["Update"] == "Update").sum())
+    assert estimate["updates_recommended"] == {
+        "estimate": updates,
+        "low": updates,
+        "high": updates,
+    }
+    assert sum(rule["estimate"] for rule in estimate["rules"].values()) == int(
+        output["Color"].notna().sum()
+    )
+
+    invalid = client.post(
+        f"{settings.API_V1_STR}/ppc/upload",
+        files={"file": ("bids.xlsx", workbook)},
+        data={**data, "mode": "fast"},
+    )
+    assert invalid.status_code == 400
+
+
+def test_estimate_bid_optimization_sampled() -> None:
+    workbook = create_bid_workbook(3000, seed=1)
+    exact = ppc.estimate_bid_optimization(workbook, 30, False, sample_rows=3000)
+    estimate = ppc.estimate_bid_optimization(workbook, 30, False, sample_rows=400)
+    assert 400 <= estimate["sampled_rows"] <= 420
+    assert estimate["current_spend"] == exact["current_spend"]
+    for rule, counts in estimate["rules"].items():
+        assert counts["low"] <= exact["rules"][rule]["estimate"] <= counts["high"], rule
+    spend_change = estimate["spend_change"]
+    assert (
+        spend_change["low"] <= exact["spend_change"]["estimate"] <= spend_change["high"]
+    )
+
+
+def test_idempotency_key_reuses_job(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    url = f"{settings.API_V1_STR}/ppc/harvest-negatives"
+    workbook = create_search_term_workbook()
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+
+    def post(data: dict[str, str], headers: dict[str, str] = headers) -> httpx.Response:
+        return client.post(
+            url, headers=headers, files={"file": ("report.xlsx", workbook)}, data=data
+        )
+
+    first = post({"min_clicks": "5"})
+    assert first.status_code == 202
+    repeat = post({"min_clicks": "5"})
+    assert repeat.status_code == 202
+    assert repeat.json()["job_id"] == first.json()["job_id"]
+    assert wait_for_job(client, first.json()["job_id"])["status"] == "succeeded"
+    # Still answered from the first job once it has finished
+    assert post({"min_clicks": "5"}).json()["job_id"] == first.json()["job_id"]
+
+    changed = post({"min_clicks": "10"})
+    assert changed.status_code == 422
+    assert (
+        post({"min_clicks": "5"}, headers={}).json()["job_id"] != first.json()["job_id"]
+    )
+
+    # Expired keys are taken over by the next request
+    monkeypatch.setattr(settings, "PPC_IDEMPOTENCY_TTL", 0)
+    expiring = {"Idempotency-Key": str(uuid.uuid4())}
+    assert (
+        post({"min_clicks": "5"}, expiring).json()["job_id"]
+        != post({"min_clicks": "5"}, expiring).json()["job_id"]
+    )
+
+
+def test_cancel_job(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/upload",
+        files={"file": ("bids.xlsx", create_bid_workbook(5000))},
+        data={"target_acos": "30"},
+    )
+    job_id = response.json()["job_id"]
+    cancelled = client.delete(f"{settings.API_V1_STR}/ppc/jobs/{job_id}")
+    assert cancelled.status_code == 202
+    assert cancelled.json()["cancel_requested_at"] is not None
+    job = wait_for_job(client, job_id)
+    assert job["status"] == "cancelled"
+    assert job["download_url"] is None
+    assert client.delete(f"{settings.API_V1_STR}/ppc/jobs/{job_id}").status_code == 202
+
+    finished = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+    ).json()["job_id"]
+    assert wait_for_job(client, finished)["status"] == "succeeded"
+    assert (
+        client.delete(f"{settings.API_V1_STR}/ppc/jobs/{finished}").status_code == 409
+    )
+    assert (
+        client.delete(f"{settings.API_V1_STR}/ppc/jobs/{uuid.uuid4()}").status_code
+        == 404
+    )
+
+
+def spin(progress: ProgressReporter) -> None:
+    while True:
+        progress.advance()
+        time.sleep(0.01)
+
+
+def test_run_until_disconnected_cancels(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(ppc, "TEMP_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PPC_CANCEL_CHECK_INTERVAL", 0.05)
+
+    class Disconnected:
+        async def is_disconnected(self) -> bool:
+            return True
+
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as exc_info:
+        anyio.run(ppc.run_until_disconnected, cast(Request, Disconnected()), spin)
+    assert exc_info.value.status_code == 499
+    assert time.monotonic() - started < 1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_owned_job_access(client: TestClient, db: Session) -> None:
+    headers = create_random_user_headers(client=client, db=db)
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        headers=headers,
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+    )
+    job_id = response.json()["job_id"]
+    job = wait_for_job(client, job_id, headers)
+    assert job["status"] == "succeeded"
+    other = create_random_user_headers(client=client, db=db)
+    url = f"{settings.API_V1_STR}/ppc/jobs/{job_id}"
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers=other).status_code == 403
+    assert client.get(f"{url}/events", headers=other).status_code == 403
+    with client.stream("GET", f"{url}/events", headers=headers) as stream:
+        assert f'"id": "{job_id}"' in stream.read().decode()
+    assert client.get(f"{url}/preview", headers=other).status_code == 403
+    assert (
+        client.get(f"{url}/preview", headers=headers).json()["sheet"]
+        == "Negative Keywords"
+    )
+    assert client.delete(url).status_code == 401
+    assert client.delete(url, headers=other).status_code == 403
+    # Reaches the status check only for the owner
+    assert client.delete(url, headers=headers).status_code == 409
+
+    # Owned files get signed links, which work without a token
+    unsigned = f"{settings.API_V1_STR}/ppc/download/{job_id}"
+    assert job["download_url"].startswith(f"{unsigned}?expires=")
+    assert client.get(job["download_url"]).status_code == 200
+    assert client.get(unsigned).status_code == 401
+    assert client.get(unsigned, headers=other).status_code == 403
+    assert client.get(unsigned, headers=headers).status_code == 200
+
+
+def test_list_results(client: TestClient, db: Session) -> None:
+    headers = create_random_user_headers(client=client, db=db)
+    workbook = create_search_term_workbook()
+    job_ids = []
+    for max_acos in ("30", "40"):
+        response = client.post(
+            f"{settings.API_V1_STR}/ppc/mine-keywords",
+            headers=headers,
+            files={"file": ("report.xlsx", workbook)},
+            data={"max_acos": max_acos},
+        )
+        job_ids.append(response.json()["job_id"])
+        assert wait_for_job(client, job_ids[-1], headers)["status"] == "succeeded"
+
+    url = f"{settings.API_V1_STR}/ppc/results"
+    first = client.get(url, headers=headers, params={"limit": 1}).json()
+    [newest] = first["data"]
+    assert newest["job_id"] == job_ids[1]
+    assert (newest["kind"], newest["filename"], newest["file_type"]) == (
+        "mine-keywords",
+        "report.xlsx",
+        "xlsx",
+    )
+    assert newest["params"]["max_acos"] == 40
+    assert "input_blob" not in newest["params"]
+    assert client.get(newest["download_url"]).content.startswith(b"PK")
+
+    second = client.get(
+        url, headers=headers, params={"limit": 1, "cursor": first["next_cursor"]}
+    ).json()
+    assert [result["job_id"] for result in second["data"]] == [job_ids[0]]
+    assert second["next_cursor"] is None
+
+    assert (
+        client.get(url, headers=headers, params={"kind": "optimize-bids"}).json()[
+            "data"
+        ]
+        == []
+    )
+    bids = client.post(
+        f"{settings.API_V1_STR}/ppc/upload",
+        headers=headers,
+        files={"file": ("bids.xlsx", create_bid_workbook(50))},
+        data={"target_acos": "30"},
+    ).json()["job_id"]
+    assert wait_for_job(client, bids, headers)["status"] == "succeeded"
+    [optimized] = client.get(
+        url, headers=headers, params={"kind": "optimize-bids"}
+    ).json()["data"]
+    assert optimized["job_id"] == bids
+    assert optimized["params"] == {"target_acos": 30.0, "increase_spend": False}
+    assert (
+        client.get(url, headers=headers, params={"cursor": "nonsense"}).status_code
+        == 400
+    )
+    other = create_random_user_headers(client=client, db=db)
+    assert client.get(url, headers=other).json()["data"] == []
+
+
+def test_upload_over_user_quota(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    headers = create_random_user_headers(client=client, db=db)
+    workbook = create_bid_workbook(50)
+    monkeypatch.setattr(storage_manager, "user_quota", len(workbook) - 1)
+
+    def upload(headers: dict[str, str]) -> httpx.Response:
+        return client.post(
+            f"{settings.API_V1_STR}/ppc/upload",
+            headers=headers,
+            files={"file": ("bids.xlsx", workbook)},
+            data={"target_acos": "30"},
+        )
+
+    response = upload(headers)
+    assert response.status_code == 507
+    assert "quota" in response.json()["detail"]
+    # Anonymous uploads only count toward the global quota
+    assert upload({}).status_code == 202
+
+
+def test_preview_job_output(client: TestClient) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/harvest-negatives",
+        files={"file": ("report.xlsx", create_search_term_workbook())},
+        data={"min_clicks": "5", "min_acos": "15", "match_type": "both"},
+    )
+    job = wait_for_job(client, response.json()["job_id"])
+    assert job["result"]["preview_sheets"][0] == "Negative Keywords"
+    url = f"{settings.API_V1_STR}/ppc/jobs/{job['id']}/preview"
+
+    params: dict[str, Any] = {
+        "filter": "Entity:eq:Negative Keyword",
+        "sort": "-Keyword Text",
+        "limit": 4,
+    }
+    first = client.get(url, params=params).json()
+    assert first["sheet"] == "Negative Keywords"
+    assert "Keyword Text" in first["columns"]
+    assert first["total"] == 6  # Exact and phrase negatives for three terms
+    second = client.get(url, params={**params, "cursor": first["next_cursor"]}).json()
+    assert second["next_cursor"] is None
+    keywords = [row["Keyword Text"] for row in first["rows"] + second["rows"]]
+    assert keywords == sorted(keywords, reverse=True)
+    assert set(keywords) == {"red running shoes", "cheap shoes", "acme socks"}
+
+    other_sort = client.get(
+        url, params={**params, "sort": "Keyword Text", "cursor": first["next_cursor"]}
+    )
+    assert other_sort.status_code == 400
+    bad_filter = client.get(url, params={"filter": "Entity:like:Negative"})
+    assert bad_filter.status_code == 400
+    missing = client.get(f"{settings.API_V1_STR}/ppc/jobs/{uuid.uuid4()}/preview")
+    assert missing.status_code == 404
+
+
+def test_batch_with_archive_and_bundle(client: TestClient, db: Session) -> None:
+    headers = create_random_user_headers(client=client, db=db)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zipped:
+        zipped.writestr("account-c.xlsx", create_search_term_workbook())
+        zipped.writestr("__MACOSX/._account-c.xlsx", b"metadata")
+    response = client.post(
+        f"{settings.API_V1_STR}/ppc/batches",
+        headers=headers,
+        files=[
+            ("files", ("account-a.xlsx", create_search_term_workbook())),
+            ("files", ("account-b.xlsx", create_search_term_workbook())),
+            ("files", ("more.zip", archive.getvalue())),
+        ],
+        data={
+            "kind": "harvest-negatives",
+            "params": json.dumps({"min_clicks": 10}),
+            "file_params": json.dumps({"account-b.xlsx": {"match_type": "phrase"}}),
+            "max_concurrency": "1",
+            "bundle": "true",
+        },
+    )
+    assert response.status_code == 202
+    assert [job["filename"] for job in response.json()["jobs"]] == [
+        "account-a.xlsx",
+        "account-b.xlsx",
+        "account-c.xlsx",
+    ]
+
+    batch = wait_for_batch(client, response.json()["batch_id"], headers)
+    assert batch["status"] == "succeeded"
+    assert batch["counts"] == {"succeeded": 3}
+    # max_concurrency=1: each job starts only after the previous one finished
+    jobs = sorted(batch["jobs"], key=lambda job: job["started_at"])
+    for previous, following in zip(jobs, jobs[1:], strict=False):
+        assert following["started_at"] >= previous["finished_at"]
+
+    bundle = client.get(batch["bundle_job"]["download_url"])
+    assert bundle.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(bundle.content)) as zipped:
+        assert sorted(zipped.namelist()) == [
+            "account-a_processed.xlsx",
+            "account-b_processed.xlsx",
+            "account-c_processed.xlsx",
+        ]
+        phrase = read_workbook(zipped.read("account-b_processed.xlsx"))[
+            "Negative Keywords"
+        ]
+    assert set(phrase["Match Type"].dropna()) == {"negativePhrase"}
+
+
+def test_batch_rejects_invalid_params(client: TestClient, db: Session) -> None:
+    headers = create_random_user_headers(client=client, db=db)
+    url = f"{settings.API_V1_STR}/ppc/batches"
+    files = [("files", ("account-a.xlsx", create_search_term_workbook()))]
+
+    response = client.post(
+        url, headers=headers, files=files, data={"kind": "optimize-bids"}
+    )
+    assert response.status_code == 400
+    assert "account-a.xlsx" in response.json()["detail"]
+    response = client.post(
+        url,
+        headers=headers,
+        files=files,
+        data={
+            "kind": "harvest-negatives",
+            "file_params": json.dumps({"other.xlsx": {}}),
+        },
+    )
+    assert response.status_code == 400
+    response = client.post(
+        url, headers=headers, files=files, data={"kind": "ngram-analysis"}
+    )
+    assert response.status_code == 400
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zipped:
+        zipped.writestr("acct1/bulk.xlsx", create_search_term_workbook())
+        zipped.writestr("acct2/bulk.xlsx", create_search_term_workbook())
+    response = client.post(
+        url,
+        headers=headers,
+        files=[("files", ("accounts.zip", archive.getvalue()))],
+        data={"kind": "harvest-negatives"},
+    )
+    assert response.status_code == 400
+    assert "bulk.xlsx" in response.json()["detail"]
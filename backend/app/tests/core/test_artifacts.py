@@ -0,0 +1,90 @@
+import hashlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session
+
+from app import crud
+from app.core.artifacts import ArtifactStore, LocalBlobBackend, S3BlobBackend
+from app.models import ArtifactBlob
+
+
+def _put(
+    store: ArtifactStore, db: Session, tmp_path: Path, key: str, content: bytes
+) -> str:
+    source = tmp_path / f"{key}.upload"
+    source.write_bytes(content)
+    return store.put(
+        db,
+        str(source),
+        key=key,
+        sha256=hashlib.sha256(content).hexdigest(),
+        file_type="csv",
+    )
+
+
+def test_put_deduplicates_and_collect_waits_for_last_ref(
+    db: Session, tmp_path: Path
+) -> None:
+    backend = LocalBlobBackend(str(tmp_path / "blobs"))
+    store = ArtifactStore(backend)
+    content = b"Campaign,Clicks\nc1,3\n"
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    first = _put(store, db, tmp_path, "artifact-test-a", content)
+    second = _put(store, db, tmp_path, "artifact-test-b", content)
+    assert first == second == store.blob_name(sha256, "csv")
+    blob_path = Path(backend.local_path(first))
+    assert blob_path.read_bytes() == content
+    assert not list(tmp_path.glob("*.upload"))
+    db.expire_all()
+    blob = db.get(ArtifactBlob, sha256)
+    assert blob and blob.refcount == 2
+    ref = store.resolve(db, "artifact-test-a")
+    assert ref and ref.sha256 == sha256
+
+    now = datetime.utcnow()
+    crud.set_artifact_ref_expiry(
+        session=db, key="artifact-test-a", expires_at=now - timedelta(seconds=1)
+    )
+    assert store.collect(db, now) == 1
+    assert blob_path.exists()
+    assert store.resolve(db, "artifact-test-a") is None
+
+    crud.set_artifact_ref_expiry(
+        session=db, key="artifact-test-b", expires_at=now - timedelta(seconds=1)
+    )
+    assert store.collect(db, now) == 1
+    assert not blob_path.exists()
+    db.expire_all()
+    assert db.get(ArtifactBlob, sha256) is None
+
+
+def test_s3_backend_streams_blobs(tmp_path: Path) -> None:
+    moto = pytest.importorskip("moto")
+    with moto.mock_aws():
+        backend = S3BlobBackend(
+            "ppc-artifacts",
+            prefix="test/",
+            scratch_dir=str(tmp_path),
+            region="us-east-1",
+        )
+        backend._client.create_bucket(Bucket="ppc-artifacts")
+        source = tmp_path / "output.xlsx"
+        source.write_bytes(b"0123456789")
+
+        assert not backend.exists("ab/blob.xlsx")
+        backend.put_file("ab/blob.xlsx", str(source))
+        assert not source.exists()
+        assert backend.exists("ab/blob.xlsx")
+        assert backend.local_path("ab/blob.xlsx") is None
+        assert b"".join(backend.iter_range("ab/blob.xlsx", 2, 5)) == b"2345"
+
+        with backend.local_copy("ab/blob.xlsx") as path:
+            assert path.endswith(".xlsx")
+            assert Path(path).read_bytes() == b"0123456789"
+        assert not Path(path).exists()
+
+        backend.delete("ab/blob.xlsx")
+        assert not backend.exists("ab/blob.xlsx")
@@ -0,0 +1,54 @@
+import threading
+from typing import Annotated
+
+import anyio
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.capacity import CapacityPool, runs_in
+
+
+def test_pools_queue_independently() -> None:
+    busy = CapacityPool("busy", 1)
+    other = CapacityPool("other", 1)
+    release = threading.Event()
+
+    async def main() -> None:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(busy.run, release.wait)
+            tg.start_soon(busy.run, lambda: None)
+            await anyio.sleep(0.05)
+            stats = busy.statistics()
+            assert (stats["in_use"], stats["waiting"]) == (1, 1)
+            # A saturated pool does not hold up work in another one
+            with anyio.fail_after(1):
+                assert await other.run(lambda: "done") == "done"
+            release.set()
+
+    anyio.run(main)
+    stats = busy.statistics()
+    assert stats["completed"] == 2
+    assert stats["wait_max_ms"] >= 40
+
+
+def test_runs_in_keeps_route_signature() -> None:
+    pool = CapacityPool("route", 1)
+    app = FastAPI()
+
+    def get_prefix() -> str:
+        return "hello"
+
+    @app.get("/greet")
+    @runs_in(pool)
+    def greet(prefix: Annotated[str, Depends(get_prefix)], name: str) -> dict[str, str]:
+        return {
+            "message": f"{prefix} {name}",
+            "thread": threading.current_thread().name,
+        }
+
+    with TestClient(app) as client:
+        response = client.get("/greet", params={"name": "ppc"})
+        assert response.status_code == 200
+        assert response.json()["message"] == "hello ppc"
+        assert client.get("/greet").status_code == 422
+    assert pool.statistics()["completed"] == 1
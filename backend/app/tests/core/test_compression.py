@@ -0,0 +1,92 @@
+import gzip
+from typing import Any
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.compression import CompressionMiddleware, negotiate_encoding
+
+ROWS = [{"keyword": f"red running shoes {i}", "clicks": i} for i in range(200)]
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=500,
+        content_types=["application/json", "text/csv"],
+    )
+
+    @app.get("/rows")
+    def rows() -> list[dict[str, Any]]:
+        return ROWS
+
+    @app.get("/small")
+    def small() -> dict[str, bool]:
+        return {"ok": True}
+
+    @app.get("/workbook")
+    def workbook() -> Response:
+        return Response(
+            b"PK\x03\x04" + b"\x00" * 2000,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"ETag": '"abc"'},
+        )
+
+    @app.get("/stream.csv")
+    def stream() -> StreamingResponse:
+        lines = (f"shoes {i},{i}\n".encode() for i in range(1000))
+        return StreamingResponse(
+            lines, media_type="text/csv", headers={"ETag": '"abc"'}
+        )
+
+    return app
+
+
+def test_negotiate_encoding() -> None:
+    preferred = ["br", "zstd", "gzip"]
+    assert negotiate_encoding("gzip, deflate, br", preferred) == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5", preferred) == "gzip"
+    assert negotiate_encoding("br;q=0, *", preferred) == "zstd"
+    assert negotiate_encoding("identity", preferred) is None
+    assert negotiate_encoding("", preferred) is None
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+def test_compresses_json(encoding: str) -> None:
+    pytest.importorskip({"gzip": "gzip", "br": "brotli", "zstd": "zstandard"}[encoding])
+    client = TestClient(create_app())
+    response = client.get("/rows", headers={"Accept-Encoding": encoding})
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(response.content) / 4
+    if encoding == "gzip":
+        assert response.json() == ROWS
+
+
+def test_skips_small_and_compressed_bodies() -> None:
+    client = TestClient(create_app())
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert small.headers["vary"] == "Accept-Encoding"
+
+    workbook = client.get("/workbook", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in workbook.headers
+    assert workbook.headers["etag"] == '"abc"'
+    assert workbook.content.startswith(b"PK")
+
+
+def test_compresses_streams_chunk_by_chunk() -> None:
+    client = TestClient(create_app())
+    with client.stream(
+        "GET", "/stream.csv", headers={"Accept-Encoding": "gzip"}
+    ) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert response.headers["etag"] == 'W/"abc"'
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw).decode() == "".join(
+        f"shoes {i},{i}\n" for i in range(1000)
+    )
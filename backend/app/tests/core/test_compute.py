@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from app.core.compute import ComputePool, ComputePoolSaturated
+
+
+def test_compute_pool_runs_in_worker_process() -> None:
+    pool = ComputePool(workers=1, max_queue=0)
+    try:
+        assert pool.run(divmod, 7, 2) == (3, 1)
+        with pytest.raises(ZeroDivisionError):
+            pool.run(divmod, 1, 0)
+    finally:
+        pool.shutdown()
+
+
+def test_compute_pool_rejects_when_saturated() -> None:
+    pool = ComputePool(workers=1, max_queue=1)
+    try:
+        running = pool.submit(time.sleep, 0.5)
+        waiting = pool.submit(time.sleep, 0)
+        assert pool.in_flight == 2
+        with pytest.raises(ComputePoolSaturated):
+            pool.submit(time.sleep, 0)
+
+        running.result()
+        waiting.result()
+        pool.submit(time.sleep, 0).result()
+    finally:
+        pool.shutdown()
+
+
+def test_compute_pool_inline() -> None:
+    pool = ComputePool(workers=0, max_queue=0)
+    assert pool.run(divmod, 7, 2) == (3, 1)
@@ -0,0 +1,26 @@
+import pytest
+
+from app.core.downloads import RangeNotSatisfiable, etag_matches, parse_range
+
+
+def test_parse_range() -> None:
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=90-500", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=-500", 100) == (0, 99)
+    # Ignored: the whole file is served instead
+    assert parse_range("bytes=0-9,20-29", 100) is None
+    assert parse_range("items=0-9", 100) is None
+    assert parse_range("bytes=9-0", 100) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=-0", 100)
+
+
+def test_etag_matches() -> None:
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abcd"', '"abc"')
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from sqlmodel import Session
+
+from app.core.janitor import TempFileJanitor
+from app.models import TempFileExpiry
+
+
+def test_sweep_removes_only_expired_files(db: Session, tmp_path: Path) -> None:
+    janitor = TempFileJanitor(sweep_interval=60)
+    expired = tmp_path / "expired.xlsx"
+    kept = tmp_path / "kept.xlsx"
+    expired.write_bytes(b"x")
+    kept.write_bytes(b"x")
+
+    janitor.schedule(str(expired), 0)
+    janitor.schedule(str(kept), 3600)
+    assert janitor.sweep() == 1
+
+    assert not expired.exists()
+    assert kept.exists()
+    assert db.get(TempFileExpiry, str(expired)) is None
+    assert db.get(TempFileExpiry, str(kept)) is not None
+
+    # Rescheduling replaces the earlier expiry
+    janitor.schedule(str(kept), 0)
+    assert janitor.sweep() == 1
+    assert not kept.exists()
+
+
+def test_sweep_tolerates_missing_files(tmp_path: Path) -> None:
+    janitor = TempFileJanitor(sweep_interval=60)
+    janitor.schedule(str(tmp_path / "already-gone.xlsx"), 0)
+    assert janitor.sweep() == 1
+    assert janitor.sweep() == 0
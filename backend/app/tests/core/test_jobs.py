@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import Session
+
+from app import crud
+from app.core import jobs
+from app.core.config import settings
+from app.core.progress import progress_bus
+from app.models import PPCJob
+from app.tests.utils.user import create_random_user
+
+
+def test_claim_order(db: Session) -> None:
+    user_a = create_random_user(db)
+    user_b = create_random_user(db)
+    now = datetime.utcnow()
+
+    def queue(
+        name: str, owner: object, priority: str, rows: int, age: int = 0
+    ) -> PPCJob:
+        job = PPCJob(
+            kind="optimize-bids",
+            params={"name": name},
+            owner_id=owner.id,  # type: ignore[attr-defined]
+            priority=priority,
+            estimated_rows=rows,
+            created_at=now - timedelta(seconds=age),
+        )
+        db.add(job)
+        return job
+
+    queued = [
+        queue("a_big", user_a, "interactive", 100_000),
+        queue("a_small", user_a, "interactive", 10),
+        queue("b_batch", user_b, "batch", 1),
+        queue("b_interactive", user_b, "interactive", 50_000),
+        # Waited past the aging limit, so neither its class nor its size hold it back
+        queue("b_aged_batch", user_b, "batch", 1_000_000, age=3600),
+    ]
+    db.commit()
+    ids = {job.id for job in queued}
+
+    claimed = []
+    try:
+        for _ in range(20):
+            job = crud.claim_ppc_job(
+                session=db, aged_before=now - timedelta(seconds=300)
+            )
+            if job is None:
+                break
+            if job.id in ids:
+                claimed.append(job.params["name"])
+            if len(claimed) == len(queued):
+                break
+        # Then interactive first, owners with fewer running jobs first, smaller jobs first
+        assert claimed == [
+            "b_aged_batch",
+            "a_small",
+            "b_interactive",
+            "a_big",
+            "b_batch",
+        ]
+
+        statistics = {
+            entry["priority"]: entry for entry in jobs.queue_statistics(session=db)
+        }
+        assert statistics["interactive"]["started"] >= 3
+        assert statistics["batch"]["wait_max_ms"] >= 3600 * 1000
+    finally:
+        for job in queued:
+            db.delete(db.get(PPCJob, job.id))
+        db.commit()
+
+
+def test_requeue_expired_leases(db: Session) -> None:
+    now = datetime.utcnow()
+    expired = now - timedelta(seconds=settings.PPC_JOB_LEASE + 60)
+
+    def running(name: str, heartbeat_at: datetime, cancel: bool = False) -> PPCJob:
+        job = PPCJob(
+            kind="optimize-bids",
+            params={"name": name},
+            status="running",
+            started_at=expired,
+            heartbeat_at=heartbeat_at,
+            cancel_requested_at=now if cancel else None,
+        )
+        db.add(job)
+        return job
+
+    # Started long ago but still renewed by a live process, so left alone
+    alive = running("alive", now)
+    renewed = running("renewed", expired)
+    dead = running("dead", expired)
+    cancelled = running("cancelled", expired, cancel=True)
+    db.commit()
+    ids = [alive.id, renewed.id, dead.id, cancelled.id]
+
+    jobs._running.add(renewed.id)
+    try:
+        jobs.renew_leases()
+        assert jobs.requeue_stale_jobs() >= 1
+        statuses = {}
+        for job_id in ids:
+            job = db.get(PPCJob, job_id)
+            assert job
+            db.refresh(job)
+            statuses[job.params["name"]] = job.status
+        assert statuses == {
+            "alive": "running",
+            "renewed": "running",
+            "dead": "queued",
+            "cancelled": "cancelled",
+        }
+    finally:
+        jobs._running.discard(renewed.id)
+        for job_id in ids:
+            db.delete(db.get(PPCJob, job_id))
+        db.commit()
+
+
+def test_save_progress(db: Session) -> None:
+    job = PPCJob(kind="optimize-bids", status="running", started_at=datetime.utcnow())
+    db.add(job)
+    db.commit()
+    event = {
+        "job_id": str(job.id),
+        "status": "running",
+        "stage": "optimizing",
+        "rows_processed": 10,
+    }
+
+    jobs._running.add(job.id)
+    try:
+        progress_bus.publish(event)
+        jobs.save_progress()
+        db.refresh(job)
+        assert job.progress == event
+        assert job.heartbeat_at is not None
+    finally:
+        jobs._running.discard(job.id)
+        progress_bus.publish({"job_id": str(job.id), "status": "succeeded"})
+        db.delete(job)
+        db.commit()
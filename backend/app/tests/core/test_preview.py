@@ -0,0 +1,104 @@
+import io
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from app.core.preview import (
+    ROW_COLUMN,
+    InvalidPreviewQuery,
+    parse_filter,
+    query_preview,
+    write_preview_tables,
+)
+
+
+def create_workbook() -> bytes:
+    bids = pd.DataFrame(
+        {
+            "Keyword": [f"shoes {i}" for i in range(10)],
+            "Bid": [0.5, 1.0, None, 0.75, 1.0, 0.25, None, 1.0, 0.5, 2.0],
+            "Match": ["exact", "phrase"] * 5,
+            "Ad Group": ["ag1", 2, "ag3", 4, "ag5", 6, "ag7", 8, "ag9", 10],
+        }
+    )
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        bids.to_excel(writer, sheet_name="Bids", index=False)
+        pd.DataFrame({"Note": ["none"]}).to_excel(
+            writer, sheet_name="Notes", index=False
+        )
+    return buffer.getvalue()
+
+
+def read_all(table: pa.Table, **query: Any) -> list[dict[str, Any]]:
+    rows, cursor = [], None
+    while True:
+        page = query_preview(table, cursor=cursor, limit=3, **query)
+        rows += page["rows"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rows
+
+
+def test_write_preview_tables(tmp_path: Path) -> None:
+    tables = write_preview_tables(io.BytesIO(create_workbook()), str(tmp_path))
+    assert [sheet for sheet, _ in tables] == ["Bids", "Notes"]
+    table = pq.read_table(tables[0][1])
+    assert table[ROW_COLUMN].to_pylist() == list(range(10))
+    # Mixed text and numbers are kept as text
+    assert table["Ad Group"].to_pylist()[:2] == ["ag1", "2"]
+
+
+def test_query_preview_pages_through_sorted_rows(tmp_path: Path) -> None:
+    table = pq.read_table(
+        write_preview_tables(io.BytesIO(create_workbook()), str(tmp_path))[0][1]
+    )
+
+    rows = read_all(table, filters=[], sort="-Bid")
+    # Ties keep sheet order and nulls come last
+    assert [row[ROW_COLUMN] for row in rows] == [9, 1, 4, 7, 3, 0, 8, 5, 2, 6]
+
+    rows = read_all(
+        table,
+        filters=[parse_filter("Match:eq:phrase"), parse_filter("Bid:ge:0.75")],
+        sort="Bid",
+    )
+    assert [row["Keyword"] for row in rows] == [
+        "shoes 3",
+        "shoes 1",
+        "shoes 7",
+        "shoes 9",
+    ]
+
+    page = query_preview(
+        table, filters=[parse_filter("Keyword:in:shoes 2,shoes 4")], limit=1
+    )
+    assert page["total"] == 2
+    assert page["rows"][0]["Keyword"] == "shoes 2"
+
+    page = query_preview(
+        table, filters=[parse_filter("Bid:null")], sort="Keyword", limit=5
+    )
+    assert [row["Keyword"] for row in page["rows"]] == ["shoes 2", "shoes 6"]
+    assert page["next_cursor"] is None
+
+
+def test_query_preview_rejects_bad_queries(tmp_path: Path) -> None:
+    table = pq.read_table(
+        write_preview_tables(io.BytesIO(create_workbook()), str(tmp_path))[0][1]
+    )
+    cursor = query_preview(table, filters=[], sort="Bid", limit=2)["next_cursor"]
+    with pytest.raises(InvalidPreviewQuery):
+        query_preview(table, filters=[], sort="-Bid", cursor=cursor)
+    with pytest.raises(InvalidPreviewQuery):
+        query_preview(table, filters=[], cursor="not a cursor")
+    with pytest.raises(InvalidPreviewQuery):
+        query_preview(table, filters=[parse_filter("Bid:gt:cheap")])
+    with pytest.raises(InvalidPreviewQuery):
+        query_preview(table, filters=[], sort="Spend")
+    with pytest.raises(InvalidPreviewQuery):
+        parse_filter("Bid:between:1")
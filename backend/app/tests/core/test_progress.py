@@ -0,0 +1,85 @@
+from pathlib import Path
+from typing import Any
+
+import anyio
+import pytest
+
+from app.core.cancellation import Cancelled, FlagFileToken
+from app.core.compute import ComputePool
+from app.core.progress import ProgressReporter, progress_bus
+
+
+def test_reporter_throttles_events() -> None:
+    reporter = ProgressReporter("throttled", interval=60)
+
+    async def main() -> list[dict[str, Any]]:
+        received = []
+        with progress_bus.subscribe("throttled") as subscription:
+            reporter.stage("optimizing bids", total=1000)
+            for _ in range(1000):
+                reporter.advance()
+            reporter.stage("writing")
+            with anyio.move_on_after(0.1):
+                while True:
+                    received.append(await subscription.get())
+        return received
+
+    events = anyio.run(main)
+    # Stage changes are always reported; per-row advances wait for the interval
+    assert [event["stage"] for event in events] == ["optimizing bids", "writing"]
+    assert events[0]["rows_total"] == 1000
+    latest = progress_bus.latest("throttled")
+    assert latest is not None and latest["stage"] == "writing"
+
+    progress_bus.publish({"job_id": "throttled", "status": "succeeded"})
+    assert progress_bus.latest("throttled") is None
+
+
+def test_reporter_computes_rate_and_eta() -> None:
+    reporter = ProgressReporter("rate", interval=0)
+    reporter.stage("optimizing bids", total=100)
+    reporter._started -= 2
+    reporter.advance(50)
+    event = progress_bus.latest("rate")
+    assert event is not None
+    assert event["rows_processed"] == 50
+    assert 20 <= event["rows_per_sec"] <= 25
+    assert 2 <= event["eta_seconds"] <= 2.5
+    progress_bus.publish({"job_id": "rate", "status": "failed"})
+
+
+def test_events_relayed_from_compute_workers() -> None:
+    pool = ComputePool(workers=1, max_queue=0)
+    reporter = ProgressReporter("relayed")
+
+    async def main() -> dict[str, Any]:
+        with progress_bus.subscribe("relayed") as subscription:
+            await anyio.to_thread.run_sync(pool.run, reporter.stage, "remote", 5)
+            with anyio.fail_after(10):
+                return await subscription.get()
+
+    try:
+        event = anyio.run(main)
+    finally:
+        pool.shutdown()
+    assert (event["stage"], event["rows_total"]) == ("remote", 5)
+    progress_bus.publish({"job_id": "relayed", "status": "succeeded"})
+
+
+def test_reporter_checks_cancel_token(tmp_path: Path) -> None:
+    token = FlagFileToken(str(tmp_path), interval=60)
+    reporter = ProgressReporter(None, cancel=token)
+    reporter.stage("optimizing bids", total=10)
+    token.cancel()
+    # Checked at most once per interval, so this advance does not notice yet
+    reporter.advance()
+
+    token.interval = 0
+    token._next_check = 0
+    with pytest.raises(Cancelled):
+        reporter.advance()
+    with pytest.raises(Cancelled):
+        reporter.stage("writing")
+    token.discard()
+    reporter.advance()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,94 @@
+import hashlib
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session
+
+from app.core.artifacts import ArtifactStore, LocalBlobBackend
+from app.core.storage import InsufficientStorage, StorageManager
+from app.models import ArtifactRef
+
+
+def _put(
+    store: ArtifactStore,
+    db: Session,
+    tmp_path: Path,
+    key: str,
+    role: str,
+    owner_id: uuid.UUID,
+) -> None:
+    # Distinct 100-byte contents, so every reference has a blob of its own
+    content = key.encode().ljust(100, b"x")
+    source = tmp_path / "upload"
+    source.write_bytes(content)
+    store.put(
+        db,
+        str(source),
+        key=key,
+        sha256=hashlib.sha256(content).hexdigest(),
+        file_type="csv",
+        owner_id=owner_id,
+        role=role,
+    )
+
+
+def test_evicts_cache_then_least_recently_used_results(
+    db: Session, tmp_path: Path
+) -> None:
+    store = ArtifactStore(LocalBlobBackend(str(tmp_path / "blobs")))
+    manager = StorageManager(
+        store, str(tmp_path), quota=10**15, user_quota=250, min_free=0
+    )
+    owner_id = uuid.uuid4()
+    keys = {
+        role: f"storage-test-{owner_id}-{role}"
+        for role in ("input", "old", "new", "cache")
+    }
+    for name, key in keys.items():
+        _put(
+            store,
+            db,
+            tmp_path,
+            key,
+            {"old": "result", "new": "result"}.get(name, name),
+            owner_id,
+        )
+    for name, hours in (("old", 2), ("new", 1)):
+        ref = db.get(ArtifactRef, keys[name])
+        assert ref
+        ref.accessed_at = datetime.utcnow() - timedelta(hours=hours)
+    db.commit()
+
+    assert manager.evict(db, 150, reason="test", owner_id=owner_id) == 200
+    assert store.resolve(db, keys["cache"]) is None
+    assert store.resolve(db, keys["old"]) is None
+    assert store.resolve(db, keys["new"]) is not None
+
+    # Input and result use 200 of 250 bytes; the result makes room for 100 more
+    manager.reserve(db, 100, owner_id)
+    assert store.resolve(db, keys["new"]) is None
+    # The pending job's input is pinned
+    with pytest.raises(InsufficientStorage):
+        manager.reserve(db, 200, owner_id)
+    assert store.resolve(db, keys["input"]) is not None
+
+
+def test_reserve_checks_free_space(
+    db: Session, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # Remote blobs take no local disk, so nothing is evicted for free space
+    backend = LocalBlobBackend(str(tmp_path / "blobs"))
+    monkeypatch.setattr(backend, "local_path", lambda name: None)
+    manager = StorageManager(
+        ArtifactStore(backend),
+        str(tmp_path),
+        quota=10**15,
+        user_quota=10**15,
+        min_free=10**18,
+    )
+    with pytest.raises(InsufficientStorage):
+        manager.reserve(db, 100)
+    manager.min_free = 0
+    manager.reserve(db, 100)
@@ -0,0 +1,85 @@
+import hashlib
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import anyio
+import pytest
+from starlette.datastructures import Headers
+
+from app.core import streaming_form
+from app.core.streaming_form import StreamedUpload, parse_form
+from app.core.uploads import UploadTooLarge, adopt_upload
+
+BOUNDARY = "test-boundary"
+HEADERS = Headers({"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"})
+
+
+def multipart_body(content: bytes) -> bytes:
+    return (
+        (
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="min_clicks"\r\n\r\n'
+            "10\r\n"
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="file"; filename="report.csv"\r\n'
+            "Content-Type: text/csv\r\n\r\n"
+        ).encode()
+        + content
+        + f"\r\n--{BOUNDARY}--\r\n".encode()
+    )
+
+
+async def in_chunks(body: bytes, size: int = 7) -> AsyncIterator[bytes]:
+    for start in range(0, len(body), size):
+        yield body[start : start + size]
+
+
+def test_parse_form_streams_files_to_disk(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(streaming_form, "CHUNK_SIZE", 4)
+    content = b"Campaign,Clicks\nc1,3\n"
+
+    async def main() -> None:
+        form = await parse_form(
+            HEADERS, in_chunks(multipart_body(content)), str(tmp_path), max_bytes=1000
+        )
+        assert form["min_clicks"] == "10"
+        upload = form["file"]
+        assert isinstance(upload, StreamedUpload)
+        assert upload.filename == "report.csv"
+        assert upload.size == len(content)
+        assert upload.digest.sha256 == hashlib.sha256(content).hexdigest()
+        assert await upload.read() == content
+
+        # Moved into place rather than copied; closing the upload then leaves it alone
+        ingested = adopt_upload(upload.path, upload.digest, str(tmp_path))
+        await form.close()
+        assert ingested.file_type == "csv"
+        assert ingested.lines == 2
+        assert ingested.path
+        assert list(tmp_path.iterdir()) == [Path(ingested.path)]
+
+    anyio.run(main)
+
+
+def test_parse_form_rejects_large_files_early(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(streaming_form, "CHUNK_SIZE", 4)
+    received = []
+    full_body = multipart_body(b"a,b\n" * 1000)
+
+    async def body() -> AsyncIterator[bytes]:
+        async for chunk in in_chunks(full_body):
+            received.append(chunk)
+            yield chunk
+
+    async def main() -> None:
+        with pytest.raises(UploadTooLarge):
+            await parse_form(HEADERS, body(), str(tmp_path), max_bytes=12)
+
+    anyio.run(main)
+    # Stopped reading the body shortly after the limit, and removed the partial file
+    assert sum(len(chunk) for chunk in received) < len(full_body) / 10
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,80 @@
+import hashlib
+import io
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from app.core import uploads
+from app.core.uploads import (
+    EmptyUpload,
+    UnsupportedFileType,
+    UploadTooLarge,
+    estimate_rows,
+    ingest_upload,
+    sniff_file_type,
+)
+
+
+def test_sniff_file_type() -> None:
+    assert sniff_file_type(b"PK\x03\x04rest-of-zip") == "xlsx"
+    assert sniff_file_type(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1\x00\x00") == "xls"
+    assert sniff_file_type(b"Campaign,Clicks\nc1,3\n") == "csv"
+    assert sniff_file_type(b"\x89PNG\r\n\x1a\n\x00\x00") is None
+    assert sniff_file_type(b"%PDF-1.7\n") is None
+
+
+def test_ingest_upload_streams_and_hashes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(uploads, "CHUNK_SIZE", 4)
+    content = b"Campaign,Clicks\nc1,3\n"
+    upload = ingest_upload(io.BytesIO(content), str(tmp_path), max_bytes=1000)
+    assert upload.size == len(content)
+    assert upload.sha256 == hashlib.sha256(content).hexdigest()
+    assert upload.file_type == "csv"
+    assert upload.path and upload.path.endswith(".csv")
+    assert Path(upload.path).read_bytes() == content
+
+
+def test_ingest_upload_rejects(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(uploads, "CHUNK_SIZE", 4)
+    with pytest.raises(UploadTooLarge):
+        ingest_upload(io.BytesIO(b"a,b\n" * 10), str(tmp_path), max_bytes=12)
+    with pytest.raises(UnsupportedFileType):
+        ingest_upload(io.BytesIO(b"\x7fELF\x02\x01"), str(tmp_path), max_bytes=100)
+    with pytest.raises(EmptyUpload):
+        ingest_upload(io.BytesIO(b""), str(tmp_path), max_bytes=100)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_ingest_upload_in_memory(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(uploads, "CHUNK_SIZE", 4)
+    content = b"Campaign,Clicks\nc1,3\n"
+    upload = ingest_upload(
+        io.BytesIO(content), str(tmp_path), max_bytes=1000, in_memory_max=len(content)
+    )
+    assert upload.path is None
+    assert upload.content == content
+    assert list(tmp_path.iterdir()) == []
+
+    # Past the in-memory limit the upload spills to disk, bytes read so far included
+    upload = ingest_upload(
+        io.BytesIO(content), str(tmp_path), max_bytes=1000, in_memory_max=10
+    )
+    assert upload.content is None
+    assert upload.path and Path(upload.path).read_bytes() == content
+
+
+def test_estimate_rows(tmp_path: Path) -> None:
+    csv = ingest_upload(io.BytesIO(b"a,b\n1,2\n3,4"), str(tmp_path), max_bytes=1000)
+    assert estimate_rows(csv) == 2
+
+    workbook = io.BytesIO()
+    pd.DataFrame({"clicks": range(250)}).to_excel(workbook, index=False)
+    xlsx = ingest_upload(
+        io.BytesIO(workbook.getvalue()), str(tmp_path), max_bytes=10**6
+    )
+    assert estimate_rows(xlsx) == 250
@@ -0,0 +1,148 @@
+import io
+import time
+from typing import Any
+
+import httpx
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def create_search_term_workbook() -> bytes:
+    """
+    Return an xlsx bulk export with the sheets the keyword miner reads.
+
+    Columns use the bulk sheet letters the miner expects (P = search term,
+    V = orders, Y = ACOS, ...).
+    """
+    search_report = pd.DataFrame(
+        {
+            "B": ["c1", "c1", "c1", "c2", "c2", "c2"],
+            "C": ["ag1", "ag1", "ag1", "ag2", "ag2", "ag2"],
+            "F": ["Camp 1", "Camp 1", "Camp 1", "Camp 2", "Camp 2", "Camp 2"],
+            "L": ["shoes", "shoes", "boots", "socks", "socks", "socks"],
+            "P": [
+                "red running shoes",
+                "cheap shoes",
+                "cheap shoes",
+                "b0abc12345",
+                "wool socks",
+                "acme socks",
+            ],
+            "R": [20, 8, 5, 15, 3, 30],
+            "T": [10.0, 4.0, 3.0, 12.0, 1.0, 20.0],
+            "U": [50.0, 0.0, 0.0, 0.0, 30.0, 100.0],
+            "V": [3, 0, 0, 0, 1, 2],
+            "Y": [20.0, 0.0, 0.0, 0.0, 3.3, 20.0],
+            "Z": [0.5, 0.4, 0.4, 0.6, 0.3, 0.7],
+        }
+    )
+    sponsored_products = pd.DataFrame(
+        {
+            "B": ["Campaign", "Product Ad", "Product Ad"],
+            "D": ["c1", "c1", "c2"],
+            "V": [None, "SKU1", "SKU2"],
+        }
+    )
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        search_report.to_excel(writer, sheet_name="SP Search Term Report", index=False)
+        sponsored_products.to_excel(
+            writer, sheet_name="Sponsored Products Campaigns", index=False
+        )
+        pd.DataFrame({"A": ["B0OWN00001"]}).to_excel(
+            writer, sheet_name="ASIN list", index=False
+        )
+    return buffer.getvalue()
+
+
+def create_bid_workbook(rows: int, seed: int = 0) -> bytes:
+    """Return an xlsx bid optimization input with `rows` keywords over 20 campaigns."""
+    rng = np.random.default_rng(seed)
+    clicks = rng.integers(0, 60, rows)
+    orders = rng.binomial(clicks, 0.08)
+    sales = orders * rng.uniform(15, 40, rows).round(2)
+    cpc = rng.uniform(0.3, 1.5, rows).round(2)
+    spend = (clicks * cpc).round(2)
+    acos = np.where(sales > 0, spend / np.where(sales > 0, sales, 1) * 100, 0).round(2)
+    bids = pd.DataFrame(
+        {
+            "Campaign Name": [f"Campaign {i % 20}" for i in range(rows)],
+            "Impressions": clicks * 40,
+            "Clicks": clicks,
+            "Spend": spend,
+            "Sales": sales,
+            "Orders": orders,
+            "Bid": (cpc * 1.2).round(2),
+            "ACOS": acos,
+            "Click-through Rate": 2.5,
+            "CPC": cpc,
+            "ASIN (Informational only)": "B0OWN00001",
+        }
+    )
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        bids.to_excel(writer, sheet_name="Keywords", index=False)
+        pd.DataFrame({"ASIN": ["B0OWN00001"], "AOV": [25.0]}).to_excel(
+            writer, sheet_name="ASIN AOV", index=False
+        )
+    return buffer.getvalue()
+
+
+def read_workbook(content: bytes) -> dict[str, pd.DataFrame]:
+    sheets: dict[str, pd.DataFrame] = pd.read_excel(
+        io.BytesIO(content), sheet_name=None
+    )
+    return sheets
+
+
+def wait_for_job(
+    client: TestClient,
+    job_id: str,
+    headers: dict[str, str] | None = None,
+    timeout: float = 30.0,
+) -> dict[str, Any]:
+    """Poll a PPC job until it succeeds, fails or is cancelled, returning its final status."""
+    deadline = time.monotonic() + timeout
+    while True:
+        r = client.get(f"{settings.API_V1_STR}/ppc/jobs/{job_id}", headers=headers)
+        assert r.status_code == 200
+        job: dict[str, Any] = r.json()
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return job
+        assert time.monotonic() < deadline, f"Job {job_id} still {job['status']}"
+        time.sleep(0.05)
+
+
+def wait_for_batch(
+    client: TestClient,
+    batch_id: str,
+    headers: dict[str, str],
+    timeout: float = 60.0,
+) -> dict[str, Any]:
+    """Poll a PPC batch until it (and any bundle) is done, returning its final status."""
+    deadline = time.monotonic() + timeout
+    while True:
+        r = client.get(f"{settings.API_V1_STR}/ppc/batches/{batch_id}", headers=headers)
+        assert r.status_code == 200
+        batch: dict[str, Any] = r.json()
+        if batch["status"] in ("succeeded", "failed", "partial"):
+            return batch
+        assert time.monotonic() < deadline, f"Batch {batch_id} still {batch['status']}"
+        time.sleep(0.05)
+
+
+def get_job_output(
+    client: TestClient, response: httpx.Response, headers: dict[str, str] | None = None
+) -> bytes:
+    """Wait for the job a processing endpoint queued and download its output."""
+    assert response.status_code == 202
+    job = wait_for_job(client, response.json()["job_id"], headers)
+    assert job["status"] == "succeeded", job["error"]
+    r = client.get(
+        f"{settings.API_V1_STR}/ppc/download/{job['download_id']}", headers=headers
+    )
+    assert r.status_code == 200
+    return r.content
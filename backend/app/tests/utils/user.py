@@ -27,6 +27,15 @@ def create_random_user(db: Session) -> User:
     return user
 
 
+def create_random_user_headers(*, client: TestClient, db: Session) -> dict[str, str]:
+    """Create a new user and return its authentication headers."""
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    crud.create_user(session=db, user_create=user_in)
+    return user_authentication_headers(client=client, email=email, password=password)
+
+
 def authentication_token_from_email(
     *, client: TestClient, email: str, db: Session
 ) -> dict[str, str]:
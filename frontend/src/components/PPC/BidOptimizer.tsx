@@ -13,6 +13,7 @@ import type React from "react"
 import { useState } from "react"
 import { FiDownload, FiInfo, FiUpload, FiZap, FiCalendar, FiSettings, FiSearch, FiUser } from "react-icons/fi"
 import { Button } from "../../components/ui/button"
+import { type PpcJobProgress, ppcAuthHeaders, waitForPpcJob } from "../../utils"
 
 /*
 type OptimizationResult = {
@@ -54,7 +55,8 @@ const BidOptimizer: React.FC = () => {
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [successMessage, setSuccessMessage] = useState<string | null>(null)
-  const [downloadId, setDownloadId] = useState<string | null>(null)
+  const [downloadUrl, setDownloadUrl] = useState<string | null>(null)
+  const [progress, setProgress] = useState<PpcJobProgress | null>(null)
 
   const handleFileChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     const selectedFile = e.target.files?.[0]
@@ -62,7 +64,7 @@ const BidOptimizer: React.FC = () => {
       setFile(selectedFile)
       setError(null)
       setSuccessMessage(null)
-      setDownloadId(null)
+      setDownloadUrl(null)
     }
   }
 
@@ -73,7 +75,7 @@ const BidOptimizer: React.FC = () => {
       setFile(droppedFile)
       setError(null)
       setSuccessMessage(null)
-      setDownloadId(null)
+      setDownloadUrl(null)
     }
   }
 
@@ -91,14 +93,14 @@ const BidOptimizer: React.FC = () => {
     if (!file) {
       setError("Please upload a file first")
       setSuccessMessage(null)
-      setDownloadId(null)
+      setDownloadUrl(null)
       return
     }
 
     setLoading(true)
     setError(null)
     setSuccessMessage(null)
-    setDownloadId(null)
+    setDownloadUrl(null)
 
     try {
       const formData = new FormData()
@@ -114,6 +116,7 @@ const BidOptimizer: React.FC = () => {
         body: formData,
         headers: {
           Accept: "application/json",
+          ...ppcAuthHeaders(),
         },
       })
 
@@ -147,20 +150,20 @@ const BidOptimizer: React.FC = () => {
       }
 
       const data = await response.json()
-      if (data.download_id) {
-        setDownloadId(data.download_id)
-        setSuccessMessage(data.message || "File processed successfully!")
-      } else {
-        throw new Error("Processing response missing download ID.")
+      if (!data.job_id) {
+        throw new Error("Processing response missing job ID.")
       }
+      setDownloadUrl(await waitForPpcJob(data.job_id, setProgress))
+      setSuccessMessage("File processed successfully!")
     } catch (err: any) {
       const message =
         err.message || "An unexpected error occurred during processing."
       setError(message)
-      setDownloadId(null)
+      setDownloadUrl(null)
       console.error("Optimization failed:", err)
     } finally {
       setLoading(false)
+      setProgress(null)
     }
   }
 
@@ -400,7 +403,15 @@ const BidOptimizer: React.FC = () => {
           <Box mt={4} textAlign="center" minHeight="24px">
             {loading && (
               <Text color="gray.600">
-                Processing your file... This may take a moment.
+                {progress
+                  ? `${progress.stage[0].toUpperCase()}${progress.stage.slice(1)}...` +
+                    (progress.rows_total
+                      ? ` ${progress.rows_processed} of ${progress.rows_total} rows`
+                      : "") +
+                    (progress.eta_seconds != null
+                      ? ` (about ${Math.ceil(progress.eta_seconds)}s left)`
+                      : "")
+                  : "Processing your file... This may take a moment."}
               </Text>
             )}
             {error && !loading && (
@@ -415,10 +426,10 @@ const BidOptimizer: React.FC = () => {
             )}
           </Box>
 
-          {downloadId && !error && !loading && (
+          {downloadUrl && !error && !loading && (
             <Box mt={6} textAlign="center">
               <ChakraLink
-                href={`${import.meta.env.VITE_API_BASE_URL}/api/v1/ppc/download/${downloadId}`}
+                href={`${import.meta.env.VITE_API_BASE_URL}${downloadUrl}`}
                 target="_blank"
                 _hover={{ textDecoration: "none" }}
               >
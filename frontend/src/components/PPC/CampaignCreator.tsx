@@ -13,6 +13,7 @@ import {
 import type React from "react"
 import { useState } from "react"
 import { FiDownload, FiInfo, FiPlus, FiTrash, FiX } from "react-icons/fi"
+import { ppcAuthHeaders, waitForPpcJob } from "../../utils"
 
 interface CampaignData {
   id: number
@@ -30,7 +31,7 @@ const CampaignCreator: React.FC = () => {
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [successMessage, setSuccessMessage] = useState<string | null>(null)
-  const [downloadId, setDownloadId] = useState<string | null>(null)
+  const [downloadUrl, setDownloadUrl] = useState<string | null>(null)
   
   const initialCampaign: CampaignData = {
     id: 1,
@@ -217,7 +218,7 @@ const CampaignCreator: React.FC = () => {
     setLoading(true);
     setError('');
     setSuccessMessage('');
-    setDownloadId('');
+    setDownloadUrl('');
 
     try {
       // Filter out campaigns that are not included
@@ -239,6 +240,7 @@ const CampaignCreator: React.FC = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...ppcAuthHeaders(),
         },
         body: JSON.stringify({
           campaigns: formattedCampaigns
@@ -251,8 +253,9 @@ const CampaignCreator: React.FC = () => {
       }
 
       const data = await response.json();
+      const downloadUrl = await waitForPpcJob(data.job_id);
       setSuccessMessage('Campaigns created successfully! Download your file.');
-      setDownloadId(data.download_id);
+      setDownloadUrl(downloadUrl);
     } catch (err) {
       setError(err instanceof Error ? err.message : 'An unknown error occurred');
     } finally {
@@ -666,10 +669,10 @@ const CampaignCreator: React.FC = () => {
         </Box>
       )}
       
-      {downloadId && !error && (
+      {downloadUrl && !error && (
         <Box textAlign="center">
           <ChakraLink
-            href={`${import.meta.env.VITE_API_BASE_URL}/api/v1/ppc/download/${downloadId}`}
+            href={`${import.meta.env.VITE_API_BASE_URL}${downloadUrl}`}
             target="_blank"
             _hover={{ textDecoration: "none" }}
           >
@@ -126,3 +126,145 @@ export async function testCorsConfiguration() {
     return { success: false, error, origin: window.location.origin };
   }
 }
+
+export interface PpcJobProgress {
+  stage: string
+  rows_processed: number
+  rows_total: number | null
+  rows_per_sec: number | null
+  eta_seconds: number | null
+}
+
+/**
+ * Authorization header for the signed-in user, if any. PPC endpoints also
+ * serve anonymous users, but record jobs sent with a token as that user's.
+ */
+export function ppcAuthHeaders(): Record<string, string> {
+  const token = localStorage.getItem("access_token")
+  return token ? { Authorization: `Bearer ${token}` } : {}
+}
+
+const PPC_JOB_FINISHED_STATUSES = ["succeeded", "failed", "cancelled"]
+
+function ppcJobResult(job: any): string {
+  if (job.status === "failed") {
+    throw new Error(job.error || "Processing failed.")
+  }
+  if (job.status === "cancelled") {
+    throw new Error("Processing was cancelled.")
+  }
+  return job.download_url
+}
+
+/**
+ * Asks the backend to stop a queued or running PPC job. Sent with keepalive,
+ * so it still goes out while the page is being closed.
+ */
+export function cancelPpcJob(jobId: string): Promise<Response> {
+  return fetch(`${import.meta.env.VITE_API_BASE_URL}/api/v1/ppc/jobs/${jobId}`, {
+    method: "DELETE",
+    headers: ppcAuthHeaders(),
+    keepalive: true,
+  })
+}
+
+/**
+ * Waits for a queued PPC processing job to finish, following its progress
+ * stream and falling back to polling when the stream is unavailable.
+ * Resolves with the download URL of the output file (relative to the API base
+ * URL; signed and expiring when the backend requires it), rejects with the job error.
+ * Leaving the page while waiting cancels the job.
+ */
+export async function waitForPpcJob(
+  jobId: string,
+  onProgress?: (progress: PpcJobProgress) => void,
+  intervalMs = 1000,
+): Promise<string> {
+  const cancelOnLeave = () => {
+    cancelPpcJob(jobId)
+  }
+  window.addEventListener("pagehide", cancelOnLeave)
+  try {
+    return await followPpcJob(jobId, onProgress, intervalMs)
+  } finally {
+    window.removeEventListener("pagehide", cancelOnLeave)
+  }
+}
+
+/**
+ * Follows a job's Server-Sent Events stream. Read with fetch rather than
+ * EventSource, which cannot send the Authorization header a signed-in
+ * user's jobs need. Resolves with the finished job, or null when the
+ * stream is unavailable or drops before the job finishes.
+ */
+async function readPpcJobEvents(
+  url: string,
+  onProgress: ((progress: PpcJobProgress) => void) | undefined,
+): Promise<any | null> {
+  try {
+    const response = await fetch(url, {
+      headers: { Accept: "text/event-stream", ...ppcAuthHeaders() },
+    })
+    if (!response.ok || !response.body) {
+      return null
+    }
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+    let buffered = ""
+    for (;;) {
+      const { value, done } = await reader.read()
+      if (done) {
+        return null
+      }
+      buffered += value
+      let end = buffered.indexOf("\n\n")
+      while (end >= 0) {
+        const message = buffered.slice(0, end)
+        buffered = buffered.slice(end + 2)
+        end = buffered.indexOf("\n\n")
+        // Keepalives are comments without an event
+        const event = /^event: (.*)$/m.exec(message)?.[1]
+        const data = /^data: (.*)$/m.exec(message)?.[1]
+        if (!event || data === undefined) {
+          continue
+        }
+        if (event === "progress") {
+          onProgress?.(JSON.parse(data))
+        } else if (PPC_JOB_FINISHED_STATUSES.includes(event)) {
+          await reader.cancel()
+          return JSON.parse(data)
+        }
+      }
+    }
+  } catch {
+    // Connection lost or refused: the caller polls instead
+    return null
+  }
+}
+
+async function followPpcJob(
+  jobId: string,
+  onProgress: ((progress: PpcJobProgress) => void) | undefined,
+  intervalMs: number,
+): Promise<string> {
+  const apiUrl = `${import.meta.env.VITE_API_BASE_URL}/api/v1/ppc/jobs/${jobId}`
+
+  const streamed = await readPpcJobEvents(`${apiUrl}/events`, onProgress)
+  if (streamed) {
+    return ppcJobResult(streamed)
+  }
+
+  for (;;) {
+    const response = await fetch(apiUrl, {
+      headers: { Accept: "application/json", ...ppcAuthHeaders() },
+    })
+    if (!response.ok) {
+      throw new Error(`Failed to check processing status (${response.status})`)
+    }
+
+    const job = await response.json()
+    if (PPC_JOB_FINISHED_STATUSES.includes(job.status)) {
+      return ppcJobResult(job)
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs))
+  }
+}
@@ -81,6 +81,17 @@ server {
         proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
         proxy_set_header X-Forwarded-Proto $scheme;
     }
+
+    # Processed PPC files, sent here by the backend with X-Accel-Redirect
+    # (PPC_DOWNLOAD_ACCEL_PREFIX=/protected-ppc-files/). /srv/ppc_files is
+    # the host directory docker-compose.yml mounts at the backend's
+    # TEMP_FILE_DIR; a containerized nginx needs it mounted at the same path.
+    location /protected-ppc-files/ {
+        internal;
+        alias /srv/ppc_files/;
+        etag off;
+        add_header ETag $upstream_http_etag;
+    }
 }
 EOL
 